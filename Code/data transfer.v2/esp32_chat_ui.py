@@ -23,6 +23,12 @@ os.makedirs(LOG_DIR, exist_ok=True)
 def now():
     return datetime.now().strftime("%H:%M:%S")
 
+# Incremental line framer shared with the tracker (device_codes/tag/uwb/framing.py):
+# lines come out as memoryview slices that are only valid until the next feed().
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "device_codes", "tag"))
+from uwb.framing import LineFramer
+
 class TcpClient:
     def __init__(self, host, port, on_message, on_status):
         self.host = host
@@ -56,19 +62,17 @@ class TcpClient:
                 return False
 
     def _recv_loop(self):
-        buf = b""
+        framer = LineFramer(strip=False)   # lines as sent, blank ones too
         while not self._stop.is_set():
             try:
                 chunk = self.sock.recv(4096)
                 if not chunk:
                     raise ConnectionError("Peer closed")
-                buf += chunk
-                while b"\n" in buf:
-                    line, buf = buf.split(b"\n", 1)
+                for line in framer.feed(chunk):
                     try:
-                        text = line.decode("utf-8", errors="replace")
+                        text = str(line, "utf-8", errors="replace")
                     except:
-                        text = line.decode("latin1", errors="replace")
+                        text = str(line, "latin1", errors="replace")
                     # strip CR
                     text = text.rstrip("\r")
                     self.on_message(text)
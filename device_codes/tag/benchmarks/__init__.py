@@ -0,0 +1,25 @@
+# benchmarks package
+# Host-side benchmarks; run from device_codes/tag:
+#   python -m benchmarks [--json results.json] [--baseline old.json]   # everything
+#   python -m benchmarks.decode | .ingest | .solve | .shards | .stream | .render  # one stage
+# Every stage module has run(quick=False) -> {name: (value, unit)}; units ending
+# in "/s" are rates (higher is better), anything else is a cost (lower is better).
+
+import time
+
+
+def best_rate(fn, items, repeat=3):
+    """Items per second of `for x in items: fn(x)`, best of `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for x in items:
+            fn(x)
+        best = min(best, time.perf_counter() - t0)
+    return len(items) / best
+
+
+def show(results):
+    for name, (value, unit) in results.items():
+        print(f"  {name:34s} {value:14,.3f} {unit}" if value < 100 else
+              f"  {name:34s} {value:14,.0f} {unit}")
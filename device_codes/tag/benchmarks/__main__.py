@@ -0,0 +1,91 @@
+# benchmarks/__main__.py
+# Run every stage benchmark and optionally write the results as JSON:
+#   python -m benchmarks --json bench-$(git rev-parse --short HEAD).json
+#   python -m benchmarks --quick --baseline bench-old.json    # exit 1 on a regression
+# Result file: {"meta": {...machine/versions...}, "results": {name: {"value", "unit"}}}
+
+import argparse, datetime, importlib, json, os, platform, subprocess, sys
+
+from . import show
+
+STAGES = ("decode", "ingest", "solve", "shards", "stream", "render")
+TOLERANCE = 0.10              # slower/worse than baseline by more than this = regression
+
+
+def _version(mod):
+    try:
+        return importlib.import_module(mod).__version__
+    except Exception:
+        return None
+
+
+def meta():
+    from uwb import decode
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {"time": datetime.datetime.now().isoformat(timespec="seconds"), "git": rev,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpus": os.cpu_count(),
+            "decode_backend": decode.BACKEND,
+            "numpy": _version("numpy"), "orjson": _version("orjson"), "msgspec": _version("msgspec")}
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Print value vs baseline for every shared result; returns the regressed names."""
+    bad = []
+    for name, (value, unit) in results.items():
+        old = baseline.get(name)
+        if old is None or not old["value"]: continue
+        ratio = value / old["value"]
+        higher = unit.endswith("/s")
+        worse = ratio < 1 - tolerance if higher else ratio > 1 + tolerance
+        # accuracy numbers near zero are noise, not regressions
+        if unit == "m" and abs(value - old["value"]) < 1e-3: worse = False
+        if worse: bad.append(name)
+        print(f"  {name:34s} {old['value']:12,.3f} -> {value:12,.3f} {unit:9s} "
+              f"x{ratio:.2f}{'  REGRESSION' if worse else ''}")
+    return bad
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks", description="Host-side benchmarks.")
+    ap.add_argument("stages", nargs="*", metavar="STAGE",
+                    help=f"subset of {', '.join(STAGES)} (default: all)")
+    ap.add_argument("--quick", action="store_true", help="smaller problem sizes")
+    ap.add_argument("--json", metavar="FILE", help="write results as JSON")
+    ap.add_argument("--baseline", metavar="FILE", help="compare against an earlier --json file")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = ap.parse_args(argv)
+    for stage in args.stages:
+        if stage not in STAGES: ap.error(f"unknown stage {stage!r}")
+
+    results = {}
+    for stage in args.stages or STAGES:
+        mod = importlib.import_module(f".{stage}", __package__)
+        print(f"[{stage}]", flush=True)
+        part = mod.run(quick=args.quick)
+        show(part)
+        results.update(part)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta(),
+                       "results": {k: {"value": v, "unit": u} for k, (v, u) in results.items()}},
+                      f, indent=1)
+        print(f"wrote {len(results)} results to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        print(f"[vs {args.baseline} ({base['meta'].get('git')})]")
+        bad = compare(results, base["results"], args.tolerance)
+        if bad:
+            print(f"{len(bad)} regressions beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
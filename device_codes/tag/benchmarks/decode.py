@@ -0,0 +1,71 @@
+# benchmarks/decode.py
+# Frames/sec of every available links decoder on tag-like JSON lines, next to
+# the original json.loads(line.decode(...)) + isinstance-per-link path.
+#   python -m benchmarks.decode [--frames 50000] [--links 4]
+
+import argparse, json
+
+from uwb import decode
+
+from . import best_rate
+
+
+def make_lines(n_frames, n_links):
+    lines = []
+    for i in range(n_frames):
+        links = ",".join(
+            '{"aid":"0x%04X","range":%.3f,"raw":%.3f,"rssi":%d,"fpPower":%d,"quality":%d}'
+            % (0x1781 + k, 1.0 + 0.001*i + k, 1.1 + 0.001*i + k, -78 - k, -82 - k, 120 + k)
+            for k in range(n_links))
+        lines.append(memoryview(('{"links":[' + links + ']}').encode()))
+    return lines
+
+
+def legacy(line):
+    """What server_thread()/tick() used to do per frame."""
+    try:
+        obj = json.loads(bytes(line).decode("utf-8", "ignore"))
+    except json.JSONDecodeError:
+        return None
+    if not (isinstance(obj, dict) and "links" in obj): return None
+    out = []
+    for l in obj["links"]:
+        aid = l.get("aid"); r = l.get("range")
+        if not isinstance(aid, str) or not isinstance(r, (int, float)): continue
+        out.append((aid, float(r)))
+    return out
+
+
+def rates(n_frames=50000, n_links=4):
+    """{decoder: frames/s}, the original path first."""
+    lines = make_lines(n_frames, n_links)
+    results = {"legacy": best_rate(legacy, lines)}
+    for name, fn in decode.BACKENDS.items():
+        assert len(fn(lines[0])) == n_links
+        results[name] = best_rate(fn, lines)
+    return results
+
+
+def run(quick=False):
+    n = 10000 if quick else 50000
+    out = {}
+    for n_links in (4, 8):
+        for name, fps in rates(n, n_links).items():
+            out[f"decode.{name}.{n_links}links"] = (fps, "frames/s")
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.decode")
+    ap.add_argument("--frames", type=int, default=50000)
+    ap.add_argument("--links", type=int, default=4)
+    args = ap.parse_args(argv)
+    results = rates(args.frames, args.links)
+    base = results["legacy"]
+    print(f"{args.frames} frames x {args.links} links (default backend: {decode.BACKEND})")
+    for name, fps in results.items():
+        print(f"  {name:8s} {fps:12,.0f} frames/s   x{fps/base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/ingest.py
+# Framing + decoding throughput on a byte stream cut into TCP-sized chunks, i.e.
+# what one tag connection costs the ingest server: LineFramer + decode_line for
+# JSON lines, BinaryFramer for binary frames. The original bytes-buffer framing
+# of server_thread() is measured alongside.
+#   python -m benchmarks.ingest [--frames 50000] [--links 4] [--chunk 1460]
+
+import argparse, time
+
+from uwb.binframe import BinaryFramer, encode_frame
+from uwb.decode import decode_line, Link
+from uwb.framing import LineFramer
+
+from . import show
+from .decode import make_lines, legacy
+
+
+def chunks(data, size):
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+
+def legacy_stream(parts):
+    """buf += data; split on b"\\n"; json.loads per line (the old server_thread())."""
+    buf = b""
+    n = 0
+    for data in parts:
+        buf += data
+        while b"\n" in buf:
+            line, buf = buf.split(b"\n", 1)
+            if legacy(line.strip()) is not None: n += 1
+    return n
+
+
+def _received(f, data):
+    # one data_received() call of uwb.ingest.TagProtocol
+    n = 0
+    for line in f.feed(data):
+        if decode_line(line) is not None: n += 1
+    return n
+
+
+def line_stream(parts):
+    f = LineFramer()
+    return sum(_received(f, data) for data in parts)
+
+
+def binary_stream(parts):
+    f = BinaryFramer()
+    return sum(len(list(f.feed(data))) for data in parts)
+
+
+def _rate(fn, parts, n_frames, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        assert fn(parts) == n_frames
+        best = min(best, time.perf_counter() - t0)
+    return n_frames / best
+
+
+def rates(n_frames=50000, n_links=4, chunk=1460):
+    text = b"".join(bytes(l) + b"\n" for l in make_lines(n_frames, n_links))
+    binary = b"".join(encode_frame([Link("0x%04X" % (0x1781 + k), 1.0 + k, 1.1 + k, -78, -82, 120)
+                                    for k in range(n_links)], i)
+                      for i in range(n_frames))
+    tp, bp = chunks(text, chunk), chunks(binary, chunk)
+    return {"legacy": _rate(legacy_stream, tp, n_frames),
+            "json": _rate(line_stream, tp, n_frames),
+            "binary": _rate(binary_stream, bp, n_frames)}
+
+
+def run(quick=False):
+    return {f"ingest.{name}.4links": (fps, "frames/s")
+            for name, fps in rates(10000 if quick else 50000).items()}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.ingest")
+    ap.add_argument("--frames", type=int, default=50000)
+    ap.add_argument("--links", type=int, default=4)
+    ap.add_argument("--chunk", type=int, default=1460, help="bytes per recv()")
+    args = ap.parse_args(argv)
+    print(f"{args.frames} frames x {args.links} links, {args.chunk}-byte chunks")
+    show({name: (fps, "frames/s") for name, fps in rates(args.frames, args.links, args.chunk).items()})
+
+
+if __name__ == "__main__":
+    main()
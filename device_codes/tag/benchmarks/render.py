@@ -0,0 +1,102 @@
+# benchmarks/render.py
+# Per-frame cost of the viewers' draw() and sidebar refresh, measured on the real
+# App classes. The engine is pointed at an ephemeral localhost port and never
+# receives data; the benchmark moves the tag and changes the ranges itself, then
+# flushes Tk (update_idletasks, which includes the canvas redraw) so the time
+# covers Tk's own work, not just the Python side.
+# Needs a display; on a headless machine use an offscreen X server:
+#   xvfb-run python -m benchmarks.render [--frames 300] [--anchors 3 8]
+# Without a display the render results are skipped.
+
+import argparse, math, time
+
+from . import show
+
+try:
+    import tkinter as tk
+except ImportError:
+    tk = None
+
+
+def _anchor_ring(n, radius=5.0):
+    return {"0x%04X" % (0x1781 + k): (radius + radius*math.cos(2*math.pi*k/n),
+                                      radius + radius*math.sin(2*math.pi*k/n))
+            for k in range(n)}
+
+
+def _app(module, anchors):
+    """Build module.App with `anchors` on a private port; its tick() never runs (no mainloop)."""
+    module.HOST, module.PORT = "127.0.0.1", 0
+    module.DEFAULT_ANCHORS = anchors
+    app = module.App()
+    app.update()                  # map the window so draw() sees the real canvas size
+    return app
+
+
+def _per_frame(app, frames, step, refresh):
+    """(ms per draw, ms per sidebar refresh), best of three passes over `frames` frames."""
+    draw_best = side_best = float("inf")
+    for _ in range(3):
+        t_draw = t_side = 0.0
+        for i in range(frames):
+            step(i)
+            t0 = time.perf_counter()
+            app.draw(); app.update_idletasks()
+            t1 = time.perf_counter()
+            refresh(); app.update_idletasks()
+            t_side += time.perf_counter() - t1
+            t_draw += t1 - t0
+        draw_best = min(draw_best, t_draw)
+        side_best = min(side_best, t_side)
+    return draw_best * 1e3 / frames, side_best * 1e3 / frames
+
+
+def _moving(app, tag_attr):
+    """Frame i: the tag on a circle, every anchor with its exact range."""
+    def step(i):
+        tx, ty = 5.0 + 3.0*math.cos(i/20), 5.0 + 3.0*math.sin(i/20)
+        setattr(app, tag_attr, (tx, ty))
+        for a in app.anchors.values():
+            a["r"] = math.hypot(tx - a["x"], ty - a["y"])
+    return step
+
+
+def run(quick=False, frames=None, n_anchors=(3, 8)):
+    frames = frames or (60 if quick else 300)
+    if tk is None: return {}
+    try:
+        tk.Tk().destroy()
+    except tk.TclError:
+        print("render: no display, skipped")
+        return {}
+    import uwb_display, uwb_position_display
+    out = {}
+    for na in n_anchors:
+        anchors = _anchor_ring(na)
+        for name, mod, tag_attr in (("display", uwb_display, "tag_s"),
+                                    ("position", uwb_position_display, "tag_smooth")):
+            app = _app(mod, anchors)
+            try:
+                if name == "display":
+                    refresh = lambda: (app._refresh_table(), app._refresh_dist_list())
+                else:
+                    refresh = app._refresh_sidebar
+                d, s = _per_frame(app, frames, _moving(app, tag_attr), refresh)
+            finally:
+                app.engine.stop()
+                app.destroy()
+            out[f"render.{name}.draw.{na}anchors"] = (d, "ms/frame")
+            out[f"render.{name}.sidebar.{na}anchors"] = (s, "ms/frame")
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.render")
+    ap.add_argument("--frames", type=int, default=300)
+    ap.add_argument("--anchors", type=int, nargs="+", default=[3, 8])
+    args = ap.parse_args(argv)
+    show(run(frames=args.frames, n_anchors=args.anchors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/shards.py
+# End-to-end solver throughput of the Engine (no network) with the solving on a
+# thread (shards 0) and on 1, 2, ... worker processes (uwb/shards.py), up to the
+# number of CPUs. Every tag reports once per round; a round is fed as fast as
+# possible and the next one starts when the engine is idle, so every tag is
+# solved exactly once per round. Rates are tag solves per second. Without
+# several cores the pool can only show its overhead.
+#   python -m benchmarks.shards [--tags 2000] [--rounds 5] [--shards 0 1 2 4]
+
+import argparse, math, os, random, time
+
+from uwb.decode import Link
+from uwb.engine import Engine
+from uwb.sim import grid_layout
+
+from . import show
+
+
+def make_rounds(n_tags, rounds, anchors, seed=0):
+    """[[(peer, links) per tag] per round], the tags standing still with noisy ranges."""
+    rng = random.Random(seed)
+    tags = {f"10.0.{i >> 8}.{i & 255}:{40000 + i}": (rng.uniform(1, 29), rng.uniform(1, 19))
+            for i in range(n_tags)}
+    return [[(peer, [Link(aid, math.hypot(x - a[0], y - a[1]) + rng.gauss(0, 0.05),
+                          None, -80, -82, 150)
+                     for aid, a in anchors.items() if math.hypot(x - a[0], y - a[1]) < 20])
+             for peer, (x, y) in tags.items()]
+            for _ in range(rounds)]
+
+
+def _rate(rounds, anchors, shards):
+    eng = Engine(anchors, listen=False, shards=shards, metrics=True).start()
+    try:
+        time.sleep(0.2)               # let the shard processes come up
+        t0 = time.perf_counter()
+        for frames in rounds:
+            for peer, links in frames:
+                eng.put(peer, links)
+            while not eng.idle():
+                time.sleep(0.0005)
+        dt = time.perf_counter() - t0
+        return eng.stats()["solves"] / dt
+    finally:
+        eng.stop()
+
+
+def run(quick=False, n_tags=None, rounds=None, shards=None):
+    n_tags = n_tags or (500 if quick else 2000)
+    rounds = rounds or (3 if quick else 5)
+    cpus = os.cpu_count() or 1
+    shards = shards or sorted({0, 1, 2} | {k for k in (4, 8) if k <= cpus})
+    anchors = grid_layout(4, 3, 10)
+    data = make_rounds(n_tags, rounds, anchors)
+    return {f"pool.shards{k}.{n_tags}tags": (_rate(data, anchors, k), "solves/s") for k in shards}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.shards")
+    ap.add_argument("--tags", type=int, default=2000)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--shards", type=int, nargs="+", help="pool sizes (default 0 1 2 [4 8] by CPUs)")
+    args = ap.parse_args(argv)
+    show(run(n_tags=args.tags, rounds=args.rounds, shards=args.shards))
+
+
+if __name__ == "__main__":
+    main()
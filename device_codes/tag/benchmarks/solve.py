@@ -0,0 +1,174 @@
+# benchmarks/solve.py
+# Solves/sec and accuracy of the position solvers across anchor counts and
+# range noise: uwb.solver.trilaterate (LM + Huber), trilat() from uwb_display.py
+# (plain Gauss-Newton) and, with NumPy, uwb.batch.trilaterate_batch per tag.
+# Also the distribution of LM iterations per solve for both starting points of
+# trilaterate() (init="centroid": previous fix or anchor centroid; "linear": the
+# closed-form fix), from a tracked tag's last fix (warm) and from nothing (cold).
+# The 3-D solvers (trilaterate3d, trilaterate3d_batch) run on the same layouts
+# with the anchors alternately at 2.8 m and 1.2 m and the tag at 0.5-1.5 m.
+# With one multipath range per tag (1-4 m long), the batch solver with and
+# without the uwb.ransac consensus stage in front of it.
+# Problems are seeded, so two runs solve exactly the same set.
+#   python -m benchmarks.solve [--problems 2000]
+
+import argparse, math, random, time
+
+from uwb.solver import trilaterate, trilaterate3d
+
+from . import show
+
+try:
+    from uwb.batch import trilaterate_batch, trilaterate3d_batch, pad_batch
+    from uwb.ransac import consensus_mask
+    import numpy as np
+except ImportError:
+    trilaterate_batch = trilaterate3d_batch = None
+
+try:
+    from uwb_display import trilat        # needs tkinter importable, not a display
+except ImportError:
+    trilat = None
+
+ANCHORS = (3, 4, 6, 8)
+NOISE   = (0.0, 0.05, 0.3)                # range sigma in meters
+SIZE    = 20.0                            # anchors on a circle in a SIZE x SIZE room
+OUTLIER_ANCHORS = (6, 8, 12)              # anchor counts of the one-outlier problems
+
+
+def problems(n, n_anchors, sigma, seed=0):
+    """[(points, ranges, truth, x0)] with x0 = truth + ~0.3 m (a tracked tag's last fix)."""
+    rng = random.Random(seed * 7919 + n_anchors * 31 + int(sigma * 1000))
+    c = SIZE / 2
+    pts = [(c + c*math.cos(2*math.pi*k/n_anchors), c + c*math.sin(2*math.pi*k/n_anchors))
+           for k in range(n_anchors)]
+    out = []
+    for _ in range(n):
+        tx, ty = rng.uniform(0.1*SIZE, 0.9*SIZE), rng.uniform(0.1*SIZE, 0.9*SIZE)
+        rs = [max(math.hypot(tx - x, ty - y) + rng.gauss(0.0, sigma), 0.0) for x, y in pts]
+        out.append((pts, rs, (tx, ty), (tx + rng.gauss(0, 0.3), ty + rng.gauss(0, 0.3))))
+    return out
+
+
+def problems3d(n, n_anchors, sigma, seed=0):
+    """problems() in 3-D: anchors at alternating heights, tags at waist level."""
+    rng = random.Random(seed * 7919 + n_anchors * 31 + int(sigma * 1000) + 1)
+    pts = [(x, y, 2.8 if k % 2 else 1.2)
+           for k, (x, y) in enumerate(problems(1, n_anchors, 0.0)[0][0])]
+    out = []
+    for _ in range(n):
+        t = (rng.uniform(0.1*SIZE, 0.9*SIZE), rng.uniform(0.1*SIZE, 0.9*SIZE), rng.uniform(0.5, 1.5))
+        rs = [max(math.dist(t, p) + rng.gauss(0.0, sigma), 0.0) for p in pts]
+        out.append((pts, rs, t, tuple(v + rng.gauss(0, 0.3) for v in t)))
+    return out
+
+
+def with_outlier(probs, seed=0):
+    """probs with one range per tag made 1-4 m too long (multipath)."""
+    rng = random.Random(seed + 17)
+    out = []
+    for p, r, t, x0 in probs:
+        r = list(r)
+        r[rng.randrange(len(r))] += rng.uniform(1.0, 4.0)
+        out.append((p, r, t, x0))
+    return out
+
+
+def _consensus_batch(P, R, X0):
+    return trilaterate_batch(P, R, X0, mask=consensus_mask(P, R, rng=np.random.default_rng(0)))
+
+
+def _measure(solve, probs, repeat=3):
+    """(solves/s, median error m) of solve(points, ranges, x0, y0) over probs."""
+    best, est = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        est = [solve(p, r, *x0) for p, r, _, x0 in probs]
+        best = min(best, time.perf_counter() - t0)
+    return len(probs) / best, _median_error(est, probs)
+
+
+def _measure_batch(probs, repeat=3, solve=None):
+    solve = solve or trilaterate_batch
+    P, R = pad_batch([p for p, _, _, _ in probs], [r for _, r, _, _ in probs])
+    X0 = [x0 for _, _, _, x0 in probs]
+    best, est = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        est = solve(P, R, X0)
+        best = min(best, time.perf_counter() - t0)
+    return len(probs) / best, _median_error(est.tolist(), probs)
+
+
+def _iterations(probs, init, warm):
+    its = []
+    for p, r, _, x0 in probs:
+        trilaterate(p, r, *(x0 if warm else (None, None)), stats=its, init=init)
+    return its
+
+
+def _distribution(its):
+    its = sorted(its)
+    n = len(its)
+    return {"p50": its[n // 2], "p90": its[int(n * 0.9)], "p99": its[int(n * 0.99)],
+            "max": its[-1], "mean": sum(its) / n}
+
+
+def _median_error(est, probs):
+    errs = sorted(math.dist(e, t) for e, (_, _, t, _) in zip(est, probs))
+    return errs[len(errs) // 2]
+
+
+def run(quick=False, n=None):
+    n = n or (500 if quick else 2000)
+    solvers = [("trilaterate", trilaterate)]
+    if trilat is not None: solvers.append(("trilat", trilat))
+    out = {}
+    its = {(init, warm): [] for init in ("centroid", "linear") for warm in (False, True)}
+    for na in ANCHORS:
+        for sigma in NOISE:
+            probs = problems(n, na, sigma)
+            for (init, warm), acc in its.items():
+                acc.extend(_iterations(probs, init, warm))
+            tag = f"{na}anchors.sigma{sigma:g}"
+            for name, fn in solvers:
+                rate, err = _measure(fn, probs)
+                out[f"solve.{name}.{tag}"] = (rate, "solves/s")
+                out[f"error.{name}.{tag}"] = (err, "m")
+            if trilaterate_batch is not None:
+                rate, err = _measure_batch(probs)
+                out[f"solve.batch.{tag}"] = (rate, "solves/s")
+                out[f"error.batch.{tag}"] = (err, "m")
+    for na in ANCHORS:
+        probs = problems3d(n, na, 0.05)
+        tag = f"{na}anchors.sigma0.05"
+        rate, err = _measure(trilaterate3d, probs)
+        out[f"solve.trilaterate3d.{tag}"] = (rate, "solves/s")
+        out[f"error.trilaterate3d.{tag}"] = (err, "m")
+        if trilaterate3d_batch is not None:
+            rate, err = _measure_batch(probs, solve=trilaterate3d_batch)
+            out[f"solve.batch3d.{tag}"] = (rate, "solves/s")
+            out[f"error.batch3d.{tag}"] = (err, "m")
+    if trilaterate_batch is not None:
+        for na in OUTLIER_ANCHORS:
+            probs = with_outlier(problems(n, na, 0.05))
+            tag = f"{na}anchors.outlier"
+            for name, fn in (("batch", trilaterate_batch), ("ransac", _consensus_batch)):
+                rate, err = _measure_batch(probs, solve=fn)
+                out[f"solve.{name}.{tag}"] = (rate, "solves/s")
+                out[f"error.{name}.{tag}"] = (err, "m")
+    for (init, warm), acc in its.items():
+        for k, v in _distribution(acc).items():
+            out[f"iters.{init}.{'warm' if warm else 'cold'}.{k}"] = (v, "iters")
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.solve")
+    ap.add_argument("--problems", type=int, default=2000, help="per anchor count / noise level")
+    args = ap.parse_args(argv)
+    show(run(n=args.problems))
+
+
+if __name__ == "__main__":
+    main()
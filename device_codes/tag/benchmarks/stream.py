@@ -0,0 +1,88 @@
+# benchmarks/stream.py
+# Position streaming server (uwb/stream.py) on localhost: what publish() costs
+# the solver thread per pass, and how many positions per second reach 1 and 4
+# JSON-lines subscribers while one more subscriber never reads (it must not slow
+# anything down). Snapshots of 100 updated tags are published back to back.
+#   python -m benchmarks.stream [--tags 2000] [--seconds 3]
+
+import argparse, socket, threading, time
+from types import SimpleNamespace
+
+from uwb.stream import StreamServer
+
+from . import show
+
+BATCH = 100                   # tags updated per published snapshot
+
+
+def _drain(sock, counts, i, stop):
+    sock.settimeout(0.2)
+    while not stop.is_set():
+        try:
+            data = sock.recv(1 << 20)
+        except socket.timeout:
+            continue
+        except OSError:
+            return
+        if not data: return
+        counts[i] += data.count(b"\n")
+
+
+def _run(n_tags, n_subs, seconds):
+    srv = StreamServer("127.0.0.1", 0, verbose=False).start()
+    stalled = socket.create_connection(("127.0.0.1", srv.port))
+    stalled.sendall(b"\n")
+    subs = [socket.create_connection(("127.0.0.1", srv.port)) for _ in range(n_subs)]
+    counts, stop = [0] * n_subs, threading.Event()
+    threads = [threading.Thread(target=_drain, args=(s, counts, i, stop), daemon=True)
+               for i, s in enumerate(subs)]
+    for s, t in zip(subs, threads):
+        s.sendall(b"\n")
+        t.start()
+    tags = [f"10.0.{i >> 8}.{i & 255}:{40000 + i}" for i in range(n_tags)]
+    smooth = {t: (float(i % 30), float(i % 20)) for i, t in enumerate(tags)}
+    cov = {t: (0.01, 0.0, 0.01) for t in tags}
+    anchors = {"0x1781": (0.0, 0.0, 0.0)}
+    time.sleep(0.3)               # connections accepted and started
+    try:
+        calls, cost = 0, 0.0
+        base = sum(counts)        # the initial full set is not counted
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < seconds:
+            for k in range(0, n_tags, BATCH):
+                snap = SimpleNamespace(smooth=smooth, cov=cov, stamp=time.monotonic(),
+                                       updated=tags[k:k + BATCH], anchors=anchors)
+                a = time.perf_counter()
+                srv.publish(snap)
+                cost += time.perf_counter() - a
+                calls += 1
+                time.sleep(0)     # let the loop and the readers run, as the solver does
+        dt = time.perf_counter() - t0
+        return cost / calls * 1e6, (sum(counts) - base) / dt
+    finally:
+        stop.set()
+        srv.stop()
+        for s in subs + [stalled]: s.close()
+
+
+def run(quick=False, n_tags=None, seconds=None):
+    n_tags = n_tags or 2000
+    seconds = seconds or (1.0 if quick else 3.0)
+    out = {}
+    for k in (1, 4):
+        us, rate = _run(n_tags, k, seconds)
+        out[f"stream.publish.{BATCH}tags.{k}subs"] = (us, "us/pass")
+        out[f"stream.fanout.{k}subs"] = (rate, "positions/s")
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.stream")
+    ap.add_argument("--tags", type=int, default=2000)
+    ap.add_argument("--seconds", type=float, default=3.0)
+    args = ap.parse_args(argv)
+    show(run(n_tags=args.tags, seconds=args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Lets `python -m pytest` / `pytest` from device_codes/tag import the uwb package.
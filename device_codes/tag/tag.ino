@@ -9,6 +9,9 @@
 #define WIFI_PASS "87654321"
 const char*   SERVER_IP    = "172.20.10.3";
 const uint16_t SERVER_PORT = 8080;
+// Report format: 0 = JSON lines, 1 = compact binary frames (layout in
+// uwb/binframe.py). The host detects the format per connection.
+#define FRAME_BINARY 0
 // ---------------------------------
 
 // --------- DW1000 pins -----------
@@ -131,6 +134,39 @@ void newRange(){
 void newDevice(DW1000Device* d){ Serial.print("New device 0x"); Serial.println(d->getShortAddress(),HEX); }
 void inactiveDevice(DW1000Device* d){ Serial.print("Inactive 0x"); Serial.println(d->getShortAddress(),HEX); }
 
+// ---------- binary report (FRAME_BINARY) ----------
+// header: magic 0xB5 | version 1 | payload length u16 | seq u16 | count u8
+// link:   aid u16 | range f32 | raw f32 | rssi i16 | fpPower i16 | quality u8
+// little-endian, like the ESP32 itself
+#define FRAME_HDR  7
+#define FRAME_LINK 15
+uint16_t frameSeq = 0;
+
+static void putU16(uint8_t* p, uint16_t v){ p[0]=(uint8_t)(v & 0xFF); p[1]=(uint8_t)(v >> 8); }
+static void putF32(uint8_t* p, float v){ memcpy(p, &v, 4); }
+
+void sendBinaryFrame(unsigned long now){
+  uint8_t frame[FRAME_HDR + FRAME_LINK*MAX_LINKS];
+  uint8_t n = 0;
+  uint8_t* p = frame + FRAME_HDR;
+  for(size_t i=0;i<linkCount;++i){
+    if(now - links[i].updatedMs > 2000) continue;
+    putU16(p,    links[i].shortAddr);
+    putF32(p+2,  links[i].range_corr);
+    putF32(p+6,  links[i].range_raw);
+    putU16(p+10, (uint16_t)(int16_t)links[i].rssi);
+    putU16(p+12, (uint16_t)(int16_t)links[i].fpPower);
+    p[14] = links[i].quality;
+    p += FRAME_LINK; ++n;
+  }
+  uint16_t len = (uint16_t)(FRAME_LINK*n);
+  frame[0] = 0xB5; frame[1] = 1;
+  putU16(frame+2, len);
+  putU16(frame+4, frameSeq++);
+  frame[6] = n;
+  client.write(frame, FRAME_HDR + len);
+}
+
 // -------------- setup/loop --------------
 unsigned long lastSend=0;
 
@@ -164,10 +200,13 @@ void loop(){
   connectWiFi();
   connectServer();
 
-  // Stream JSON every ~500 ms (includes corrected distances)
+  // Stream a report every ~500 ms (includes corrected distances)
   unsigned long now = millis();
   if(now - lastSend >= 500){
     lastSend = now;
+#if FRAME_BINARY
+    if(client.connected()) sendBinaryFrame(now);
+#else
     if(client.connected()){
       client.print("{\"links\":[");
       bool first=true;
@@ -188,5 +227,6 @@ void loop(){
       client.print("]}\n");
       client.flush();
     }
+#endif
   }
 }
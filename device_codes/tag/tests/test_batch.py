@@ -0,0 +1,38 @@
+import numpy as np
+
+from uwb.batch import pad_batch, trilaterate_batch
+from uwb.solver import trilaterate
+
+ANCHORS = [(0.0, 0.0), (10.0, 0.0), (10.0, 8.0), (0.0, 8.0), (5.0, 12.0)]
+
+
+def _case(rng, n):
+    pts = [ANCHORS[k] for k in rng.choice(len(ANCHORS), n, replace=False)]
+    x, y = rng.uniform(1, 9), rng.uniform(1, 7)
+    rs = [np.hypot(px - x, py - y) + rng.normal(0, 0.05) for px, py in pts]
+    return pts, rs
+
+
+def test_batch_matches_scalar():
+    rng = np.random.default_rng(1)
+    cases = [_case(rng, n) for n in (1, 2, 3, 4, 5) * 40]
+    x0 = rng.uniform(0, 10, (len(cases), 2))
+    P, R = pad_batch([c[0] for c in cases], [c[1] for c in cases])
+    out = trilaterate_batch(P, R, x0=x0)
+    for (pts, rs), (px, py), got in zip(cases, x0, out):
+        want = trilaterate(pts, rs, px, py)
+        assert np.allclose(got, want, atol=1e-3), (pts, rs, got, want)
+
+
+def test_batch_rows_without_anchors_are_nan():
+    P, R = pad_batch([ANCHORS[:3], []], [[5.0, 5.0, 5.0], []])
+    out = trilaterate_batch(P, R)
+    assert np.isfinite(out[0]).all()
+    assert np.isnan(out[1]).all()
+
+
+def test_batch_mask_drops_anchor():
+    pts, rs = ANCHORS[:4], [5.0, 7.0, 9.0, 30.0]
+    P, R = pad_batch([pts], [rs])
+    out = trilaterate_batch(P, R, mask=[[True, True, True, False]])
+    assert np.allclose(out[0], trilaterate(pts[:3], rs[:3]), atol=1e-3)
@@ -0,0 +1,50 @@
+import math
+
+from uwb.binframe import BinaryFramer, decode_frames, encode_frame
+from uwb.decode import Link
+
+LINKS = [Link("0x1781", 3.25, 3.5, -80, -85, 200), Link("0x1782", 7.5, None, None, None, None)]
+
+
+def _links(frame):
+    return [(l.aid, round(l.range, 3), l.raw and round(l.raw, 3), l.rssi, l.fp, l.quality)
+            for l in frame]
+
+
+def test_round_trip():
+    (seq, links), = decode_frames(encode_frame(LINKS, seq=7))[0]
+    assert seq == 7
+    assert _links(links) == [("0x1781", 3.25, 3.5, -80, -85, 200), ("0x1782", 7.5, 7.5, 0, 0, 0)]
+
+
+def test_split_feeds_and_partial_tail():
+    data = encode_frame(LINKS, 1) + encode_frame(LINKS[:1], 2)
+    f = BinaryFramer()
+    got = []
+    for i in range(len(data)):
+        got += [(seq, len(links)) for seq, links, _ in f.feed(data[i:i+1])]
+    assert got == [(1, 2), (2, 1)]
+    assert decode_frames(data + data[:5]) == (decode_frames(data)[0], len(data))
+
+
+def test_resync_after_garbage():
+    good = encode_frame(LINKS, 3)
+    f = BinaryFramer()
+    got = [seq for seq, _, _ in f.feed(b"\x00junk\xb5\x00" + good + b"\xff" + good)]
+    assert got == [3, 3]
+    assert f.frames == 2 and f.dropped > 0
+
+
+def test_newer_version_is_skipped_whole():
+    other = bytearray(encode_frame(LINKS, 4))
+    other[1] = 2
+    f = BinaryFramer()
+    assert [seq for seq, _, _ in f.feed(bytes(other) + encode_frame(LINKS, 5))] == [5]
+    assert f.dropped == 1
+
+
+def test_non_finite_range_is_dropped():
+    bad = [Link("0x1783", math.nan, 1.0, 0, 0, 0), Link("0x1784", math.inf, 1.0, 0, 0, 0),
+           Link("0x1785", 2.0, math.nan, 0, 0, 0)]
+    (_, links), = decode_frames(encode_frame(bad))[0]
+    assert [(l.aid, l.range, l.raw) for l in links] == [("0x1785", 2.0, None)]
@@ -0,0 +1,47 @@
+import math, os
+
+import pytest
+
+from uwb.board import BoardReader, PositionBoard
+from uwb.worker import Snapshot
+
+
+def _snap(smooth, updated, cov=None, anchors=None, stamp=1.0):
+    return Snapshot(1, stamp, anchors or {}, {}, {}, smooth, None, frozenset(updated), cov or {})
+
+
+@pytest.fixture
+def board():
+    b = PositionBoard(f"uwb_test_{os.getpid()}", slots=2, anchor_slots=4)
+    r = BoardReader(b.name)
+    yield b, r
+    r.close()
+    b.close()
+
+
+def test_publish_and_read(board):
+    b, r = board
+    assert r.passes == 0 and r.positions() == {}
+    b.publish(_snap({"t1": (1.0, 2.0)}, ["t1"], {"t1": (0.1, 0.0, 0.2)},
+                    {"0x1781": (0.0, 0.0, 0.1), "0x1782": (5.0, 0.0, 0.0, 2.5)}))
+    assert r.passes == 1
+    p = r.get("t1")
+    assert (p.x, p.y, p.cov, p.t) == (1.0, 2.0, (0.1, 0.0, 0.2), 1.0) and math.isnan(p.z)
+    a = r.anchors()
+    assert a["0x1782"] == (5.0, 0.0, 0.0, 2.5)
+    assert a["0x1781"][:3] == (0.0, 0.0, 0.1) and math.isnan(a["0x1781"][3])
+
+
+def test_expired_tag_leaves_and_full_board_counts(board):
+    b, r = board
+    b.publish(_snap({"t1": (1.0, 2.0), "t2": (3.0, 4.0, 1.5)}, ["t1", "t2"]))
+    assert set(r.positions()) == {"t1", "t2"} and r.get("t2").z == 1.5
+    b.publish(_snap({"t2": (3.0, 4.0, 1.5), "t3": (0.0, 0.0)}, ["t3"]))
+    assert set(r.positions()) == {"t2"} and r.get("t1") is None
+    assert b.full == 1 and r.get("t3") is None
+
+
+def test_second_writer_is_refused(board):
+    b, _ = board
+    with pytest.raises(RuntimeError):
+        PositionBoard(b.name)
@@ -0,0 +1,41 @@
+from uwb.framing import LineFramer
+
+
+def _feed(f, data):
+    return [bytes(l) for l in f.feed(data)]
+
+
+def test_lines_split_across_feeds():
+    f = LineFramer()
+    assert _feed(f, b'{"a":') == []
+    assert f.pending() == 5
+    assert _feed(f, b'1}\n{"b"') == [b'{"a":1}']
+    assert _feed(f, b':2}\r\n\n  \n') == [b'{"b":2}']
+    assert f.pending() == 0
+
+
+def test_strip_false_keeps_lines_as_sent():
+    f = LineFramer(strip=False)
+    assert _feed(f, b" x \r\n\ny\n") == [b" x \r", b"", b"y"]
+
+
+def test_over_long_line_is_dropped():
+    f = LineFramer(max_line=8)
+    assert _feed(f, b"0123456789abc\nok\n") == [b"ok"]
+    assert f.dropped == 1
+
+
+def test_over_long_line_split_across_feeds():
+    f = LineFramer(max_line=8)
+    assert _feed(f, b"0123456789") == []
+    assert f.pending() == 0                  # not buffered while it is skipped
+    assert _feed(f, b"more junk") == []
+    assert _feed(f, b"tail\nok\n") == [b"ok"]
+    assert f.dropped == 1
+
+
+def test_view_kept_across_feed():
+    f = LineFramer()
+    kept = next(f.feed(b"first\nsec"))
+    assert _feed(f, b"ond\n") == [b"second"]
+    assert bytes(kept) == b"first"
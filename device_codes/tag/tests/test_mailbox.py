@@ -0,0 +1,85 @@
+import queue, threading
+
+import pytest
+
+from uwb.decode import Link
+from uwb.mailbox import BLOCK, DROP_OLDEST, LATEST, Mailbox
+
+
+def _frame(peer, *ranges, at=0.0):
+    return (peer, [Link(aid, r, None, None, None, None) for aid, r in ranges], at)
+
+
+def _ranges(item):
+    return {l.aid: l.range for l in item[1]}
+
+
+def test_latest_merges_per_tag():
+    m = Mailbox(4, LATEST)
+    m.put(_frame("t1", ("a", 1.0), ("b", 2.0), at=1.0))
+    m.put(_frame("t2", ("a", 5.0)))
+    m.put(_frame("t1", ("a", 1.5), ("c", 3.0), at=2.0))
+    assert m.qsize() == 2 and m.overwritten == 1 and m.unfinished_tasks == 2
+    peer, _, at = item = m.get_nowait()
+    assert peer == "t1" and at == 1.0             # first frame's stamp is kept
+    assert _ranges(item) == {"a": 1.5, "b": 2.0, "c": 3.0}
+    assert m.get_nowait()[0] == "t2"
+    with pytest.raises(queue.Empty):
+        m.get_nowait()
+
+
+def test_latest_evicts_longest_waiting_tag():
+    m = Mailbox(2, LATEST)
+    for peer in ("t1", "t2", "t3"):
+        m.put(_frame(peer, ("a", 1.0)))
+    assert [m.get_nowait()[0] for _ in range(2)] == ["t2", "t3"]
+    assert m.counts()["mailbox_dropped"] == 1
+    assert m.unfinished_tasks == 2
+
+
+def test_drop_oldest_keeps_newest_frames():
+    m = Mailbox(2, DROP_OLDEST)
+    for r in (1.0, 2.0, 3.0):
+        m.put(_frame("t1", ("a", r)))
+    assert [_ranges(m.get_nowait())["a"] for _ in range(2)] == [2.0, 3.0]
+    assert m.dropped == 1 and m.overwritten == 0
+
+
+def test_block_waits_for_the_worker():
+    m = Mailbox(1, BLOCK)
+    m.put(_frame("t1", ("a", 1.0)))
+    t = threading.Thread(target=m.put, args=(_frame("t1", ("a", 2.0)),))
+    t.start()
+    t.join(0.2)
+    assert t.is_alive() and m.qsize() == 1
+    assert _ranges(m.get(timeout=1))["a"] == 1.0
+    t.join(1)
+    assert not t.is_alive()
+    assert _ranges(m.get(timeout=1))["a"] == 2.0
+    assert m.blocked == 1 and m.dropped == 0
+
+
+def test_close_releases_blocked_put():
+    m = Mailbox(1, BLOCK)
+    m.put(_frame("t1", ("a", 1.0)))
+    t = threading.Thread(target=m.put, args=(_frame("t1", ("a", 2.0)),))
+    t.start()
+    t.join(0.1)
+    m.close()
+    t.join(1)
+    assert not t.is_alive() and m.qsize() == 1
+
+
+def test_join_waits_for_task_done():
+    m = Mailbox(4, LATEST)
+    m.put(_frame("t1", ("a", 1.0)))
+    m.put(_frame("t1", ("a", 2.0)))
+    m.get_nowait()
+    m.task_done()
+    m.join()                                       # merged frames count as one task
+    assert m.unfinished_tasks == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Mailbox(4, "newest")
@@ -0,0 +1,50 @@
+import math
+
+import pytest
+
+from uwb.decode import Link
+from uwb.shards import Ring, _Inbox, _records, pack_frame
+
+
+@pytest.fixture
+def ring():
+    r = Ring(256)
+    yield r
+    r.close()
+
+
+def test_ring_fifo_and_wraparound(ring):
+    got = []
+    for i in range(40):                      # ~10 laps of the 256 byte ring
+        rec = bytes([i]) * (1 + i % 50)
+        assert ring.put(rec)
+        got.append(ring.get(0))
+    assert got == [bytes([i]) * (1 + i % 50) for i in range(40)]
+    assert ring.get(0) is None
+
+
+def test_ring_full_and_oversized(ring):
+    n = 0
+    while ring.put(b"x" * 60): n += 1
+    assert 0 < n < 5
+    assert ring.get(0) == b"x" * 60
+    assert ring.put(b"y" * 60)
+    with pytest.raises(ValueError):
+        ring.put(b"z" * 65)
+
+
+def test_records_respect_limit():
+    msgs = [b"a" * 30, b"b" * 30, b"c" * 30, b"d" * 100]
+    assert _records(msgs, 64) == [b"a" * 30 + b"b" * 30, b"c" * 30, b"d" * 100]
+
+
+def test_frame_round_trip_sanitizes_metrics():
+    ring = Ring(1024)
+    links = [Link("0x1781", 3.0, 3.1, -80.5, -84.0, 200),
+             Link("0x1782", 4.0, None, None, math.nan, True)]
+    assert ring.put(pack_frame("10.0.0.7:1234", links, at=5.0))
+    peer, got, _, _, at = _Inbox(ring, capture=True).get(timeout=1)
+    assert peer == "10.0.0.7:1234" and at == 5.0
+    assert [(l.aid, l.range, l.rssi, l.fp, l.quality) for l in got] == [
+        ("0x1781", 3.0, -80.5, -84.0, 200), ("0x1782", 4.0, 0, 0, 0)]
+    ring.close()
@@ -0,0 +1,2 @@
+# uwb package
+# Host-side building blocks shared by the UWB viewers (ingest, solving, ...).
@@ -0,0 +1,140 @@
+# uwb/__main__.py
+# Run the tracking engine without a GUI and print positions as JSON lines:
+#   python -m uwb --anchor 0x1781 0 0 --anchor 0x1782 3 0
+#   python -m uwb --anchors anchors.json      # {"0x1781": [0, 0], "0x1782": [3, 0, -0.1]}
+#   python -m uwb --anchors a.json --capture run.cap.gz       # record while tracking
+#   python -m uwb --anchors a.json --replay run.cap.gz --speed 0   # no network, max speed
+#   python -m uwb --anchors a.json --metrics       # latency stats on :9108/metrics (+ at exit)
+#   python -m uwb --anchors a3d.json --3d          # anchors [x, y, bias, z]; prints "z" too
+#   python -m uwb --anchors a.json --calibration cal.json   # from python -m uwb.calibrate
+#   python -m uwb --anchors a.json --shards 4      # solve on 4 processes (many tags)
+#   python -m uwb --anchors a.json --board         # positions in shared memory, see uwb/board.py
+#   python -m uwb --anchors a.json --stream        # positions to TCP/WebSocket subscribers on :8090
+
+import argparse, json, signal, sys, time
+
+from .board import BOARD_NAME
+from .engine import Engine, load_anchors
+from .ingest import HOST, PORT
+from .mailbox import MAILBOX_SIZE, POLICIES, LATEST
+from .metrics import METRICS_PORT, format_stats
+from .shards import SHARDS
+from .stream import StreamServer, STREAM_PORT
+from .spatial import MAX_ANCHORS
+from .track import TRACKERS, TRACKER
+from .worker import SOLVE_MS, SMOOTH_ALPHA, RANGE_TTL, LIVE, CAPTURE
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m uwb", description="Headless UWB tracker.")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--anchors", help="JSON file {aid: [x, y], [x, y, bias] or [x, y, bias, z]}")
+    ap.add_argument("--anchor", nargs="+", action="append", default=[], metavar="AID X Y [BIAS [Z]]",
+                    help="add one anchor (repeatable)")
+    ap.add_argument("--3d", dest="dims", action="store_const", const=3, default=2,
+                    help="solve x, y, z from the anchor heights")
+    ap.add_argument("--tag-height", type=float, metavar="Z",
+                    help="tags are at this height: solve x, y with the height difference removed")
+    ap.add_argument("--calibration", metavar="FILE",
+                    help="per-anchor bias/scale file written by python -m uwb.calibrate")
+    ap.add_argument("--solve-ms", type=float, default=SOLVE_MS)
+    ap.add_argument("--tracker", choices=TRACKERS, default=TRACKER,
+                    help="per-tag filter: ema, constant-velocity EKF on the ranges, particle filter")
+    ap.add_argument("--smooth", type=float, default=SMOOTH_ALPHA,
+                    help="EMA alpha with --tracker ema (1 = no smoothing)")
+    ap.add_argument("--raw", action="store_true", help="print solver output instead of smoothed")
+    ap.add_argument("--auto-add", action="store_true", help="accept unknown anchors at (0, 0)")
+    ap.add_argument("--no-link-weights", dest="link_weights", action="store_false",
+                    help="treat every range alike (ignore rssi/fpPower/quality, no NLOS rejection)")
+    ap.add_argument("--ransac", action="store_true",
+                    help="drop outlier ranges by consensus of anchor subsets before solving (NumPy)")
+    ap.add_argument("--shards", nargs="?", type=int, const=SHARDS, default=0, metavar="N",
+                    help=f"solve on N worker processes (default {SHARDS}; 0 = in this process)")
+    ap.add_argument("--board", nargs="?", const=BOARD_NAME, metavar="NAME",
+                    help=f"publish positions to the shared-memory block NAME (default {BOARD_NAME}) "
+                         "for local readers, e.g. python -m uwb.board")
+    ap.add_argument("--stream", nargs="?", type=int, const=STREAM_PORT, metavar="PORT",
+                    help=f"serve positions to TCP / WebSocket subscribers on PORT (default {STREAM_PORT})")
+    ap.add_argument("--stream-hz", type=float, default=0.0, metavar="HZ",
+                    help="subscribers' default per-tag rate cap (0 = every fix); they may set their own")
+    ap.add_argument("--stream-rate", type=float, default=0.0, metavar="N",
+                    help="subscribers' default cap on positions per second (0 = none)")
+    ap.add_argument("--max-anchors", type=int, default=MAX_ANCHORS,
+                    help="solve each tag with its K best anchors (0 = all)")
+    ap.add_argument("--ttl", type=float, default=RANGE_TTL,
+                    help="seconds until a range that is not refreshed expires (0 = never)")
+    ap.add_argument("--policy", choices=POLICIES, default=LATEST,
+                    help="what to do with frames when the solver falls behind (--replay: block)")
+    ap.add_argument("--mailbox", type=int, default=MAILBOX_SIZE,
+                    help="pending tags (latest) or frames (drop-oldest, block)")
+    ap.add_argument("--capture", metavar="FILE", help="record received frames (.gz = compressed)")
+    ap.add_argument("--replay", metavar="FILE",
+                    help="feed a capture instead of listening, on its recorded clock (same output every run)")
+    ap.add_argument("--speed", type=float, default=1.0, help="replay speed factor, 0 = max")
+    ap.add_argument("--metrics", nargs="?", type=int, const=METRICS_PORT, metavar="PORT",
+                    help=f"per-stage latency stats, served on 127.0.0.1:PORT (default {METRICS_PORT}, "
+                         "0 = no endpoint) and printed at exit")
+    args = ap.parse_args(argv)
+
+    anchors = load_anchors(args.anchors) if args.anchors else {}
+    for a in args.anchor:
+        if len(a) not in (3, 4, 5):
+            ap.error("--anchor takes AID X Y [BIAS [Z]]")
+        anchors[a[0]] = tuple(float(v) for v in a[1:])
+    if not anchors and not args.auto_add:
+        ap.error("no anchors: use --anchors FILE or --anchor AID X Y")
+
+    stream = None
+    if args.stream is not None:
+        stream = StreamServer(args.host, args.stream, args.stream_hz, args.stream_rate, verbose=False)
+    eng = Engine(anchors, args.host, args.port, listen=not args.replay, solve_ms=args.solve_ms,
+                 smooth_alpha=args.smooth, auto_add=args.auto_add, capture=args.capture,
+                 metrics=args.metrics is not None, metrics_port=args.metrics or None,
+                 mailbox_size=args.mailbox, policy=args.policy,
+                 max_anchors=args.max_anchors, range_ttl=args.ttl,
+                 tracker=args.tracker, dims=args.dims, tag_height=args.tag_height,
+                 calibration=args.calibration, link_weights=args.link_weights,
+                 ransac=args.ransac, shards=args.shards, board=args.board,
+                 stream=stream, clock=CAPTURE if args.replay else LIVE, verbose=False).start()
+
+    # SIGTERM unwinds like Ctrl-C so the capture file is closed properly (once: a
+    # second one, e.g. from `timeout` signalling the process group, must not cut
+    # the shutdown short)
+    def terminate(*_):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, terminate)
+    if eng.board: print(f"Position board: {eng.board.name}", file=sys.stderr)
+    if eng.stream: print(f"Streaming positions on {args.host}:{eng.stream.port}", file=sys.stderr)
+
+    def emit(snap):
+        pos = snap.tags if args.raw else snap.smooth
+        for peer in sorted(snap.updated):
+            p = pos[peer]
+            out = {"t": round(snap.stamp, 4), "tag": peer, "x": round(p[0], 4), "y": round(p[1], 4)}
+            if len(p) > 2: out["z"] = round(p[2], 4)
+            print(json.dumps(out), flush=True)
+        eng.displayed(snap)
+
+    try:
+        if args.replay:
+            eng.subscribe(emit)
+            n = eng.replay(args.replay, args.speed)
+            while not eng.idle():
+                time.sleep(0.01)
+            print(f"Replayed {n} frames from {args.replay}", file=sys.stderr)
+        else:
+            print(f"Listening on {args.host}:{args.port}", file=sys.stderr)
+            for snap in eng.snapshots():
+                emit(snap)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        eng.stop()
+        if eng.metrics is not None:
+            print(format_stats(eng.stats()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
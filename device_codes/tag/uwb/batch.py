@@ -0,0 +1,358 @@
+# uwb/batch.py
+# Vectorized (NumPy) trilateration for many tags per call.
+# Same algorithm and knobs as uwb.solver.trilaterate(); the LM/Huber iterations
+# run in lockstep over all tags with a per-tag "still iterating" mask.
+#
+# Layout: points (T, N, 2) anchor positions, ranges (T, N) corrected ranges.
+# A NaN range (or mask=False) marks an anchor the tag did not hear, so tags with
+# different anchor counts share one padded array. trilaterate3d_batch() is the
+# same for uwb.solver.trilaterate3d() with (T, N, 3) points. weights (T, N):
+# optional per-range weights, as in the scalar solvers.
+
+import numpy as np
+
+from .solver import (EPS_DI, LM_LAMBDA, LM_DECAY, LM_GROW, MAX_STEP, HUBER_DELTA, MAX_ITERS,
+                     COPLANAR)
+
+
+def pad_batch(points_list, ranges_list):
+    """Pack per-tag (points, ranges) lists into padded (T,N,2) / (T,N) arrays."""
+    T = len(points_list)
+    N = max((len(p) for p in points_list), default=0)
+    D = next((len(p[0]) for p in points_list if p), 2)
+    P = np.zeros((T, N, D))
+    R = np.full((T, N), np.nan)
+    for t, (pts, rs) in enumerate(zip(points_list, ranges_list)):
+        n = len(pts)
+        if n:
+            P[t, :n] = pts
+            R[t, :n] = rs
+    return P, R
+
+
+def _circle_pairs(P, R, M, X0):
+    """Exactly-2-anchor case for every row (rows must have M.sum(1) == 2)."""
+    order = np.argsort(~M, axis=1, kind="stable")
+    rows = np.arange(len(P))
+    p1, p2 = P[rows, order[:, 0]], P[rows, order[:, 1]]
+    r1, r2 = R[rows, order[:, 0]], R[rows, order[:, 1]]
+
+    dv = p2 - p1
+    d = np.hypot(dv[:, 0], dv[:, 1]) + 1e-12
+    e = dv / d[:, None]
+    a = (r1*r1 - r2*r2 + d*d) / (2*d)
+    pp = p1 + a[:, None]*e                     # closest baseline point
+    nrm = np.stack((-e[:, 1], e[:, 0]), axis=1)  # left-hand normal
+
+    h2 = r1*r1 - a*a
+    h = np.sqrt(np.maximum(h2, 0.0))
+    c1 = pp + h[:, None]*nrm
+    c2 = pp - h[:, None]*nrm
+    has_prev = np.isfinite(X0).all(axis=1)
+    x0 = np.where(has_prev[:, None], X0, 0.0)
+    d1 = ((c1 - x0)**2).sum(axis=1)
+    d2 = ((c2 - x0)**2).sum(axis=1)
+    inter = np.where((has_prev & (d2 < d1))[:, None], c2, c1)
+
+    # disjoint circles: keep the previous signed offset from the baseline point
+    off = np.where(has_prev, ((x0 - pp)*nrm).sum(axis=1), 0.0)
+    apart = pp + off[:, None]*nrm
+    return np.where((h2 > 0)[:, None], inter, apart)
+
+
+def _huber_cost(rr):
+    a = np.abs(rr)
+    return np.where(a <= HUBER_DELTA, rr*rr,
+                    HUBER_DELTA*HUBER_DELTA + 2*HUBER_DELTA*(a - HUBER_DELTA))
+
+
+def _weights(M, weights):
+    """(T,N) weights, 0 outside the mask."""
+    if weights is None: return M.astype(float)
+    return np.where(M, np.nan_to_num(np.asarray(weights, float)), 0.0)
+
+
+def _linear_fix(P, R, M, W):
+    """linear_fix() per row: (T,2) closed-form fixes, NaN where the anchors are collinear."""
+    n = W.sum(axis=1)
+    Pz = np.where(M[..., None], P, 0.0)
+    C = np.where(M, np.nan_to_num(R)**2 - (Pz*Pz).sum(axis=2), 0.0)
+    mp = (Pz * W[..., None]).sum(axis=1) / n[:, None]
+    mc = (C * W).sum(axis=1) / n
+    A = (Pz - mp[:, None]) * M[..., None]
+    B = (mc[:, None] - C) / 2 * W
+    s11, s12, s22 = (W*A[..., 0]**2).sum(1), (W*A[..., 0]*A[..., 1]).sum(1), (W*A[..., 1]**2).sum(1)
+    t1, t2 = (A[..., 0]*B).sum(1), (A[..., 1]*B).sum(1)
+    det = s11*s22 - s12*s12
+    ok = det > 1e-9 * (s11 + s22)**2
+    det = np.where(ok, det, 1.0)
+    X = np.stack([(s22*t1 - s12*t2)/det, (s11*t2 - s12*t1)/det], axis=1)
+    X[~ok] = np.nan
+    return X
+
+
+def _cost_at(P, R, M, X, W):
+    rr = np.hypot(X[:, None, 0] - P[..., 0], X[:, None, 1] - P[..., 1]) - np.nan_to_num(R)
+    return np.where(M, W * _huber_cost(rr), 0.0).sum(axis=1)
+
+
+def _lm(P, R, M, W, X, iters, lam, its=None):
+    """
+    LM + Huber for rows with >= 3 anchors; X (T,2) is the start, updated in place.
+    W (T,N): range weights, 0 outside the mask.
+    its: optional (T,) int array, incremented for every iteration a row takes part in.
+    """
+    T = len(P)
+    R = np.where(M, R, 0.0)
+    lam = np.full(T, float(lam))
+    last = np.full(T, np.inf)
+    active = np.ones(T, bool)
+
+    for _ in range(iters):
+        a = np.flatnonzero(active)
+        if not a.size: break
+        Pa, Ra, Wa, Xa = P[a], R[a], W[a], X[a]
+        if its is not None: its[a] += 1
+
+        D = Xa[:, None, :] - Pa
+        di = np.hypot(D[..., 0], D[..., 1])
+        small = di < EPS_DI
+        di = np.where(small, EPS_DI, di)
+        gx = np.where(small, 1.0, D[..., 0]/di)
+        gy = np.where(small, 0.0, D[..., 1]/di)
+        r = di - Ra
+        ar = np.abs(r)
+        w = Wa * np.where(ar <= HUBER_DELTA, 1.0, HUBER_DELTA/np.maximum(ar, HUBER_DELTA))
+
+        j11 = (w*gx*gx).sum(1); j12 = (w*gx*gy).sum(1); j22 = (w*gy*gy).sum(1)
+        b1 = (w*gx*r).sum(1);   b2 = (w*gy*r).sum(1)
+
+        la = lam[a]
+        j11d, j22d = j11 + la, j22 + la
+        det = j11d*j22d - j12*j12
+        sing = np.abs(det) < 1e-12
+        det = np.where(sing, 1.0, det)
+
+        dx = -( j22d*b1 - j12*b2)/det
+        dy = -(-j12*b1 + j11d*b2)/det
+        step = np.hypot(dx, dy)
+        s = np.where(step > MAX_STEP, MAX_STEP/np.maximum(step, MAX_STEP), 1.0)
+        dx *= s; dy *= s
+        Xn = Xa + np.stack((dx, dy), axis=1)
+
+        rr = np.hypot(Xn[:, None, 0] - Pa[..., 0], Xn[:, None, 1] - Pa[..., 1]) - Ra
+        cost = (Wa * _huber_cost(rr)).sum(1)
+
+        accept = ~sing & (cost <= last[a])
+        reject = ~sing & ~accept
+        acc = a[accept]
+        X[acc] = Xn[accept]
+        last[acc] = cost[accept]
+        lam[acc] = np.maximum(la[accept]*LM_DECAY, 1e-6)
+        lam[a[reject]] = np.minimum(la[reject]*LM_GROW, 1e6)
+        lam[a[sing]] = la[sing]*LM_GROW
+        active[acc[(dx*dx + dy*dy)[accept] < 1e-6]] = False
+
+    return X
+
+
+def trilaterate_batch(points, ranges, x0=None, mask=None,
+                      iters=MAX_ITERS, lam=LM_LAMBDA, stats=None, init="linear", weights=None):
+    """
+    Solve T tags at once. points (T,N,2), ranges (T,N), x0 (T,2) previous
+    estimates (NaN rows = none), mask (T,N) optional extra anchor selection.
+    Returns a (T,2) array; rows of tags without any anchor are NaN.
+    Matches trilaterate() per row (1 anchor, 2-anchor circles, 3+ LM/Huber).
+    stats: optional list, extended with the LM iteration count of every 3+ anchor row.
+    init: start of the 3+ anchor rows, as in trilaterate().
+    weights: optional (T,N) per-range weights (3+ anchor rows).
+    """
+    P = np.asarray(points, float)
+    R = np.asarray(ranges, float)
+    T = R.shape[0]
+    M = np.isfinite(R)
+    if mask is not None:
+        M &= np.asarray(mask, bool)
+    X0 = np.full((T, 2), np.nan) if x0 is None else np.array(x0, float).reshape(T, 2)
+    W = _weights(M, weights)
+
+    n = M.sum(axis=1)
+    out = np.full((T, 2), np.nan)
+
+    one = np.flatnonzero(n == 1)
+    if one.size:
+        k = M[one].argmax(axis=1)
+        out[one] = P[one, k]
+        out[one, 0] += np.maximum(R[one, k], 0.0)
+
+    two = np.flatnonzero(n == 2)
+    if two.size:
+        out[two] = _circle_pairs(P[two], R[two], M[two], X0[two])
+
+    many = np.flatnonzero(n >= 3)
+    if many.size:
+        Pm, Mm, Wm = P[many], M[many], W[many]
+        cent = (Pm * Mm[..., None]).sum(axis=1) / n[many][:, None]
+        Rm, start = R[many], X0[many]
+        have = np.isfinite(start).all(axis=1)
+        if init == "linear":
+            lin = _linear_fix(Pm, Rm, Mm, Wm)
+            ok = np.isfinite(lin).all(axis=1)
+            better = ok & ~have
+            both = np.flatnonzero(ok & have)
+            if both.size:
+                b = (Pm[both], Rm[both], Mm[both])
+                better[both] = _cost_at(*b, lin[both], Wm[both]) < _cost_at(*b, start[both], Wm[both])
+            start = np.where(better[:, None], lin, start)
+            have |= better
+        start = np.where(have[:, None], start, cent)
+        its = None if stats is None else np.zeros(many.size, int)
+        out[many] = _lm(Pm, Rm, Mm, Wm, start.copy(), iters, lam, its)
+        if its is not None: stats.extend(its.tolist())
+
+    return out
+
+
+# ----- 3-D: points (T, N, 3) -----
+def _solve3(a11, a12, a13, a22, a23, a33, b1, b2, b3):
+    """solver._solve3() per row; singular rows get a zero step and sing=True."""
+    c11 = a22*a33 - a23*a23; c12 = a13*a23 - a12*a33; c13 = a12*a23 - a13*a22
+    det = a11*c11 + a12*c12 + a13*c13
+    sing = np.abs(det) < 1e-12
+    det = np.where(sing, 1.0, det)
+    c22 = a11*a33 - a13*a13; c23 = a12*a13 - a11*a23; c33 = a11*a22 - a12*a12
+    X = np.stack(((c11*b1 + c12*b2 + c13*b3)/det,
+                  (c12*b1 + c22*b2 + c23*b3)/det,
+                  (c13*b1 + c23*b2 + c33*b3)/det), axis=1)
+    X[sing] = 0.0
+    return X, sing
+
+
+def _linear_fix3d(P, R, M, W, Z0):
+    """solver.linear_fix3d() per row; NaN rows where it returns None."""
+    n = W.sum(axis=1)
+    Pz = np.where(M[..., None], P, 0.0)
+    C = np.where(M, np.nan_to_num(R)**2 - (Pz*Pz).sum(axis=2), 0.0)
+    mp = (Pz * W[..., None]).sum(axis=1) / n[:, None]
+    mc = (C * W).sum(axis=1) / n
+    A = (Pz - mp[:, None]) * M[..., None]
+    B = (mc[:, None] - C) / 2 * W
+    S = np.einsum("tni,tnj->tij", A * W[..., None], A)
+    t = np.einsum("tni,tn->ti", A, B)
+    s11, s12, s13, s22, s23, s33 = S[:, 0, 0], S[:, 0, 1], S[:, 0, 2], S[:, 1, 1], S[:, 1, 2], S[:, 2, 2]
+
+    X, _ = _solve3(s11, s12, s13, s22, s23, s33, t[:, 0], t[:, 1], t[:, 2])
+    det3 = s11*(s22*s33 - s23*s23) + s12*(s13*s23 - s12*s33) + s13*(s12*s23 - s13*s22)
+    flat = (s33 <= COPLANAR * (s11 + s22)) | (det3 <= 1e-6 * (s11 + s22 + s33)**3)
+    det = s11*s22 - s12*s12
+    ok2 = det > 1e-9 * (s11 + s22)**2
+    det = np.where(ok2, det, 1.0)
+    x = (s22*t[:, 0] - s12*t[:, 1])/det
+    y = (s11*t[:, 1] - s12*t[:, 0])/det
+    h2 = (W * np.where(M, np.nan_to_num(R)**2 - (x[:, None] - P[..., 0])**2
+                       - (y[:, None] - P[..., 1])**2, 0.0)).sum(axis=1) / n
+    dz = np.sqrt(np.maximum(h2, 0.0))
+    up = np.isfinite(Z0) & (Z0 > mp[:, 2])
+    z = np.where(up, mp[:, 2] + dz, mp[:, 2] - dz)
+    X = np.where(flat[:, None], np.stack((x, y, z), axis=1), X)
+    X[flat & ~ok2] = np.nan
+    return X
+
+
+def _cost3_at(P, R, M, X, W):
+    rr = np.linalg.norm(X[:, None, :] - P, axis=2) - np.nan_to_num(R)
+    return np.where(M, W * _huber_cost(rr), 0.0).sum(axis=1)
+
+
+def _lm3(P, R, M, W, X, iters, lam, its=None):
+    """_lm() in 3-D: X (T,3) start, updated in place."""
+    T = len(P)
+    R = np.where(M, R, 0.0)
+    lam = np.full(T, float(lam))
+    last = np.full(T, np.inf)
+    active = np.ones(T, bool)
+
+    for _ in range(iters):
+        a = np.flatnonzero(active)
+        if not a.size: break
+        Pa, Ra, Wa, Xa = P[a], R[a], W[a], X[a]
+        if its is not None: its[a] += 1
+
+        ex = Xa[:, 0, None] - Pa[..., 0]
+        ey = Xa[:, 1, None] - Pa[..., 1]
+        ez = Xa[:, 2, None] - Pa[..., 2]
+        di = np.sqrt(ex*ex + ey*ey + ez*ez)
+        small = di < EPS_DI
+        di = np.where(small, EPS_DI, di)
+        gx = np.where(small, 1.0, ex/di)
+        gy = np.where(small, 0.0, ey/di)
+        gz = np.where(small, 0.0, ez/di)
+        r = di - Ra
+        ar = np.abs(r)
+        w = Wa * np.where(ar <= HUBER_DELTA, 1.0, HUBER_DELTA/np.maximum(ar, HUBER_DELTA))
+
+        la = lam[a]
+        step, sing = _solve3((w*gx*gx).sum(1) + la, (w*gx*gy).sum(1), (w*gx*gz).sum(1),
+                             (w*gy*gy).sum(1) + la, (w*gy*gz).sum(1), (w*gz*gz).sum(1) + la,
+                             -(w*gx*r).sum(1), -(w*gy*r).sum(1), -(w*gz*r).sum(1))
+        s = np.sqrt((step*step).sum(axis=1))
+        clamp = np.where(s > MAX_STEP, MAX_STEP/np.maximum(s, MAX_STEP), 1.0)
+        step *= clamp[:, None]
+        s *= clamp
+        Xn = Xa + step
+
+        ex = Xn[:, 0, None] - Pa[..., 0]
+        ey = Xn[:, 1, None] - Pa[..., 1]
+        ez = Xn[:, 2, None] - Pa[..., 2]
+        rr = np.sqrt(ex*ex + ey*ey + ez*ez) - Ra
+        cost = (Wa * _huber_cost(rr)).sum(1)
+
+        accept = ~sing & (cost <= last[a])
+        reject = ~sing & ~accept
+        acc = a[accept]
+        X[acc] = Xn[accept]
+        last[acc] = cost[accept]
+        lam[acc] = np.maximum(la[accept]*LM_DECAY, 1e-6)
+        lam[a[reject]] = np.minimum(la[reject]*LM_GROW, 1e6)
+        lam[a[sing]] = la[sing]*LM_GROW
+        active[acc[(s*s)[accept] < 1e-6]] = False
+
+    return X
+
+
+def trilaterate3d_batch(points, ranges, x0=None, mask=None,
+                        iters=MAX_ITERS, lam=LM_LAMBDA, stats=None, weights=None):
+    """
+    trilaterate3d() for T tags at once: points (T,N,3), ranges (T,N), x0 (T,3)
+    (NaN rows = none). Rows with fewer than 3 anchors are NaN.
+    """
+    P = np.asarray(points, float)
+    R = np.asarray(ranges, float)
+    T = R.shape[0]
+    M = np.isfinite(R)
+    if mask is not None:
+        M &= np.asarray(mask, bool)
+    X0 = np.full((T, 3), np.nan) if x0 is None else np.array(x0, float).reshape(T, 3)
+    W = _weights(M, weights)
+    n = M.sum(axis=1)
+    out = np.full((T, 3), np.nan)
+
+    many = np.flatnonzero(n >= 3)
+    if many.size:
+        Pm, Rm, Mm, Wm, start = P[many], R[many], M[many], W[many], X0[many]
+        have = np.isfinite(start).all(axis=1)
+        lin = _linear_fix3d(Pm, Rm, Mm, Wm, start[:, 2])
+        cent = (np.where(Mm[..., None], Pm, 0.0)).sum(axis=1) / n[many][:, None]
+        ok = np.isfinite(lin).all(axis=1)
+        lin = np.where(ok[:, None], lin, cent)
+        better = ~have
+        both = np.flatnonzero(have & ok)
+        if both.size:
+            b = (Pm[both], Rm[both], Mm[both])
+            better[both] = _cost3_at(*b, lin[both], Wm[both]) < _cost3_at(*b, start[both], Wm[both])
+        start = np.where(better[:, None], lin, start)
+        its = None if stats is None else np.zeros(many.size, int)
+        out[many] = _lm3(Pm, Rm, Mm, Wm, start.copy(), iters, lam, its)
+        if its is not None: stats.extend(its.tolist())
+
+    return out
@@ -0,0 +1,105 @@
+# uwb/binframe.py
+# Compact binary range report (tag -> host), version 1. All fields little-endian.
+#
+#   header (7 bytes)  magic u8 = 0xB5 | version u8 = 1 | length u16 (payload bytes)
+#                     | seq u16 (wraps, lets the host count lost frames) | count u8
+#   link (15 bytes)   aid u16 | range f32 (corrected, m) | raw f32 (m)
+#                     | rssi i16 (dBm) | fpPower i16 (dBm) | quality u8
+#
+# Ranges are f32, so a frame can carry NaN/inf: such links are dropped on decode.
+# 7 + 15*n bytes versus roughly 90 bytes per link for the JSON line. `length`
+# lets a decoder skip frames of a newer version it does not understand.
+# Must match the FRAME_BINARY writer in tag.ino.
+
+import struct
+
+from .decode import Link
+
+MAGIC   = 0xB5
+VERSION = 1
+
+HEADER = struct.Struct("<BBHHB")
+LINK   = struct.Struct("<HffhhB")
+MAX_LINKS = 255
+MAX_PAYLOAD = 4096            # larger lengths are treated as corruption, not as a frame
+
+AID_FMT = "0x%04X"            # same spelling as the JSON "aid" field
+
+
+def encode_frame(links, seq=0):
+    """Pack Link records (aid like "0x1781"); missing metrics are sent as 0 / raw = range."""
+    links = links[:MAX_LINKS]
+    body = b"".join(LINK.pack(int(l.aid, 16), l.range, l.range if l.raw is None else l.raw,
+                              int(l.rssi or 0), int(l.fp or 0), int(l.quality or 0))
+                    for l in links)
+    return HEADER.pack(MAGIC, VERSION, len(body), seq & 0xFFFF, len(links)) + body
+
+
+def unpack_links(payload):
+    """
+    Decode one frame's link records (bytes or memoryview) with a single iter_unpack.
+    As in uwb/decode.py, a link whose range is NaN/inf is skipped and such a raw is None.
+    """
+    return [Link(AID_FMT % aid, rng, raw if raw - raw == 0.0 else None, rssi, fp, q)
+            for aid, rng, raw, rssi, fp, q in LINK.iter_unpack(payload) if rng - rng == 0.0]
+
+
+class BinaryFramer:
+    """
+    Incremental decoder for a stream of binary frames, mirroring LineFramer:
+    feed(data) yields (seq, links, raw) for every complete frame, raw being a
+    memoryview of the whole frame valid until the next feed(). Garbage or frames
+    with an unknown version are skipped (counted in self.dropped) and the
+    decoder resynchronizes on the next magic byte.
+    """
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.start = 0
+        self.dropped = 0
+        self.frames = 0
+
+    def feed(self, data):
+        try:
+            if self.start: del self.buf[:self.start]
+            self.buf += data
+        except BufferError:       # a raw view is still referenced: start a new buffer
+            self.buf = self.buf[self.start:] + data
+        self.start = 0
+        return self._frames()
+
+    def _frames(self):
+        buf = self.buf
+        mv = memoryview(buf)
+        try:
+            while len(buf) - self.start >= HEADER.size:
+                s = self.start
+                magic, ver, length, seq, count = HEADER.unpack_from(buf, s)
+                if (magic != MAGIC or ver == 0 or length > MAX_PAYLOAD
+                        or (ver == VERSION and length != count*LINK.size)):
+                    # not a plausible header: resync on the next magic byte
+                    nxt = buf.find(MAGIC, s + 1)
+                    self.start = len(buf) if nxt < 0 else nxt
+                    self.dropped += 1
+                    continue
+                end = s + HEADER.size + length
+                if end > len(buf): break
+                self.start = end
+                if ver != VERSION:      # newer format: skip it whole
+                    self.dropped += 1
+                    continue
+                self.frames += 1
+                yield seq, unpack_links(mv[s + HEADER.size:end]), mv[s:end]
+        finally:
+            mv.release()
+
+
+def decode_frames(data):
+    """
+    Decode a whole buffer of back-to-back frames in one call.
+    Returns ([(seq, links), ...], bytes consumed); a trailing partial frame is left.
+    """
+    f = BinaryFramer()
+    f.buf = bytearray(data)
+    out = [(seq, links) for seq, links, _ in f._frames()]
+    return out, f.start
@@ -0,0 +1,298 @@
+# uwb/board.py
+# Shared-memory position board: the newest filtered position of every tag, with
+# its covariance and time, plus the anchor table, in one fixed-layout
+# multiprocessing.shared_memory block. The engine writes it after every solve
+# pass; any number of local processes read it by polling, with no socket, no
+# serialization and nothing a slow reader could hold up.
+#   python -m uwb --anchors a.json --board        # writer, block "uwb_positions"
+#   python -m uwb.board                           # a reader: JSON lines of changes
+#                                                 # ({"tag": ..., "gone": true} when one expires)
+#
+# Layout (little-endian, every field 8-byte aligned):
+#   header       64 B  magic "UWBP" | version u16 | pad u16 | tag slots u32 | anchor slots u32
+#                      | tags u64 (slots in use) | passes u64 (+1 after every publish)
+#                      | anchor seq u64 | anchor count u64 | writer pid u64
+#   tag slot    112 B  seq u64 | tag id 48 s | x y z | cov xx xy yy | t      (f64)
+#   anchor slot  80 B  aid 48 s | x y z bias                                 (f64)
+# Ids are UTF-8, NUL padded (cut at 48 bytes). z is NaN for 2-D positions and
+# cov NaN when the tracking filter has none; t is the snapshot's
+# time.monotonic(), a clock every process on the machine shares (in a replay,
+# the capture's clock instead). x and y NaN:
+# the tag's ranges have all expired (t = when it was dropped); its slot comes
+# back to life if it reports again.
+#
+# Seqlock: the single writer makes a slot's seq odd, writes the slot, and makes
+# it even again; a reader keeps its copy of a slot only if seq was even and the
+# same before and after copying, else it retries. One seq covers the whole
+# anchor table. A tag keeps its slot for the life of the board; new tags take the
+# next one and only then is `tags` raised. Python has no memory fences: seq and
+# slot are each written with a single store of their bytes, which x86-64 keeps in
+# order; on weakly ordered CPUs a reader may, rarely, keep a torn copy.
+
+import argparse, json, math, os, struct, sys, time
+from collections import namedtuple
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+BOARD_NAME    = "uwb_positions"
+BOARD_TAGS    = 4096          # tag slots
+BOARD_ANCHORS = 256           # anchor slots
+MAGIC   = b"UWBP"
+VERSION = 1
+ID_BYTES = 48
+SPINS    = 1000               # seqlock retries before a slot is given up on (writer died mid-write?)
+
+_HEAD   = struct.Struct("<4sHHII")
+_U64    = struct.Struct("<Q")
+_TAGS, _PASSES, _ASEQ, _ACOUNT, _PID = 16, 24, 32, 40, 48       # u64 header fields
+_HEADER = 64
+_TAG    = struct.Struct(f"<{ID_BYTES}s7d")       # after the slot's seq
+_ANCHOR = struct.Struct(f"<{ID_BYTES}s4d")
+_SLOT   = 8 + _TAG.size
+
+_NAN  = float("nan")
+_NANS = (_NAN, _NAN, _NAN)
+
+_OWNED = set()                # names of the boards this process writes
+
+# cov: (xx, xy, yy) in m^2 or None; t: time.monotonic() of the solve pass
+Position = namedtuple("Position", "x y z cov t")
+
+
+def _size(slots, anchor_slots):
+    return _HEADER + slots * _SLOT + anchor_slots * _ANCHOR.size
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class PositionBoard:
+    """
+    Writer side. Creates the block `name` (replacing a stale one whose writer is
+    gone); publish(snapshot) is meant to be an Engine listener, so there is one
+    writer thread. close() removes the block; attached readers keep their copy
+    of the last state.
+    """
+
+    def __init__(self, name=BOARD_NAME, slots=BOARD_TAGS, anchor_slots=BOARD_ANCHORS):
+        size = _size(slots, anchor_slots)
+        if name in _OWNED: raise RuntimeError(f"position board {name!r} is in use by this process")
+        try:
+            self.shm = SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            old = _attach(name)
+            ours = old.size >= _HEADER and bytes(old.buf[:4]) == MAGIC
+            pid = _U64.unpack_from(old.buf, _PID)[0] if ours else 0
+            old.close()
+            if not ours: raise FileExistsError(f"shared memory {name!r} exists and is not a position board")
+            if _alive(pid): raise RuntimeError(f"position board {name!r} is in use by process {pid}")
+            SharedMemory(name).unlink()
+            self.shm = SharedMemory(name, create=True, size=size)
+        _OWNED.add(name)
+        self.name = name
+        self.slots = slots
+        self.anchor_slots = anchor_slots
+        self.buf = self.shm.buf
+        self.buf[:size] = bytes(size)
+        _HEAD.pack_into(self.buf, 0, MAGIC, VERSION, 0, slots, anchor_slots)
+        _U64.pack_into(self.buf, _PID, os.getpid())
+        self.index = {}               # {peer: slot}
+        self.seqs = [0] * slots
+        self.passes = 0
+        self.aseq = 0
+        self.full = 0                 # positions dropped because every slot was taken
+        self.live = set()             # tags with a position on the board (not expired)
+        self._anchors = None
+
+    def publish(self, snap):
+        buf = self.buf
+        if snap.anchors != self._anchors: self._write_anchors(snap.anchors)
+        grown = False
+        live, smooth = self.live, snap.smooth
+        for peer in snap.updated:
+            i = self.index.get(peer)
+            if i is None:
+                if len(self.index) >= self.slots:
+                    self.full += 1
+                    continue
+                i = self.index[peer] = len(self.index)
+                grown = True
+            live.add(peer)
+            p = smooth[peer]
+            self._write(i, peer, p[0], p[1], p[2] if len(p) > 2 else _NAN,
+                        snap.cov.get(peer) or _NANS, snap.stamp)
+        if len(live) != len(smooth) or self.full:     # some tags expired (cheap check first)
+            for peer in [p for p in live if p not in smooth]:
+                live.discard(peer)
+                self._write(self.index[peer], peer, _NAN, _NAN, _NAN, _NANS, snap.stamp)
+        if grown: _U64.pack_into(buf, _TAGS, len(self.index))
+        self.passes += 1
+        _U64.pack_into(buf, _PASSES, self.passes)
+
+    def _write(self, i, peer, x, y, z, cov, t):
+        buf, o = self.buf, _HEADER + i * _SLOT
+        s = self.seqs[i]
+        _U64.pack_into(buf, o, s + 1)
+        _TAG.pack_into(buf, o + 8, peer.encode()[:ID_BYTES], x, y, z, *cov, t)
+        _U64.pack_into(buf, o, s + 2)
+        self.seqs[i] = s + 2
+
+    def _write_anchors(self, anchors):
+        buf = self.buf
+        self._anchors = anchors
+        _U64.pack_into(buf, _ASEQ, self.aseq + 1)
+        o = _HEADER + self.slots * _SLOT
+        n = 0
+        for aid, a in list(anchors.items())[:self.anchor_slots]:
+            _ANCHOR.pack_into(buf, o + n * _ANCHOR.size, aid.encode()[:ID_BYTES], a[0], a[1],
+                              a[3] if len(a) > 3 else _NAN, a[2] if len(a) > 2 else 0.0)
+            n += 1
+        _U64.pack_into(buf, _ACOUNT, n)
+        self.aseq += 2
+        _U64.pack_into(buf, _ASEQ, self.aseq)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+        _OWNED.discard(self.name)
+
+
+class BoardReader:
+    """
+    Reader side, in any local process: BoardReader(name) attaches to the block.
+    Poll `passes` to see whether anything changed, then positions() / get(tag) /
+    anchors(). Re-attach when the engine is restarted.
+    """
+
+    def __init__(self, name=BOARD_NAME):
+        self.shm = _attach(name)
+        self.buf = self.shm.buf
+        magic, version, _, self.slots, self.anchor_slots = _HEAD.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{name!r} is not a version {VERSION} position board")
+        self.index = {}               # {tag: slot}; a slot's tag never changes
+        self._anchor_base = _HEADER + self.slots * _SLOT
+
+    @property
+    def passes(self):
+        """Publishes so far; unchanged = nothing new to read."""
+        return _U64.unpack_from(self.buf, _PASSES)[0]
+
+    def tags(self):
+        """Every tag id on the board."""
+        n = _U64.unpack_from(self.buf, _TAGS)[0]
+        for i in range(len(self.index), n):
+            tid = self.buf[_HEADER + i*_SLOT + 8:_HEADER + i*_SLOT + 8 + ID_BYTES].tobytes()
+            self.index[tid.rstrip(b"\0").decode(errors="replace")] = i
+        return list(self.index)
+
+    def get(self, tag):
+        """Position of one tag, or None (not on the board, expired, or being rewritten for too long)."""
+        i = self.index.get(tag)
+        if i is None:
+            self.tags()
+            i = self.index.get(tag)
+            if i is None: return None
+        v = self._read(i)
+        return _position(v) if v and not math.isnan(v[1]) else None
+
+    def positions(self):
+        """{tag: Position} of every tag on the board that has not expired."""
+        self.tags()
+        out = {}
+        for tag, i in self.index.items():
+            v = self._read(i)
+            if v is not None and not math.isnan(v[1]): out[tag] = _position(v)
+        return out
+
+    def anchors(self):
+        """{aid: (x, y, bias, z)} as the engine has it (z NaN where not set)."""
+        buf, base = self.buf, self._anchor_base
+        for _ in range(SPINS):
+            s = _U64.unpack_from(buf, _ASEQ)[0]
+            if s & 1: continue
+            n = _U64.unpack_from(buf, _ACOUNT)[0]
+            rows = [_ANCHOR.unpack_from(buf, base + k * _ANCHOR.size) for k in range(n)]
+            if _U64.unpack_from(buf, _ASEQ)[0] == s:
+                return {aid.rstrip(b"\0").decode(errors="replace"): (x, y, bias, z)
+                        for aid, x, y, z, bias in rows}
+        return {}
+
+    def _read(self, i):
+        buf, o = self.buf, _HEADER + i * _SLOT
+        for _ in range(SPINS):
+            s = _U64.unpack_from(buf, o)[0]
+            if s & 1: continue
+            v = _TAG.unpack_from(buf, o + 8)
+            if _U64.unpack_from(buf, o)[0] == s:
+                return v if s else None           # seq 0: slot claimed, not written yet
+        return None
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+
+def _position(v):
+    _, x, y, z, xx, xy, yy, t = v
+    return Position(x, y, z, None if math.isnan(xx) else (xx, xy, yy), t)
+
+
+def _attach(name):
+    try:
+        return SharedMemory(name, track=False)           # Python 3.13+
+    except TypeError:
+        shm = SharedMemory(name)
+        # a reader must not have its resource tracker unlink the engine's block at exit
+        # (one started by the writer through multiprocessing shares the writer's tracker:
+        # it then drops the writer's registration too, costing only the crash cleanup)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m uwb.board",
+                                 description="Print tag positions from the engine's position board.")
+    ap.add_argument("--name", default=BOARD_NAME)
+    ap.add_argument("--interval", type=float, default=0.05, help="poll period, s")
+    ap.add_argument("--once", action="store_true", help="print every tag once and exit")
+    args = ap.parse_args(argv)
+    try:
+        board = BoardReader(args.name)
+    except FileNotFoundError:
+        sys.exit(f"no position board {args.name!r}: start python -m uwb with --board")
+    last, passes = {}, None
+    try:
+        while True:
+            if board.passes != passes:
+                passes = board.passes
+                pos = board.positions()
+                for tag in [t for t in last if t not in pos]:
+                    del last[tag]
+                    print(json.dumps({"tag": tag, "gone": True}), flush=True)
+                for tag, p in pos.items():
+                    if last.get(tag) == p.t: continue
+                    last[tag] = p.t
+                    out = {"t": round(p.t, 4), "tag": tag, "x": round(p.x, 4), "y": round(p.y, 4)}
+                    if not math.isnan(p.z): out["z"] = round(p.z, 4)
+                    if p.cov: out["cov"] = [round(c, 6) for c in p.cov]
+                    print(json.dumps(out), flush=True)
+            if args.once: break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        board.close()
+
+
+if __name__ == "__main__":
+    main()
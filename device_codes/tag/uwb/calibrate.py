@@ -0,0 +1,295 @@
+# uwb/calibrate.py
+# Multi-point range calibration. calibrate_here() fits each anchor's bias to one
+# tag position that was itself solved from the biased ranges; here many frames
+# are collected instead, either with the tag held at surveyed points or carried
+# along an unknown path, and every anchor's correction
+#   corrected = scale * raw + bias
+# is estimated jointly (Huber-weighted Gauss-Newton / LM). The positions of the
+# path frames are unknowns of the same solve; they are eliminated per frame
+# with a Schur complement, so a step costs one small dense solve in the anchor
+# parameters however many frames there are. Surveyed points alone make every
+# anchor a separate linear fit; a path needs enough anchors and movement to
+# pin the biases down (a small prior keeps unobservable ones at 0 / 1).
+# The result is a calibration file, {aid: {"bias", "scale"}}, that the engine
+# loads at startup (Engine(calibration=...), python -m uwb --calibration).
+#   python -m uwb.calibrate --anchors a.json --point 1.0 2.0 p1.cap --point 4 2 p2.cap -o cal.json
+#   python -m uwb.calibrate --anchors a.json --path walk.cap.gz --scale -o cal.json
+
+import argparse, json, math, threading
+from collections import namedtuple
+
+from .solver import trilaterate, horizontal_ranges, HUBER_DELTA
+
+CAL_VERSION = 1
+ITERS       = 50
+PRIOR       = 1e-3            # weight pulling bias to 0 and scale to 1 (unobservable parameters)
+MAX_SAMPLES = 20000           # path frames beyond this are thinned out evenly
+
+# at: surveyed tag position (x, y[, z]), or None for a frame along an unknown path
+# ranges: {aid: raw range}
+Sample = namedtuple("Sample", "at ranges")
+
+
+class Calibrator:
+    """
+    Collects samples from the live stream (Engine.start_calibration() feeds it
+    every frame) or from captures. Set `point` to the tag's surveyed position
+    while it sits there, None while it is carried around; `recording` pauses.
+    """
+
+    def __init__(self, peer=None):
+        self.peer = peer              # only frames of this tag (None = any)
+        self.point = None
+        self.recording = True
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def feed(self, peer, links):
+        if not self.recording or (self.peer is not None and peer != self.peer): return
+        self.add({l.aid: l.range for l in links}, self.point)
+
+    def add(self, ranges, at=None):
+        if not ranges: return
+        with self._lock:
+            self.samples.append(Sample(tuple(at) if at is not None else None, dict(ranges)))
+
+    def counts(self):
+        """{surveyed point or None (path): number of samples}"""
+        out = {}
+        with self._lock:
+            for s in self.samples:
+                out[s.at] = out.get(s.at, 0) + 1
+        return out
+
+    def solve(self, anchors, scale=False, height=0.0):
+        with self._lock:
+            samples = list(self.samples)
+        return solve(anchors, samples, scale, height)
+
+
+# ----- solver -----
+def _huber(e, d=HUBER_DELTA):
+    a = abs(e)
+    return (a*a, 1.0) if a <= d else (d*d + 2*d*(a - d), d/a)
+
+
+def _solve_dense(A, b):
+    """Gaussian elimination with partial pivoting (A is modified); None if singular."""
+    n = len(b)
+    for c in range(n):
+        p = max(range(c, n), key=lambda i: abs(A[i][c]))
+        if abs(A[p][c]) < 1e-12: return None
+        if p != c:
+            A[c], A[p] = A[p], A[c]; b[c], b[p] = b[p], b[c]
+        piv = A[c]
+        for i in range(c + 1, n):
+            f = A[i][c] / piv[c]
+            if f:
+                Ai = A[i]
+                for k in range(c, n): Ai[k] -= f*piv[k]
+                b[i] -= f*b[c]
+    x = [0.0]*n
+    for c in range(n - 1, -1, -1):
+        x[c] = (b[c] - sum(A[c][k]*x[k] for k in range(c + 1, n))) / A[c][c]
+    return x
+
+
+def solve(anchors, samples, scale=False, height=0.0, iters=ITERS):
+    """
+    anchors: {aid: (x, y, bias[, z])}; samples: [Sample]; height: tag z where a
+    sample does not give one. Returns ({aid: (bias, scale)}, report) for every
+    anchor that appears in the samples; report has rms_before/rms_after (m),
+    samples, iterations.
+    """
+    anc = {aid: (a[0], a[1], a[3] if len(a) > 3 else 0.0) for aid, a in anchors.items()}
+    path = [s for s in samples if s.at is None and sum(a in anc for a in s.ranges) >= 3]
+    if len(path) > MAX_SAMPLES:
+        path = path[::math.ceil(len(path) / MAX_SAMPLES)]
+    fixed = [s for s in samples if s.at is not None]
+    used = sorted({aid for s in fixed + path for aid in s.ranges if aid in anc})
+    if not used:
+        return {}, {"samples": 0, "iterations": 0, "rms_before": 0.0, "rms_after": 0.0}
+    k = 2 if scale else 1
+    col = {aid: i*k for i, aid in enumerate(used)}
+    P = len(used) * k
+    theta = [0.0]*P
+    for aid in used:
+        theta[col[aid]] = anchors[aid][2] if len(anchors[aid]) > 2 else 0.0
+        if scale: theta[col[aid] + 1] = 1.0
+
+    # rows: (position (list, updated in place) or fixed tuple, is_variable, [(aid, raw range)])
+    rows = []
+    for s in fixed:
+        at = s.at if len(s.at) > 2 else (s.at[0], s.at[1], height)
+        rows.append((at, False, [(a, r) for a, r in s.ranges.items() if a in anc]))
+    for s in path:
+        rr = [(a, r) for a, r in s.ranges.items() if a in anc]
+        pts = [anc[a] for a, _ in rr]
+        rs = horizontal_ranges(pts, [max(r + theta[col[a]], 0.0) for a, r in rr], height)
+        x, y = trilaterate([p[:2] for p in pts], rs)
+        rows.append(([x, y, height], True, rr))
+
+    def corrected(aid, r, th):
+        c = col[aid]
+        return (th[c+1]*r if scale else r) + th[c]
+
+    def cost(th, moves=None):
+        tot = 0.0
+        for i, (pos, var, rr) in enumerate(rows):
+            x, y, z = pos
+            if moves is not None and var:
+                x += moves[i][0]; y += moves[i][1]
+            for aid, r in rr:
+                ax, ay, az = anc[aid]
+                tot += _huber(math.sqrt((x-ax)**2 + (y-ay)**2 + (z-az)**2) - corrected(aid, r, th))[0]
+        for aid in used:
+            c = col[aid]
+            tot += PRIOR * th[c]**2 + (PRIOR * (th[c+1] - 1.0)**2 if scale else 0.0)
+        return tot
+
+    def rms(th):
+        n = sum(len(rr) for _, _, rr in rows)
+        se = 0.0
+        for (x, y, z), _, rr in rows:
+            for aid, r in rr:
+                ax, ay, az = anc[aid]
+                se += (math.sqrt((x-ax)**2 + (y-ay)**2 + (z-az)**2) - corrected(aid, r, th))**2
+        return math.sqrt(se / n) if n else 0.0
+
+    before = rms(theta)
+    last = cost(theta)
+    lam = 1e-3
+    it = 0
+    for it in range(1, iters + 1):
+        V = [[0.0]*P for _ in range(P)]
+        g = [0.0]*P
+        for aid in used:
+            c = col[aid]
+            V[c][c] += PRIOR; g[c] += PRIOR * theta[c]
+            if scale:
+                V[c+1][c+1] += PRIOR; g[c+1] += PRIOR * (theta[c+1] - 1.0)
+        elim = {}                                       # row index -> (U^-1, W columns, ex)
+        for i, (pos, var, rr) in enumerate(rows):
+            x, y, z = pos
+            u11 = u12 = u22 = e1 = e2 = 0.0
+            W = {}
+            for aid, r in rr:
+                ax, ay, az = anc[aid]
+                d = math.sqrt((x-ax)**2 + (y-ay)**2 + (z-az)**2) or 1e-9
+                e = d - corrected(aid, r, theta)
+                w = _huber(e)[1]
+                c = col[aid]
+                # d e / d bias = -1, d e / d scale = -r
+                V[c][c] += w; g[c] -= w*e
+                if scale:
+                    V[c][c+1] += w*r; V[c+1][c] += w*r; V[c+1][c+1] += w*r*r; g[c+1] -= w*r*e
+                if var:
+                    ux, uy = (x-ax)/d, (y-ay)/d
+                    u11 += w*ux*ux; u12 += w*ux*uy; u22 += w*uy*uy
+                    e1 += w*ux*e; e2 += w*uy*e
+                    W[c] = (-w*ux, -w*uy)
+                    if scale: W[c+1] = (-w*ux*r, -w*uy*r)
+            if not var: continue
+            u11 += lam; u22 += lam
+            det = u11*u22 - u12*u12
+            if det <= 1e-12: continue
+            i11, i12, i22 = u22/det, -u12/det, u11/det
+            # Schur complement: V -= W^T U^-1 W, g -= W^T U^-1 ex
+            UW = {c: (i11*wx + i12*wy, i12*wx + i22*wy) for c, (wx, wy) in W.items()}
+            for c1, (wx, wy) in W.items():
+                Vc = V[c1]
+                for c2, (vx, vy) in UW.items():
+                    Vc[c2] -= wx*vx + wy*vy
+                g[c1] -= UW[c1][0]*e1 + UW[c1][1]*e2
+            elim[i] = (i11, i12, i22, W, e1, e2)
+        for c in range(P): V[c][c] += lam * (1.0 + V[c][c])
+        step = _solve_dense(V, [-v for v in g])
+        if step is None:
+            lam *= 10
+            continue
+        new = [t + s for t, s in zip(theta, step)]
+        moves = {}
+        for i, (i11, i12, i22, W, e1, e2) in elim.items():
+            b1, b2 = e1, e2
+            for c, (wx, wy) in W.items():
+                b1 += wx*step[c]; b2 += wy*step[c]
+            moves[i] = (-(i11*b1 + i12*b2), -(i12*b1 + i22*b2))
+        c_new = cost(new, moves)
+        if c_new <= last:
+            theta = new
+            for i, (dx, dy) in moves.items():
+                rows[i][0][0] += dx; rows[i][0][1] += dy
+            done = last - c_new <= 1e-10 * max(last, 1e-12)
+            last = c_new
+            lam = max(lam * 0.3, 1e-9)
+            if done or max(abs(s) for s in step) < 1e-7: break
+        else:
+            lam *= 10
+            if lam > 1e8: break
+
+    cal = {aid: (theta[col[aid]], theta[col[aid] + 1] if scale else 1.0) for aid in used}
+    return cal, {"samples": len(rows), "iterations": it,
+                 "rms_before": before, "rms_after": rms(theta)}
+
+
+# ----- calibration file -----
+def save_calibration(path, cal, report=None):
+    doc = {"version": CAL_VERSION,
+           "anchors": {aid: {"bias": round(b, 5), "scale": round(s, 6)} for aid, (b, s) in cal.items()}}
+    if report: doc["report"] = report
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=1)
+
+
+def load_calibration(path):
+    """{aid: (bias, scale)} from a calibration file."""
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    if doc.get("version") != CAL_VERSION:
+        raise ValueError(f"{path}: not a version {CAL_VERSION} calibration file")
+    return {aid: (float(v.get("bias", 0.0)), float(v.get("scale", 1.0)))
+            for aid, v in doc["anchors"].items()}
+
+
+def main(argv=None):
+    from .capture import read_capture, decode_record
+    from .engine import load_anchors
+
+    ap = argparse.ArgumentParser(prog="python -m uwb.calibrate",
+                                 description="Estimate per-anchor range bias (and scale) from captures.")
+    ap.add_argument("--anchors", required=True, help="anchor file, as for python -m uwb")
+    ap.add_argument("--point", nargs=3, action="append", default=[], metavar=("X", "Y", "CAPTURE"),
+                    help="capture taken with the tag held at surveyed (X, Y) (repeatable)")
+    ap.add_argument("--path", action="append", default=[], metavar="CAPTURE",
+                    help="capture taken while carrying the tag around (repeatable)")
+    ap.add_argument("--tag", help="only use frames of this peer")
+    ap.add_argument("--height", type=float, default=0.0, help="tag height (3-D anchors)")
+    ap.add_argument("--scale", action="store_true", help="also estimate a range scale per anchor")
+    ap.add_argument("-o", "--output", default="calibration.json")
+    args = ap.parse_args(argv)
+    if not args.point and not args.path:
+        ap.error("give at least one --point or --path capture")
+
+    cal = Calibrator(args.tag)
+    for *xy, path in args.point:
+        cal.point = (float(xy[0]), float(xy[1]))
+        for rec in read_capture(path):
+            links = decode_record(rec)
+            if links: cal.feed(rec.peer, links)
+    cal.point = None
+    for path in args.path:
+        for rec in read_capture(path):
+            links = decode_record(rec)
+            if links: cal.feed(rec.peer, links)
+
+    result, report = cal.solve(load_anchors(args.anchors), args.scale, args.height)
+    for aid, (b, s) in sorted(result.items()):
+        print(f"{aid}: bias {b:+.3f} m" + (f"  scale {s:.4f}" if args.scale else ""))
+    print(f"{report['samples']} samples, rms {report['rms_before']:.3f} -> "
+          f"{report['rms_after']:.3f} m in {report['iterations']} iterations")
+    save_calibration(args.output, result, report)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# uwb/capture.py
+# Record-and-replay of ingest streams, so the engine can be exercised without
+# tags on the network.
+#
+# File: 8-byte header b"UWBCAP" + version u16, then length-prefixed records
+#   t f64 (s since capture start, monotonic) | kind u8 | peer_len u16 | len u32
+#   | peer (utf-8) | payload
+# kind 0 = one JSON line (as received, without the newline), 1 = one binary
+# frame (uwb/binframe.py). Frames are stored raw so a replay goes through the
+# same decoders as live traffic. Paths ending in .gz are gzip-compressed.
+
+import gzip, struct, threading, time
+from collections import namedtuple
+
+from .binframe import HEADER as BIN_HEADER, unpack_links
+from .decode import decode_line
+
+MAGIC   = b"UWBCAP"
+VERSION = 1
+FILE_HEADER = struct.Struct("<6sH")
+RECORD = struct.Struct("<dBHI")
+
+JSON, BINARY = 0, 1
+FLUSH_S = 1.0                 # bound what a killed process loses (gzip buffers a lot)
+
+Record = namedtuple("Record", "t kind peer payload")
+
+
+def _open(path, mode):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode, compresslevel=1)   # fast; captures are mostly numbers
+    return open(path, mode)
+
+
+class CaptureWriter:
+    """Append received frames to a capture file (thread-safe)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = _open(path, "wb")
+        self.f.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.t0 = self._flushed = time.monotonic()
+        self.count = 0
+        self._peers = {}          # peer -> encoded bytes
+        self._lock = threading.Lock()
+
+    def write(self, peer, kind, payload, t=None):
+        if t is None: t = time.monotonic()
+        p = self._peers.get(peer)
+        if p is None:
+            p = self._peers[peer] = peer.encode("utf-8")
+        with self._lock:
+            self.f.write(RECORD.pack(t - self.t0, kind, len(p), len(payload)))
+            self.f.write(p)
+            self.f.write(payload)
+            self.count += 1
+            if t - self._flushed > FLUSH_S:
+                self.f.flush()
+                self._flushed = t
+
+    def flush(self):
+        with self._lock:
+            self.f.flush()
+
+    def close(self):
+        with self._lock:
+            self.f.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+
+def read_capture(path):
+    """Yield Record(t, kind, peer, payload) in file order; stops at a truncated tail."""
+    with _open(path, "rb") as f:
+        head = f.read(FILE_HEADER.size)
+        if len(head) < FILE_HEADER.size or FILE_HEADER.unpack(head) != (MAGIC, VERSION):
+            raise ValueError(f"{path}: not a version {VERSION} UWB capture")
+        peers = {}
+        while True:
+            try:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size: return
+                t, kind, plen, n = RECORD.unpack(head)
+                p = f.read(plen)
+                payload = f.read(n)
+            except EOFError:        # gzip stream cut off by a killed recorder
+                return
+            if len(payload) < n: return
+            peer = peers.get(p)
+            if peer is None:
+                peer = peers[p] = p.decode("utf-8")
+            yield Record(t, kind, peer, payload)
+
+
+def decode_record(rec):
+    """Links of one record, decoded exactly like the ingest server would."""
+    if rec.kind == BINARY:
+        return unpack_links(memoryview(rec.payload)[BIN_HEADER.size:])
+    return decode_line(rec.payload)
+
+
+def replay(path, sink, speed=1.0, stop=None, stamped=False):
+    """
+    Feed a capture into sink(peer, links), or sink(peer, links, t) with the
+    recorded time if stamped. speed=1 plays in real time, N plays N times faster,
+    0 (or None) as fast as possible. Returns the number of frames fed.
+    """
+    n = 0
+    start = None
+    for rec in read_capture(path):
+        if stop is not None and stop.is_set(): break
+        if speed:
+            now = time.monotonic()
+            if start is None: start = now - rec.t/speed
+            delay = start + rec.t/speed - now
+            if delay > 0: time.sleep(delay)
+        links = decode_record(rec)
+        if links is not None:
+            if stamped: sink(rec.peer, links, rec.t)
+            else: sink(rec.peer, links)
+            n += 1
+    return n
@@ -0,0 +1,114 @@
+# uwb/decode.py
+# Schema-specialized decoding of {"links": [...]} report lines.
+# Backends, fastest first: msgspec (typed decode + validation in C), orjson,
+# stdlib json. All take the raw line bytes/memoryview (no intermediate str) and
+# return a list of Link records, or None for anything that is not a links frame.
+#
+# Validation happens here, once, and every backend applies the same rules:
+#   - a link without a str aid and a numeric range is skipped (the frame is kept);
+#   - a metric (raw, rssi, fpPower, quality) that is not a number becomes None;
+#   - a line that is not strict JSON is not a frame (None), and neither is one with a
+#     link number no double can hold (NaN, Infinity, 1e999, 400-digit integers).
+# Downstream code can rely on aid being a str, range a finite float and every
+# metric a finite float or None.
+
+import json
+from collections import namedtuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# fp = first-path power ("fpPower" on the wire); metrics are None when not sent
+Link = namedtuple("Link", "aid range raw rssi fp quality")
+_new = tuple.__new__
+
+
+def _num(v):
+    """A JSON number as a float, None for anything else (bool, str, null, ...)."""
+    t = type(v)
+    if t is float:
+        if v - v != 0.0: raise ValueError("number out of range")     # inf from 1e999 (stdlib)
+        return v
+    if t is int: return float(v)  # OverflowError beyond the double range
+    return None
+
+
+def links_from_obj(obj):
+    """Validate a parsed frame (dict) into Link records in one pass."""
+    if not isinstance(obj, dict): return None
+    links = obj.get("links")
+    if not isinstance(links, list): return None
+    out = []
+    for l in links:
+        if not isinstance(l, dict): continue
+        aid = l.get("aid"); r = _num(l.get("range"))
+        if not isinstance(aid, str) or r is None: continue
+        out.append(Link(aid, r, _num(l.get("raw")), _num(l.get("rssi")), _num(l.get("fpPower")),
+                        _num(l.get("quality"))))
+    return out
+
+
+def _constant(s):
+    raise ValueError(f"{s} is not JSON")
+
+
+def _stdlib(line):
+    # the stdlib parser only takes str, so this backend still pays for the decode;
+    # NaN / Infinity literals are refused, as orjson and msgspec refuse them
+    try:
+        return links_from_obj(json.loads(str(line, "utf-8", "ignore"), parse_constant=_constant))
+    except (ValueError, OverflowError):
+        return None
+
+
+def _orjson(line):
+    try:
+        return links_from_obj(orjson.loads(line))
+    except (orjson.JSONDecodeError, ValueError, OverflowError):
+        return None
+
+
+if msgspec is not None:
+    from msgspec.structs import astuple as _astuple
+
+    class _Link(msgspec.Struct, frozen=True, gc=False):       # fields in Link's order
+        aid: str
+        range: float
+        raw: "float | None" = None
+        rssi: "float | None" = None
+        fp: "float | None" = msgspec.field(default=None, name="fpPower")
+        quality: "float | None" = None
+
+    class _Frame(msgspec.Struct, gc=False):
+        links: "list[_Link]"
+
+    _frame_decoder = msgspec.json.Decoder(_Frame)
+
+    def _msgspec(line):
+        # fast path: the whole frame matches the schema; otherwise decode it untyped
+        # and validate link by link like the other backends
+        try:
+            links = _frame_decoder.decode(line).links
+        except msgspec.ValidationError:
+            try:
+                return links_from_obj(msgspec.json.decode(line))
+            except (msgspec.DecodeError, msgspec.ValidationError, ValueError, OverflowError):
+                return None
+        except msgspec.DecodeError:
+            return None
+        return [_new(Link, _astuple(l)) for l in links]
+
+
+BACKENDS = {"stdlib": _stdlib}
+if orjson is not None: BACKENDS["orjson"] = _orjson
+if msgspec is not None: BACKENDS["msgspec"] = _msgspec
+
+BACKEND = "msgspec" if msgspec is not None else "orjson" if orjson is not None else "stdlib"
+decode_line = BACKENDS[BACKEND]
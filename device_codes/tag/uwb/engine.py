@@ -0,0 +1,322 @@
+# uwb/engine.py
+# Headless tracking engine: ingest + anchor table/calibration + solving + smoothing.
+# No Tk anywhere; positions are delivered to subscribed callbacks or pulled with
+# the snapshots() iterator. The Tk viewers are just one optional consumer.
+
+import json, math, threading, time
+
+from .ingest import IngestServer, HOST, PORT
+from .capture import CaptureWriter, replay
+from .mailbox import Mailbox, MAILBOX_SIZE, LATEST, BLOCK
+from .metrics import Metrics, MetricsServer
+from .solver import trilaterate
+from .calibrate import Calibrator, load_calibration, save_calibration
+from .spatial import MAX_ANCHORS
+from .track import TRACKER
+from .worker import SolverWorker, SOLVE_MS, SMOOTH_ALPHA, RANGE_TTL, LIVE, CAPTURE
+from .shards import ShardPool
+from .board import PositionBoard, BOARD_NAME
+from .stream import StreamServer, STREAM_PORT
+
+
+class Engine:
+    """
+    anchors: {aid: (x, y)}, {aid: (x, y, bias)} or {aid: (x, y, bias, z)} in meters.
+    dims=3 solves (x, y, z) from the anchors' heights; tag_height pins the tag's z
+    instead (a 2-D solve with the height difference taken out of the ranges).
+    listen=False skips the TCP server; frames are then fed with put(peer, links)
+    or replay(path). capture: file path that records every received frame.
+    metrics: True (or a uwb.metrics.Metrics) turns on per-stage latency
+    instrumentation, see stats(); metrics_port also serves it over local HTTP.
+    mailbox_size / policy: bound and overload policy of the frame hand-off to the
+    solver, see uwb/mailbox.py (default: newest range per tag and anchor wins).
+    max_anchors: per-solve anchor budget of a tag, see uwb/spatial.py (0 = all).
+    range_ttl: seconds before an anchor range that is not refreshed expires (0 = never).
+    tracker: per-tag filter of the published positions, see uwb/track.py
+    ("ema" = the fixed smooth_alpha average).
+    calibration: {aid: (bias, scale)} or a calibration file (uwb/calibrate.py);
+    its biases replace the table's.
+    link_weights: weight ranges by link quality and drop likely-NLOS ones (uwb/quality.py).
+    ransac: consensus stage that drops outlier ranges before solving (uwb/ransac.py, NumPy).
+    shards: solve on this many worker processes, tags hashed onto them (uwb/shards.py);
+    0 = on a thread of this process.
+    board: True or a name: publish positions into a shared-memory block for
+    local reader processes (uwb/board.py, default name "uwb_positions").
+    stream: True, a port or a uwb.stream.StreamServer: serve positions to TCP /
+    WebSocket subscribers on host (uwb/stream.py, default port 8090).
+    clock="capture": the engine runs on the recorded time of replay() (range
+    ages, tracking filters, solve slots, snapshot stamps) and takes every frame
+    through a blocking mailbox, so one capture always gives the same output at
+    any speed. Needs listen=False; frames fed with put() then need their `at`.
+    """
+
+    def __init__(self, anchors, host=HOST, port=PORT, listen=True, solve=trilaterate,
+                 solve_ms=SOLVE_MS, smooth_alpha=SMOOTH_ALPHA, auto_add=False,
+                 capture=None, metrics=False, metrics_port=None,
+                 mailbox_size=MAILBOX_SIZE, policy=LATEST, max_anchors=MAX_ANCHORS,
+                 range_ttl=RANGE_TTL, tracker=TRACKER, dims=2, tag_height=None,
+                 calibration=None, link_weights=True, ransac=False, shards=0, board=None,
+                 stream=None, clock=LIVE, verbose=True):
+        if clock == CAPTURE and listen:
+            raise ValueError("clock='capture' needs listen=False (only replays carry a capture time)")
+        # first: it raises if another engine owns the block
+        self.board = PositionBoard(BOARD_NAME if board is True else board) if board else None
+        self.clock = clock
+        self.frames = Mailbox(mailbox_size, BLOCK if clock == CAPTURE else policy)
+        if metrics_port is not None and not metrics: metrics = True
+        self.metrics = (Metrics() if metrics is True else metrics) or None
+        kw = dict(solve=solve, solve_ms=solve_ms, smooth_alpha=smooth_alpha, auto_add=auto_add,
+                  metrics=self.metrics, max_anchors=max_anchors, range_ttl=range_ttl,
+                  tracker=tracker, dims=3 if tag_height is not None else dims,
+                  tag_height=tag_height, link_weights=link_weights, ransac=ransac, clock=clock)
+        self.worker = (ShardPool(self.frames, _table(anchors), shards, **kw) if shards else
+                       SolverWorker(self.frames, _table(anchors), **kw))
+        self.capture = CaptureWriter(capture) if capture else None
+        if stream is True: stream = STREAM_PORT
+        if isinstance(stream, int) and not isinstance(stream, bool):
+            stream = StreamServer(host, stream, verbose=verbose)
+        self.stream = stream or None
+        self.server = IngestServer(self.put, host, port, capture=self.capture,
+                                   stamp=self.metrics is not None,
+                                   verbose=verbose) if listen else None
+        self.metrics_server = None
+        if self.metrics is not None:
+            self.metrics.sources.append(self._counts)
+            if metrics_port is not None:
+                self.metrics_server = MetricsServer(self.metrics, port=metrics_port)
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self.worker.listeners.append(self._notify)
+        if self.board: self.worker.listeners.append(self.board.publish)
+        if self.stream: self.worker.listeners.append(self.stream.publish)
+        self.calibrator = None        # set while a calibration run records frames
+        self._replayed = 0.0          # capture clock at the end of the last replay
+        self._solve_s = solve_ms/1000.0
+        if calibration is not None: self.apply_calibration(calibration)
+
+    # ----- lifecycle -----
+    def start(self):
+        self.worker.start()
+        if self.server: self.server.start()
+        if self.metrics_server: self.metrics_server.start()
+        if self.stream: self.stream.start()
+        return self
+
+    def stop(self):
+        if self.metrics_server: self.metrics_server.stop()
+        self.frames.close()           # unblocks the ingest thread under the block policy
+        if self.server: self.server.stop()
+        self.worker.stop()
+        if self.stream: self.stream.stop()
+        if self.capture: self.capture.close()
+        if self.board: self.board.close()
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    # ----- input -----
+    def put(self, peer, links, t=None, at=None):
+        """
+        Feed one decoded frame, a list of uwb.decode.Link records (thread-safe).
+        t: monotonic receive time, if known (only used with metrics).
+        at: the frame's time on the capture clock (clock="capture" only, required there).
+        """
+        if self.calibrator is not None: self.calibrator.feed(peer, links)
+        if self.clock == CAPTURE:
+            if at is None: raise ValueError("clock='capture' frames need their time `at`")
+            tq = time.monotonic() if self.metrics is not None else None
+            self.frames.put((peer, links, tq, tq, at))
+            return
+        if self.metrics is None:
+            self.frames.put((peer, links))
+            return
+        now = time.monotonic()
+        if t is None: t = now
+        else: self.metrics.lat["decode"].record((now - t) * 1e6)
+        self.frames.put((peer, links, t, now))
+
+    def replay(self, path, speed=1.0):
+        """
+        Feed a capture file (blocking); speed N = N x real time, 0 = max speed.
+        With clock="capture" the recorded times drive the engine; a further replay
+        continues that clock where the previous one ended.
+        """
+        if self.clock != CAPTURE:
+            return replay(path, self.put, speed, stop=self._stopped)
+        base, end = self._replayed, [self._replayed]
+        def feed(peer, links, t):
+            end[0] = base + t
+            self.put(peer, links, at=end[0])
+        n = replay(path, feed, speed, stop=self._stopped, stamped=True)
+        # a last tick one solve period on gets the final frames' tags solved
+        self._replayed = end[0] + self._solve_s
+        self.frames.put((None, (), None, None, self._replayed))
+        return n
+
+    def idle(self):
+        """True when every fed frame has been consumed and solved."""
+        return self.worker.idle()
+
+    # ----- instrumentation -----
+    def stats(self):
+        """Everything uwb.metrics collected (latency percentiles, counts), or None when off."""
+        return self.metrics.stats() if self.metrics is not None else None
+
+    def displayed(self, snap=None):
+        """Consumers call this once `snap` (the newest snapshot) is on screen / written out."""
+        if self.metrics is None: return
+        # a capture-clock stamp is not comparable to the monotonic display time
+        self.metrics.displayed(snap if self.clock == LIVE else None)
+
+    def _counts(self):
+        out = {"queued": self.frames.qsize()}
+        out.update(self.frames.counts())
+        if self.server: out.update(self.server.counts())
+        if self.board: out["board_full"] = self.board.full
+        if self.stream: out.update(self.stream.counts())
+        return out
+
+    # ----- outputs -----
+    @property
+    def snapshot(self):
+        return self.worker.snapshot
+
+    def subscribe(self, fn):
+        """Call fn(snapshot) after every solve pass (on the solver thread: keep it short)."""
+        self.worker.listeners.append(fn)
+        return fn
+
+    def unsubscribe(self, fn):
+        self.worker.listeners.remove(fn)
+
+    def snapshots(self, timeout=None):
+        """
+        Yield snapshots as they are published. A reader that falls behind gets the
+        newest one, its `updated` widened to every tag solved since the previous item.
+        """
+        box = []                      # [newest snapshot not yielded yet, tags solved since]
+        def gather(snap):
+            with self._cond:
+                if box: box[0], box[1] = snap, box[1] | snap.updated
+                else: box[:] = [snap, snap.updated]
+                self._cond.notify_all()
+        self.subscribe(gather)
+        try:
+            while not self._stopped.is_set():
+                with self._cond:
+                    if not self._cond.wait_for(lambda: box or self._stopped.is_set(), timeout):
+                        return
+                    if not box: return
+                    (snap, updated), box[:] = box, []
+                yield snap if updated is snap.updated else snap._replace(updated=updated)
+        finally:
+            self.unsubscribe(gather)
+
+    def positions(self, timeout=None, smoothed=True):
+        """Yield (peer, (x, y)) ((x, y, z) with dims=3) for every tag solved since the previous item."""
+        for snap in self.snapshots(timeout):
+            pos = snap.smooth if smoothed else snap.tags
+            for peer in snap.updated:
+                if peer in pos: yield peer, pos[peer]
+
+    def _notify(self, snap):
+        with self._cond:
+            self._cond.notify_all()
+
+    # ----- anchor table / calibration -----
+    @property
+    def anchors(self):
+        """Current {aid: (x, y, bias[, z])} table (a copy)."""
+        return self.worker.anchor_table()
+
+    @property
+    def scales(self):
+        """Range scales {aid: s} of the calibration in use (anchors without one: 1)."""
+        return dict(self.worker.scales)
+
+    def set_anchor(self, aid, x, y, bias=0.0, z=None):
+        self.worker.update_anchors({aid: _anchor((x, y, bias) if z is None else (x, y, bias, z))})
+
+    def delete_anchor(self, aid):
+        self.worker.update_anchors({}, removed=(aid,))
+
+    def set_anchors(self, anchors):
+        self.worker.set_anchors(_table(anchors))
+
+    def calibrate_here(self, peer):
+        """
+        Set bias so that each anchor's corrected range for `peer` equals its geometric
+        distance to that tag's current estimate. Returns {aid: new bias}.
+        A quick fix only: the estimate was solved from the same biased ranges; see
+        start_calibration() for a proper one.
+        """
+        snap = self.snapshot
+        if peer not in snap.tags: return {}
+        tag = snap.tags[peer]
+        table = self.anchors
+        changes = {}
+        for aid, r in snap.ranges.get(peer, {}).items():
+            if aid not in table: continue
+            x, y, _, *z = table[aid]
+            d = math.hypot(tag[0] - x, tag[1] - y)
+            if len(tag) > 2: d = math.hypot(d, tag[2] - (z[0] if z else 0.0))
+            changes[aid] = (x, y, d - r, *z)
+        if changes:
+            self.worker.update_anchors(changes)
+        return {aid: a[2] for aid, a in changes.items()}
+
+    def apply_calibration(self, cal):
+        """Use {aid: (bias, scale)} (or a calibration file) for the anchors in the table."""
+        if isinstance(cal, str): cal = load_calibration(cal)
+        table = self.anchors
+        self.worker.update_anchors({aid: (a[0], a[1], cal[aid][0], *a[3:])
+                                    for aid, a in table.items() if aid in cal})
+        self.worker.set_scales({aid: s for aid, (_, s) in cal.items() if s != 1.0})
+
+    def start_calibration(self, peer=None):
+        """
+        Record raw ranges (of `peer` only, if given) into a new uwb.calibrate.Calibrator,
+        returned: set its .point to the tag's surveyed (x, y) while it sits still
+        there, None while it is carried along a path.
+        """
+        self.calibrator = Calibrator(peer)
+        return self.calibrator
+
+    def finish_calibration(self, scale=False, save=None):
+        """
+        Stop recording, solve the biases (and scales), apply them and optionally
+        write them to the file `save`. Returns ({aid: (bias, scale)}, report).
+        """
+        cal, self.calibrator = self.calibrator, None
+        if cal is None: return {}, {}
+        h = self.worker.tag_height
+        result, report = cal.solve(self.anchors, scale, h or 0.0)
+        if result:
+            self.apply_calibration(result)
+            if save: save_calibration(save, result, report)
+        return result, report
+
+
+def load_anchors(path):
+    """
+    Read an anchor file: JSON {aid: [x, y], [x, y, bias], [x, y, bias, z]
+    or {"x": .., "y": .., "z": .., "bias": ..}}.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    out = {}
+    for aid, v in table.items():
+        if isinstance(v, dict):
+            v = (v["x"], v["y"], v.get("bias", 0.0)) + ((v["z"],) if "z" in v else ())
+        out[aid] = tuple(v)
+    return out
+
+
+def _anchor(a):
+    x, y, *rest = a
+    a = (float(x), float(y), float(rest[0]) if rest else 0.0)
+    return a + (float(rest[1]),) if len(rest) > 1 else a
+
+
+def _table(anchors):
+    return {aid: _anchor(a) for aid, a in anchors.items()}
@@ -0,0 +1,83 @@
+# uwb/framing.py
+# Incremental newline framing for TCP byte streams.
+# Bytes are appended to one bytearray; a read offset and a scan offset are tracked
+# so each byte is copied in once and searched once, and complete lines are handed
+# out as memoryview slices (no per-line bytes objects, no buffer rebuilds).
+
+MAX_LINE = 64 * 1024      # longest accepted line (bytes); longer lines are dropped
+
+_WS = b" \t\r\n\x0b\x0c"
+
+
+class LineFramer:
+    """
+    feed(data) yields every complete line (without the newline) as a memoryview.
+
+    The views point into the framer's buffer and are only valid until the next
+    call to feed(): decode or copy them inside the loop, do not keep them.
+    strip=True trims ASCII whitespace and skips blank lines (like bytes.strip()).
+    A line longer than max_line is discarded up to its newline and counted in
+    self.dropped, so a misbehaving peer cannot grow the buffer without bound.
+    """
+
+    def __init__(self, max_line=MAX_LINE, strip=True):
+        self.max_line = max_line
+        self.strip = strip
+        self.buf = bytearray()
+        self.start = 0            # first unconsumed byte
+        self.scan = 0             # bytes before this are known to hold no newline
+        self.discarding = False   # inside an over-long line, skip to next newline
+        self.dropped = 0
+
+    def pending(self):
+        """Bytes buffered for the current, still incomplete line."""
+        return len(self.buf) - self.start
+
+    def reset(self):
+        self.buf = bytearray()
+        self.start = self.scan = 0
+        self.discarding = False
+
+    def feed(self, data):
+        buf = self.buf
+        try:
+            # Only the partial tail is moved, once per feed that completed lines.
+            if self.start: del buf[:self.start]
+            buf += data
+        except BufferError:
+            # a view from the previous feed is still referenced (e.g. a loop
+            # variable): leave that buffer to it and continue in a fresh one
+            self.buf = buf[self.start:] + data
+        self.scan -= self.start
+        self.start = 0
+        return self._lines()
+
+    def _lines(self):
+        buf = self.buf
+        mv = memoryview(buf)
+        try:
+            while True:
+                nl = buf.find(b"\n", self.scan)
+                if nl < 0: break
+                a, b = self.start, nl
+                self.start = self.scan = nl + 1
+                if self.discarding:
+                    self.discarding = False
+                    continue
+                if b - a > self.max_line:
+                    self.dropped += 1
+                    continue
+                if self.strip:
+                    while a < b and buf[a] in _WS: a += 1
+                    while b > a and buf[b - 1] in _WS: b -= 1
+                    if a == b: continue
+                yield mv[a:b]
+        finally:
+            mv.release()
+
+        self.scan = len(buf)
+        if self.scan - self.start > self.max_line:
+            if not self.discarding:
+                self.dropped += 1
+                self.discarding = True
+            self.start = self.scan
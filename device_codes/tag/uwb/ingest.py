@@ -0,0 +1,190 @@
+# uwb/ingest.py
+# Multi-client asyncio ingest server for tag range reports.
+# Every tag connection gets its own protocol instance (and its own framer),
+# and every decoded {"links": [...]} frame is handed on, as a list of
+# uwb.decode.Link records, tagged with the peer id.
+# Each connection is either JSON lines or binary frames (uwb/binframe.py); the
+# first byte the tag sends decides which.
+
+import asyncio, threading, time
+
+try:
+    import resource
+except ImportError:           # Windows
+    resource = None
+
+from .framing import LineFramer, MAX_LINE
+from .binframe import BinaryFramer, MAGIC
+from .decode import decode_line
+from .capture import JSON, BINARY
+
+HOST, PORT = "0.0.0.0", 8080
+BACKLOG    = 512          # pending accepts; the floor may power up many tags at once
+
+
+def raise_fd_limit():
+    """Lift the soft open-files limit to the hard one (one socket per tag)."""
+    if resource is None: return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def peer_id(transport):
+    """Stable 'ip:port' identity of a connected tag."""
+    addr = transport.get_extra_info("peername")
+    if isinstance(addr, tuple) and len(addr) >= 2:
+        return f"{addr[0]}:{addr[1]}"
+    return str(addr)
+
+
+class TagProtocol(asyncio.Protocol):
+    """One tag connection: frames JSON lines or binary frames and forwards links."""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.peer = None
+        self.framer = None        # chosen from the first byte received
+        self.binary = False
+        self.seq = None
+        self.lost = 0             # binary only: gaps in the frame sequence number
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = peer_id(transport)
+        self.server._opened(self)
+
+    def data_received(self, data):
+        srv = self.server
+        stamp = (time.monotonic(),) if srv.stamp else ()
+        if self.framer is None:
+            head = data.lstrip()
+            if not head: return
+            self.binary = head[0] == MAGIC
+            self.framer = BinaryFramer() if self.binary else LineFramer(srv.max_line)
+            data = head
+        cap = srv.capture
+        if self.binary:
+            for seq, links, raw in self.framer.feed(data):
+                if cap is not None: cap.write(self.peer, BINARY, raw)
+                if self.seq is not None:
+                    self.lost += (seq - self.seq - 1) & 0xFFFF
+                self.seq = seq
+                srv.on_frame(self.peer, links, *stamp)
+            return
+        for line in self.framer.feed(data):
+            if cap is not None: cap.write(self.peer, JSON, line)
+            links = decode_line(line)
+            if links is not None:
+                srv.on_frame(self.peer, links, *stamp)
+
+    def connection_lost(self, exc):
+        self.server._closed(self)
+
+
+class IngestServer:
+    """
+    Accepts any number of concurrent tag connections on (host, port).
+    on_frame(peer, links) is called from the server's event loop thread for every
+    decoded frame, so it must be cheap and thread-safe (e.g. queue.put).
+    capture: optional uwb.capture.CaptureWriter that receives every raw frame.
+    stamp=True passes the receive time as well: on_frame(peer, links, t_monotonic).
+    """
+
+    def __init__(self, on_frame, host=HOST, port=PORT, backlog=BACKLOG,
+                 max_line=MAX_LINE, capture=None, stamp=False, verbose=True):
+        self.on_frame = on_frame
+        self.host, self.port = host, port
+        self.backlog = backlog
+        self.max_line = max_line
+        self.capture = capture
+        self.stamp = stamp
+        self.verbose = verbose
+        self.clients = {}          # peer -> TagProtocol
+        self.dropped = 0           # bad frames / over-long lines of closed connections
+        self.lost = 0              # binary sequence gaps of closed connections
+        self.loop = None
+        self._server = None
+        self._thread = None
+
+    # ----- connection bookkeeping -----
+    def _opened(self, proto):
+        self.clients[proto.peer] = proto
+        if self.verbose: print("Client connected:", proto.peer)
+
+    def _closed(self, proto):
+        self.clients.pop(proto.peer, None)
+        if proto.framer is not None: self.dropped += proto.framer.dropped
+        self.lost += proto.lost
+        if self.verbose:
+            extra = ""
+            if proto.framer is not None and proto.framer.dropped:
+                what = "bad frames" if proto.binary else "over-long lines"
+                extra += f" ({proto.framer.dropped} {what} dropped)"
+            if proto.lost:
+                extra += f" ({proto.lost} frames lost)"
+            print("Client closed:", proto.peer + extra)
+
+    def counts(self):
+        """{clients, dropped, lost} over all connections so far."""
+        live = list(self.clients.values())
+        return {"clients": len(live),
+                "dropped": self.dropped + sum(p.framer.dropped for p in live if p.framer),
+                "lost": self.lost + sum(p.lost for p in live)}
+
+    # ----- asyncio API -----
+    async def start_serving(self):
+        self.loop = asyncio.get_running_loop()
+        raise_fd_limit()
+        self._server = await self.loop.create_server(
+            lambda: TagProtocol(self), self.host, self.port,
+            backlog=self.backlog, reuse_address=True)
+        if self.verbose: print(f"Listening on {self.host}:{self.port}")
+        return self._server
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start_serving()
+        async with self._server:
+            await self._server.serve_forever()
+
+    # ----- thread API (for Tk apps) -----
+    def start(self):
+        """Run the server on its own event loop in a daemon thread."""
+        ready = threading.Event()
+
+        async def main():
+            await self.start_serving()
+            ready.set()
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+        def run():
+            try:
+                asyncio.run(main())
+            finally:
+                ready.set()
+
+        self._thread = threading.Thread(target=run, name="uwb-ingest", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self.loop is None or self._server is None: return
+        try:                          # clients and transports belong to the loop thread
+            self.loop.call_soon_threadsafe(self._close)
+        except RuntimeError:          # loop already gone
+            return
+        if self._thread is not None: self._thread.join(1.0)
+
+    def _close(self):
+        self._server.close()
+        for proto in list(self.clients.values()):
+            proto.transport.close()
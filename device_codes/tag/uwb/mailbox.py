@@ -0,0 +1,114 @@
+# uwb/mailbox.py
+# Bounded hand-off between the ingest thread and the solver worker.
+# The worker only ever needs the newest range per (tag, anchor), so by default
+# frames of a tag that is already waiting are merged into its pending entry
+# instead of queued behind it: memory is bounded by the number of tags, and
+# after a stall the worker catches up in one pass instead of replaying backlog.
+#
+# Policies (what put() does):
+#   latest       merge into the tag's pending entry, newest range per anchor
+#                wins (counted in `overwritten`); a new tag arriving at a full
+#                mailbox evicts the tag that has waited longest (`dropped`)
+#   drop-oldest  FIFO of whole frames; when full the oldest frame is dropped
+#   block        FIFO of whole frames; when full put() waits for the worker.
+#                The ingest event loop stalls with it, so the tags' TCP windows
+#                fill up and backpressure reaches the senders (`blocked`)
+# get()/get_nowait()/task_done()/unfinished_tasks/qsize() follow queue.Queue.
+
+import queue, threading
+from collections import OrderedDict, deque
+
+LATEST, DROP_OLDEST, BLOCK = "latest", "drop-oldest", "block"
+POLICIES = (LATEST, DROP_OLDEST, BLOCK)
+MAILBOX_SIZE = 4096           # pending tags (latest) or frames (drop-oldest, block)
+
+
+class Mailbox:
+    """Items are (peer, [Link, ...], *stamps) tuples, as produced by Engine.put()."""
+
+    def __init__(self, maxsize=MAILBOX_SIZE, policy=LATEST):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown mailbox policy {policy!r}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.pending = OrderedDict() if policy == LATEST else deque()
+        self.unfinished_tasks = 0
+        self.overwritten = 0          # frames merged into an entry that was still pending
+        self.dropped = 0              # frames (or whole tag entries) thrown away when full
+        self.blocked = 0              # put() calls that had to wait
+        self.closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+
+    def qsize(self):
+        return len(self.pending)
+
+    def put(self, item):
+        with self._lock:
+            if self.closed: return
+            p = self.pending
+            if self.policy == LATEST:
+                peer, links, *stamps = item
+                e = p.get(peer)
+                if e is not None:
+                    # keep the first frame's stamps: the entry is as old as its oldest data
+                    d = e[0]
+                    for l in links: d[l.aid] = l
+                    self.overwritten += 1
+                    return
+                if len(p) >= self.maxsize:
+                    p.popitem(last=False)
+                    self.dropped += 1
+                    self.unfinished_tasks -= 1
+                p[peer] = ({l.aid: l for l in links}, stamps)
+            else:
+                if len(p) >= self.maxsize:
+                    if self.policy == DROP_OLDEST:
+                        p.popleft()
+                        self.dropped += 1
+                        self.unfinished_tasks -= 1
+                    else:
+                        self.blocked += 1
+                        while len(p) >= self.maxsize and not self.closed:
+                            self._not_full.wait()
+                        if self.closed: return
+                p.append(item)
+            self.unfinished_tasks += 1
+            self._not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        with self._not_empty:
+            if not self.pending:
+                if not block or not self._not_empty.wait_for(lambda: self.pending, timeout):
+                    raise queue.Empty
+            if self.policy == LATEST:
+                peer, (d, stamps) = self.pending.popitem(last=False)
+                return (peer, list(d.values()), *stamps)
+            item = self.pending.popleft()
+            self._not_full.notify()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def task_done(self):
+        with self._lock:
+            self.unfinished_tasks -= 1
+            if self.unfinished_tasks <= 0:
+                self._all_done.notify_all()
+
+    def join(self):
+        with self._all_done:
+            self._all_done.wait_for(lambda: self.unfinished_tasks <= 0)
+
+    def close(self):
+        """Wake and discard blocked put() calls; later puts are ignored (shutdown)."""
+        with self._lock:
+            self.closed = True
+            self._not_full.notify_all()
+
+    def counts(self):
+        return {"overwritten": self.overwritten, "mailbox_dropped": self.dropped,
+                "blocked": self.blocked}
@@ -0,0 +1,222 @@
+# uwb/metrics.py
+# Optional pipeline instrumentation. Off by default: the engine then keeps
+# metrics = None and every hook is a single `is None` test.
+#
+# Stages (latency histograms, per frame unless noted):
+#   decode   socket data_received -> decoded frame handed to the engine
+#   queue    engine.put -> taken off the frame queue by the solver worker
+#   wait     dequeued -> start of the solve pass that uses it (coalescing)
+#   solve    duration of one solve pass (per pass)
+#   publish  socket receive -> snapshot with this frame's solve published
+#   display  snapshot published -> drawn (per displayed snapshot)
+#   pixel    socket receive -> drawn, i.e. how stale the shown position is
+# "drawn" is whatever the consumer reports with displayed(): the Tk viewers call
+# it from an idle callback queued behind the canvas redraw, the CLI after
+# printing a line. Frames of snapshots that were never displayed count towards
+# the next displayed one.
+#
+# Histograms are HDR-style: log-linear buckets with 32 sub-buckets per power of
+# two, so every recorded value is kept to within ~3% at any magnitude, in a few
+# hundred counters. Each histogram has a single writer thread; readers take
+# approximate snapshots without locking.
+
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BITS = 6
+SUB = 1 << SUB_BITS
+
+LATENCIES = ("decode", "queue", "wait", "solve", "publish", "display", "pixel")
+METRICS_PORT = 9108           # default local port of the metrics endpoint
+
+
+class Histogram:
+    """Counts of non-negative integers (e.g. microseconds) in log-linear buckets."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (2*SUB)
+        self.n = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def _index(v):
+        if v < SUB: return v
+        shift = v.bit_length() - SUB_BITS
+        return SUB + (shift - 1)*(SUB >> 1) + (v >> shift) - (SUB >> 1)
+
+    @staticmethod
+    def _upper(i):
+        """Largest value that lands in bucket i."""
+        if i < SUB: return i
+        shift, sub = divmod(i - SUB, SUB >> 1)
+        shift += 1
+        return (((SUB >> 1) + sub + 1) << shift) - 1
+
+    def record(self, v):
+        v = int(v)
+        if v < 0: v = 0
+        i = self._index(v)
+        c = self.counts
+        if i >= len(c): c.extend([0] * (i + 1 - len(c)))
+        c[i] += 1
+        self.n += 1
+        self.total += v
+        if self.min is None or v < self.min: self.min = v
+        if v > self.max: self.max = v
+
+    def percentile(self, p):
+        if not self.n: return 0
+        want = max(1, int(self.n * p / 100.0 + 0.5))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= want:
+                return min(self._upper(i), self.max)
+        return self.max
+
+    def summary(self, scale=1.0):
+        """{count, mean, min, p50, p90, p99, p999, max}, values multiplied by scale."""
+        n = self.n
+        out = {"count": n, "mean": (self.total / n * scale) if n else 0.0,
+               "min": (self.min or 0) * scale}
+        for name, p in (("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9)):
+            out[name] = self.percentile(p) * scale
+        out["max"] = self.max * scale
+        return out
+
+
+class Metrics:
+    """Latency histograms (recorded in us, reported in ms), counters and sampled gauges."""
+
+    def __init__(self):
+        self.lat = {name: Histogram() for name in LATENCIES}
+        self.iterations = Histogram()      # solver iterations per tag solve (LM path)
+        self.depth = Histogram()           # frame queue depth, sampled once per solve pass
+        self.counters = {"frames": 0, "passes": 0, "solves": 0, "expired": 0, "nlos": 0,
+                         "outliers": 0}
+        self.sources = []                  # callables() -> {name: number}, merged into stats()
+        self._shown = []                   # receive times published but not displayed yet
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+
+    # ----- recording (hot path; keep it cheap) -----
+    def latency(self, stage, seconds):
+        self.lat[stage].record(seconds * 1e6)
+
+    def published(self, recv_times, t):
+        """Solver worker: snapshot published at t with frames received at recv_times."""
+        h = self.lat["publish"]
+        for r in recv_times:
+            h.record((t - r) * 1e6)
+        with self._lock:
+            self._shown.extend(recv_times)
+            if len(self._shown) > 100000:     # nobody is displaying: don't grow forever
+                del self._shown[:50000]
+
+    def displayed(self, snap=None, t=None):
+        """Consumer: the newest snapshot (optional, for the display stage) is now visible."""
+        if t is None: t = time.monotonic()
+        if snap is not None and snap.seq:
+            self.lat["display"].record((t - snap.stamp) * 1e6)
+        with self._lock:
+            recv, self._shown = self._shown, []
+        h = self.lat["pixel"]
+        for r in recv:
+            h.record((t - r) * 1e6)
+
+    # ----- reading -----
+    def stats(self):
+        """Plain dict (JSON-ready) of everything collected so far."""
+        out = {"uptime_s": time.monotonic() - self.started}
+        out.update(self.counters)
+        for fn in self.sources:
+            out.update(fn())
+        out["latency_ms"] = {k: h.summary(1e-3) for k, h in self.lat.items()}
+        out["queue_depth"] = self.depth.summary()
+        out["iterations"] = self.iterations.summary()
+        return out
+
+    def reset(self):
+        for h in self.lat.values(): h.reset()
+        self.iterations.reset()
+        self.depth.reset()
+        for k in self.counters: self.counters[k] = 0
+        self.started = time.monotonic()
+
+
+def format_stats(st):
+    """Short multi-line text for a stats panel."""
+    lines = [f"frames {st['frames']}  solves {st['solves']}  queue {st.get('queued', 0)}"
+             f" (max {st['queue_depth']['max']:.0f})",
+             f"dropped {st.get('dropped', 0) + st.get('mailbox_dropped', 0)}  lost {st.get('lost', 0)}"
+             f"  coalesced {st.get('overwritten', 0)}  expired {st.get('expired', 0)}",
+             f"rejected ranges: nlos {st.get('nlos', 0)}  outliers {st.get('outliers', 0)}",
+             f"solver iterations p50 {st['iterations']['p50']:.0f} p99 {st['iterations']['p99']:.0f}",
+             "ms        p50     p99     max"]
+    for k, s in st["latency_ms"].items():
+        if s["count"]:
+            lines.append(f"{k:8s}{s['p50']:7.2f} {s['p99']:7.2f} {s['max']:7.2f}")
+    return "\n".join(lines)
+
+
+def prometheus(st, prefix="uwb_"):
+    """The stats dict in the Prometheus text exposition format."""
+    out = []
+    for k, v in st.items():
+        if isinstance(v, (int, float)):
+            out.append(f"{prefix}{k} {v}")
+    for stage, s in st["latency_ms"].items():
+        for q in ("p50", "p90", "p99", "p999", "max"):
+            out.append(f'{prefix}latency_ms{{stage="{stage}",q="{q}"}} {s[q]}')
+        out.append(f'{prefix}latency_count{{stage="{stage}"}} {s["count"]}')
+    for name in ("queue_depth", "iterations"):
+        for q in ("p50", "p99", "max"):
+            out.append(f'{prefix}{name}{{q="{q}"}} {st[name][q]}')
+    return "\n".join(out) + "\n"
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint on its own daemon thread:
+      GET /metrics       Prometheus text     GET /metrics.json   stats() as JSON
+    """
+
+    def __init__(self, metrics, host="127.0.0.1", port=METRICS_PORT):
+        m = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics.json":
+                    body, ctype = json.dumps(m.stats()).encode(), "application/json"
+                elif self.path == "/metrics":
+                    body, ctype = prometheus(m.stats()).encode(), "text/plain; version=0.0.4"
+                else:
+                    return self.send_error(404)
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="uwb-metrics",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,37 @@
+# uwb/quality.py
+# Per-link quality -> range weight for the solver. tag.ino sends, with every
+# range, the total received power (rssi), the first-path power (fpPower) and the
+# DW1000's receive quality. In line of sight the first path carries most of the
+# energy; when it is blocked (NLOS) the range comes from a later, longer path
+# and the first path is much weaker than the total, so the gap rssi - fpPower
+# grows: below ~6 dB the link is most likely LOS, above ~10 dB most likely NLOS.
+#   gap <= LOS_GAP            weight 1
+#   LOS_GAP .. NLOS_GAP       falling linearly to MIN_WEIGHT
+#   gap > NLOS_GAP            0: rejected, as long as the tag keeps MIN_KEEP other ranges
+# A receive quality below QUALITY_REF scales the weight down further.
+# Links without metrics (older firmware, or zeros in binary frames) weigh 1, and so
+# does a metric that is not a finite number (links can come from any Engine.put caller).
+
+LOS_GAP     = 6.0             # dB
+NLOS_GAP    = 10.0            # dB
+MIN_WEIGHT  = 0.2             # weight at NLOS_GAP, and of a rejected range that has to be kept
+QUALITY_REF = 100.0           # receive quality at (or above) which it does not lower the weight
+MIN_KEEP    = 3               # never reject ranges below this many left for a tag
+
+
+def _finite(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool) and v - v == 0
+
+
+def link_weight(link):
+    """Weight in [0, 1] of a uwb.decode.Link from its rssi/fp/quality; 0 = likely NLOS."""
+    w = 1.0
+    rssi, fp, q = link.rssi, link.fp, link.quality
+    if rssi and fp and _finite(rssi) and _finite(fp):
+        gap = rssi - fp
+        if gap > NLOS_GAP: return 0.0
+        if gap > LOS_GAP:
+            w = 1.0 - (1.0 - MIN_WEIGHT) * (gap - LOS_GAP) / (NLOS_GAP - LOS_GAP)
+    if q and _finite(q) and q < QUALITY_REF:
+        w *= max(q / QUALITY_REF, MIN_WEIGHT)
+    return w
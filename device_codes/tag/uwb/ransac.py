@@ -0,0 +1,126 @@
+# uwb/ransac.py
+# Consensus (RANSAC) front end for tags with many anchors (NumPy).
+# One multipath range can pull the Huber-weighted LM off course and make it run
+# to MAX_ITERS. Before the refinement solve, every tag with RANSAC_MIN+ ranges
+# is tried on minimal anchor subsets (3 in 2-D, 4 in 3-D): each subset gives a
+# closed-form fix (2-D: solved directly; 3-D: the linear fix of uwb/batch.py),
+# which is scored against all of the tag's ranges with a truncated squared
+# residual (MSAC). The best fix is refitted on its inliers once, and only the
+# ranges within RANSAC_TOL of that refit go on to the solver. All hypotheses of
+# all tags are scored in one pass of array operations. Tags whose ranges all
+# agree with their all-anchor fix already (the common case) skip the hypotheses.
+# Subsets: every one when a tag has few enough anchors (8 anchors: 56 triples),
+# else RANSAC_HYP random ones.
+
+import itertools, math
+from functools import lru_cache
+
+import numpy as np
+
+from .batch import _linear_fix, _linear_fix3d
+
+RANSAC_MIN = 5                # ranges a tag needs before outliers can be outvoted
+RANSAC_HYP = 64               # hypotheses per tag (all subsets if there are fewer)
+RANSAC_TOL = 0.4              # m; a range this close to a hypothesis' fix is an inlier
+
+
+@lru_cache(maxsize=32)
+def _subsets(n, k):
+    return np.array(list(itertools.combinations(range(n), k)), dtype=np.intp).reshape(-1, k)
+
+
+def _fix(P, R, M):
+    """Closed-form fix per row of (T, n, D) points, NaN where degenerate."""
+    W = M.astype(float)
+    if P.shape[2] == 2:
+        return _linear_fix(P, R, M, W)
+    return _linear_fix3d(P, R, M, W, np.full(len(P), np.nan))
+
+
+def _fix_triples(P, R):
+    """
+    2-D fixes of (..., 3, 2) anchor triples: the two equations left after subtracting
+    the first anchor's, solved directly (NaN where collinear).
+    """
+    a, b, c = P[..., 0, :], P[..., 1, :], P[..., 2, :]
+    ra, rb, rc = R[..., 0], R[..., 1], R[..., 2]
+    u, v = 2*(b - a), 2*(c - a)
+    sa = (a*a).sum(-1) - ra*ra
+    bu, bv = (b*b).sum(-1) - rb*rb - sa, (c*c).sum(-1) - rc*rc - sa
+    det = u[..., 0]*v[..., 1] - u[..., 1]*v[..., 0]
+    bad = det*det <= 1e-9 * ((u*u).sum(-1) + (v*v).sum(-1))**2
+    det = np.where(bad, np.nan, det)
+    return np.stack(((bu*v[..., 1] - bv*u[..., 1])/det, (u[..., 0]*bv - v[..., 0]*bu)/det), axis=-1)
+
+
+def _residuals(P, R, X):
+    """|range - distance| of (T, N) ranges to (T, H, D) fixes: (T, H, N)."""
+    if P.shape[2] == 2:
+        d = np.hypot(X[:, :, None, 0] - P[:, None, :, 0], X[:, :, None, 1] - P[:, None, :, 1])
+    else:
+        d = np.sqrt(((X[:, :, None, :] - P[:, None, :, :])**2).sum(axis=3))
+    return np.abs(d - np.nan_to_num(R)[:, None, :])
+
+
+def consensus_mask(points, ranges, mask=None, tol=RANSAC_TOL, hyp=RANSAC_HYP,
+                   min_anchors=RANSAC_MIN, rng=None):
+    """
+    points (T,N,D) with D = 2 or 3, ranges (T,N) (NaN = not heard), mask (T,N)
+    optional. Returns the (T,N) inlier mask; rows with fewer than min_anchors
+    ranges, or without a consensus of at least D+1 ranges, keep every range.
+    """
+    P = np.asarray(points, float)
+    R = np.asarray(ranges, float)
+    M = np.isfinite(R)
+    if mask is not None:
+        M &= np.asarray(mask, bool)
+    out = M.copy()
+    n = M.sum(axis=1)
+    rows = np.flatnonzero(n >= max(min_anchors, P.shape[2] + 1))
+    if not rows.size: return out
+    X = _fix(P[rows], R[rows], M[rows])
+    res = _residuals(P[rows], R[rows], np.nan_to_num(X)[:, None, :])[:, 0]
+    clean = np.isfinite(X).all(axis=1) & ~(M[rows] & (res >= tol)).any(axis=1)
+    rows = rows[~clean]
+    if not rows.size: return out
+    P, R, M, n = P[rows], R[rows], M[rows], n[rows]
+    T, N, D = P.shape
+    k = D + 1
+
+    # hypotheses: positions into each row's anchors, heard ones first
+    order = np.argsort(~M, axis=1, kind="stable")
+    if math.comb(N, k) <= hyp:
+        idx = np.broadcast_to(_subsets(N, k), (T, math.comb(N, k), k))
+        valid = idx.max(axis=2) < n[:, None]
+    else:
+        rng = rng if rng is not None else np.random.default_rng()
+        idx = np.sort((rng.random((T, hyp, k)) * n[:, None, None]).astype(np.intp), axis=2)
+        valid = (np.diff(idx, axis=2) > 0).all(axis=2)
+    H = idx.shape[1]
+    sel = order[np.arange(T)[:, None, None], idx]                    # (T, H, k) anchor columns
+    t = np.arange(T)[:, None, None]
+    if D == 2:
+        X = _fix_triples(P[t, sel], R[t, sel])
+    else:
+        X = _fix(P[t, sel].reshape(T*H, k, D), R[t, sel].reshape(T*H, k),
+                 np.ones((T*H, k), bool)).reshape(T, H, D)
+    valid &= np.isfinite(X).all(axis=2)
+    X = np.where(valid[..., None], X, 0.0)
+
+    # MSAC score, then one refit of the best hypothesis on its inliers
+    res = _residuals(P, R, X)
+    cost = np.where(M[:, None, :], np.minimum(res, tol)**2, 0.0).sum(axis=2)
+    best = np.where(valid, cost, np.inf).argmin(axis=1)
+    inl = M & (res[np.arange(T), best] < tol)
+    ok = valid.any(axis=1) & (inl.sum(axis=1) >= k)
+    if not ok.any(): return out
+    good = np.flatnonzero(ok)
+    Xr = _fix(P[good], R[good], inl[good])
+    fin = np.isfinite(Xr).all(axis=1)
+    good, Xr = good[fin], Xr[fin]
+    res = _residuals(P[good], R[good], Xr[:, None, :])[:, 0]
+    refit = M[good] & (res < tol)
+    keep = refit.sum(axis=1) >= k
+    inl[good[keep]] = refit[keep]
+    out[rows[ok]] = inl[ok]
+    return out
@@ -0,0 +1,118 @@
+# uwb/render.py
+# Retained-mode drawing on a Tk canvas, and keyed row reconciliation for the
+# sidebar Treeview/Listbox widgets.
+# Items are created once per key and afterwards only moved with coords() or
+# restyled with itemconfigure() when their values actually change; items that
+# were not drawn in a frame are deleted. Static layers (grid, axes) are rebuilt
+# only when the view transform changes. Rows work the same way: new ids are
+# inserted, changed cells are set, vanished ids are deleted.
+
+STATIC = "static"
+
+
+class RetainedCanvas:
+    """
+    Per frame:  rc.begin(); rc.static(view, build); rc.draw(key, "line", coords, layer, **opts) ...; rc.end()
+    layers: canvas tags in bottom-to-top order; restacked only when new items appear.
+    """
+
+    def __init__(self, canvas, layers=()):
+        self.c = canvas
+        self.layers = tuple(layers)
+        self.items = {}           # key -> [item id, coords, options]
+        self._seen = set()
+        self._created = False
+        self._view = None
+
+    def begin(self):
+        self._seen = set()
+        self._created = False
+
+    def static(self, view, build):
+        """Call build() (which must tag its items with STATIC) only when `view` changed."""
+        if view == self._view: return
+        self._view = view
+        self.c.delete(STATIC)
+        build()
+        self.c.tag_lower(STATIC)
+
+    def draw(self, key, kind, coords, layer=None, **opts):
+        coords = tuple(coords)
+        self._seen.add(key)
+        it = self.items.get(key)
+        if it is None:
+            iid = getattr(self.c, "create_" + kind)(*coords, tags=(layer,) if layer else (), **opts)
+            self.items[key] = [iid, coords, opts]
+            self._created = True
+            return iid
+        iid, old_coords, old_opts = it
+        if coords != old_coords:
+            self.c.coords(iid, *coords)
+            it[1] = coords
+        if opts != old_opts:
+            changed = {k: v for k, v in opts.items() if old_opts.get(k) != v}
+            if changed: self.c.itemconfigure(iid, **changed)
+            it[2] = opts
+        return iid
+
+    def end(self):
+        for key in [k for k in self.items if k not in self._seen]:
+            self.c.delete(self.items.pop(key)[0])
+        if self._created:
+            for layer in self.layers:
+                self.c.tag_raise(layer)
+
+    def clear(self):
+        self.c.delete("all")
+        self.items.clear()
+        self._view = None
+
+
+class TreeRows:
+    """Keep a ttk.Treeview in sync with an ordered list of (iid, values) rows."""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.columns = tuple(tree["columns"])
+        self.rows = {}            # iid -> values currently shown
+        self.order = []
+
+    def update(self, rows):
+        t = self.tree
+        rows = [(iid, tuple(vals)) for iid, vals in rows]
+        new = dict(rows)
+        for iid in self.order:
+            if iid not in new: t.delete(iid)
+        order = [iid for iid in self.order if iid in new]
+        for iid, vals in rows:
+            old = self.rows.get(iid)
+            if old is None:
+                t.insert("", "end", iid=iid, values=vals)
+                order.append(iid)
+            elif old != vals:
+                for col, o, v in zip(self.columns, old, vals):
+                    if o != v: t.set(iid, col, v)
+        want = [iid for iid, _ in rows]
+        if order != want:
+            for i, iid in enumerate(want):
+                t.move(iid, "", i)
+        self.rows, self.order = new, want
+
+
+class ListRows:
+    """Keep a tk.Listbox in sync with a list of strings, touching only changed lines."""
+
+    def __init__(self, listbox):
+        self.lb = listbox
+        self.lines = []
+
+    def update(self, lines):
+        lb, old = self.lb, self.lines
+        for i, line in enumerate(lines):
+            if i >= len(old):
+                lb.insert("end", line)
+            elif old[i] != line:
+                lb.delete(i); lb.insert(i, line)
+        if len(old) > len(lines):
+            lb.delete(len(lines), "end")
+        self.lines = list(lines)
@@ -0,0 +1,541 @@
+# uwb/shards.py
+# Solver pool over several processes, for more tags than one core can solve.
+# Tag ids are hashed (crc32) onto `shards` worker processes; each runs an
+# ordinary SolverWorker over its own tags only, so a tag's warm state (previous
+# fix, tracking filter, selected anchors) lives in one process for good. The
+# ingest process talks to each shard over two single-producer/single-consumer
+# rings in multiprocessing.shared_memory, one per direction, packed with struct
+# (no pickling on the hot path):
+#   in   frames (tag id + links), anchor table / scale changes, stop
+#   out  per solve pass: each re-solved tag's fix, filtered position and ranges,
+#        range changes of tags that were not re-solved, the shard's counters
+# A ring record is a batch of such messages. A counting semaphore per ring
+# counts the complete records: it is the consumer's wakeup and, being a full
+# memory barrier on both sides, makes the record's bytes visible before the
+# count. ShardPool merges the shards' passes into the same Snapshot that a
+# SolverWorker publishes, so the Engine and its consumers work unchanged. The
+# fixes are close to one SolverWorker's, not bit for bit the same: every shard
+# has its own pass timing (the tracking filters' dt, warm starts) and its own
+# set of tags per batch solve. With clock="capture" the frames carry their
+# recorded time, every shard runs on it and each shard pass becomes a snapshot
+# of its own, so each tag's fixes repeat exactly from run to run; only the
+# order in which passes of different shards are published may vary.
+# Latency stages that happen inside the shards (wait, solve) and the iteration
+# histogram are not collected with metrics on; the counters are summed.
+
+import json, multiprocessing, os, queue, signal, struct, threading, time, traceback, zlib
+from collections import deque
+from multiprocessing.shared_memory import SharedMemory
+
+from .decode import Link
+from .metrics import Metrics
+from .worker import SolverWorker, Snapshot, EMPTY, CAPTURE
+
+SHARDS     = 2                # worker processes of --shards without a number
+RING_BYTES = 1 << 22          # per ring and direction; one record takes at most a quarter
+FULL_WAIT  = 0.001            # s between retries while a ring is full
+
+_TAIL = struct.Struct("<Q")   # header: bytes the consumer has ever taken out
+_LEN  = struct.Struct("<I")
+_DATA = 64                    # ring data starts after the header's cache line
+_WRAP = 0xFFFFFFFF            # record length meaning "continue at the start"
+
+# Tag and anchor ids travel as one "\0"-joined names field, numbers as a block of
+# f64 that one iter_unpack/unpack_from decodes.
+# in:  b"F" link-count names-len at | tag id, aids | per link: range rssi fp quality (0 = not sent)
+#      b"C" json-len | {"anchors": {aid: [...]}, "scales": {aid: s}}       b"Q" stop
+#      b"T" at (capture clock only: move the shard's clock to `at`)
+# at: the frame's capture-clock time (0 with the live clock)
+_FRAME  = struct.Struct("<cHHd")
+_LINK   = struct.Struct("<dddd")
+_CONFIG = struct.Struct("<cI")
+_TICK   = struct.Struct("<cd")
+# out: record header: in-records consumed, newest pass stamp, then COUNTERS deltas, then entries:
+#      b"P" est-dims smooth-dims cov-count range-count names-len | tag id, aids
+#           | est, smooth, cov, ranges
+#      b"R" (ranges only, the tag was not re-solved) and b"G" (no ranges left) likewise
+_OUT   = struct.Struct("<QdIIIII")
+_ENTRY = struct.Struct("<cBBBHH")
+COUNTERS = ("passes", "solves", "expired", "nlos", "outliers")
+
+
+class Ring:
+    """
+    Single-producer/single-consumer queue of byte records in a SharedMemory block.
+    The producer keeps its write position to itself; the consumer publishes how
+    far it has read in the header, which is all the producer needs to know the
+    free space. `wake` (optional) is a semaphore shared by several rings, released
+    with every record, for a consumer that waits on all of them.
+    """
+
+    def __init__(self, size=RING_BYTES, name=None, items=None, wake=None):
+        self.size = size
+        self.owner = os.getpid() if name is None else None    # forked children don't unlink
+        if name is None:
+            self.shm = SharedMemory(create=True, size=_DATA + size)
+            _TAIL.pack_into(self.shm.buf, 0, 0)
+        else:
+            self.shm = _attach(name)
+        self.buf = self.shm.buf
+        self.items = items if items is not None else multiprocessing.Semaphore(0)
+        self.wake = wake
+        self.head = 0                 # producer side only
+        self.tail = 0                 # consumer side only
+        self.limit = size // 4
+
+    def __reduce__(self):            # for start methods that pickle Process arguments
+        return Ring, (self.size, self.shm.name, self.items, self.wake)
+
+    def put(self, data):
+        """Append one record; False if the ring has no room for it right now."""
+        n = len(data)
+        if n > self.limit: raise ValueError(f"record of {n} bytes, ring takes {self.limit}")
+        need = (_LEN.size + n + 7) & ~7
+        pos = self.head % self.size
+        skip = self.size - pos if self.size - pos < need else 0
+        if self.head + skip + need - _TAIL.unpack_from(self.buf, 0)[0] > self.size:
+            return False
+        if skip:
+            _LEN.pack_into(self.buf, _DATA + pos, _WRAP)
+            self.head += skip
+            pos = 0
+        o = _DATA + pos
+        _LEN.pack_into(self.buf, o, n)
+        self.buf[o + _LEN.size:o + _LEN.size + n] = data
+        self.head += need
+        self.items.release()
+        if self.wake is not None: self.wake.release()
+        return True
+
+    def get(self, timeout=None):
+        """The next record (bytes), waiting up to timeout s (0 = don't wait); None if none came."""
+        if not (self.items.acquire(False) if timeout == 0 else self.items.acquire(True, timeout)):
+            return None
+        pos = self.tail % self.size
+        n = _LEN.unpack_from(self.buf, _DATA + pos)[0]
+        if n == _WRAP:
+            self.tail += self.size - pos
+            pos = 0
+            n = _LEN.unpack_from(self.buf, _DATA)[0]
+        o = _DATA + pos + _LEN.size
+        data = bytes(self.buf[o:o + n])
+        self.tail += (_LEN.size + n + 7) & ~7
+        _TAIL.pack_into(self.buf, 0, self.tail)
+        return data
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner == os.getpid(): self.shm.unlink()
+
+
+def _attach(name):
+    # Children share the parent's resource tracker, which unlinks the block if the
+    # parent dies without doing it; their own attach must not register it again.
+    try:
+        return SharedMemory(name, track=False)           # Python 3.13+
+    except TypeError:
+        return SharedMemory(name)                        # registered twice = once
+
+
+def _put(ring, data, stop):
+    """ring.put(), waiting while it is full; False if stop was set meanwhile."""
+    while not ring.put(data):
+        if stop(): return False
+        time.sleep(FULL_WAIT)
+    return True
+
+
+def _records(msgs, limit):
+    """Join messages into records of at most `limit` bytes."""
+    out, part, size = [], [], 0
+    for m in msgs:
+        if size + len(m) > limit and part:
+            out.append(b"".join(part))
+            part, size = [], 0
+        part.append(m)
+        size += len(m)
+    out.append(b"".join(part))
+    return out
+
+
+# ----- codec -----
+def _metric(v):
+    # anything but a finite number is sent as 0 (not sent), as link_weight would ignore it
+    return v if v and isinstance(v, (int, float)) and not isinstance(v, bool) and v - v == 0 else 0
+
+
+def pack_frame(peer, links, at=0.0):
+    names = "\0".join([peer, *(l.aid for l in links)]).encode()
+    return b"".join([_FRAME.pack(b"F", len(links), len(names), at), names,
+                     *(_LINK.pack(l.range, _metric(l.rssi), _metric(l.fp), _metric(l.quality))
+                       for l in links)])
+
+
+def pack_config(anchors, scales):
+    body = json.dumps({"anchors": {aid: list(a) for aid, a in anchors.items()},
+                       "scales": scales}).encode()
+    return _CONFIG.pack(b"C", len(body)) + body
+
+
+def _pack_entry(kind, peer, est=(), smooth=(), cov=None, ranges=None):
+    ranges = ranges or {}
+    cov = cov or ()
+    names = "\0".join([peer, *ranges]).encode()
+    v = (*est, *smooth, *cov, *ranges.values())
+    return b"".join([_ENTRY.pack(kind, len(est), len(smooth), len(cov), len(ranges), len(names)),
+                     names, struct.pack(f"<{len(v)}d", *v)])
+
+
+def _unpack_entries(b, o):
+    """Yield (kind, peer, est, smooth, cov or None, ranges) of an out record from offset o."""
+    while o < len(b):
+        kind, de, ds, dc, nr, n = _ENTRY.unpack_from(b, o)
+        o += _ENTRY.size
+        peer, *aids = b[o:o + n].decode().split("\0")
+        o += n
+        v = struct.unpack_from(f"<{de + ds + dc + nr}d", b, o)
+        o += 8 * len(v)
+        c = de + ds
+        yield kind, peer, v[:de], v[de:c], v[c:c + dc] or None, dict(zip(aids, v[c + dc:]))
+
+
+# ----- shard process -----
+class _Inbox:
+    """The queue.Queue that a shard's SolverWorker reads frames from, fed by its in-ring."""
+
+    def __init__(self, ring, capture=False):
+        self.ring = ring
+        self.capture = capture        # items carry the capture clock, as SolverWorker wants them
+        self.worker = None
+        self.items = deque()
+        self.records = 0              # ring records taken so far
+        self.closed = False
+
+    @property
+    def unfinished_tasks(self):
+        return len(self.items)
+
+    def qsize(self):
+        return len(self.items)
+
+    def get(self, block=True, timeout=None):
+        while not self.items:
+            b = self.ring.get(timeout if block else 0)
+            if b is None: raise queue.Empty
+            self.records += 1
+            self._unpack(b)
+        return self.items.popleft()
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def task_done(self):
+        pass
+
+    def _unpack(self, b):
+        o = 0
+        while o < len(b):
+            kind = b[o:o + 1]
+            if kind == b"F":
+                _, count, n, at = _FRAME.unpack_from(b, o)
+                o += _FRAME.size
+                peer, *aids = b[o:o + n].decode().split("\0")
+                o += n
+                end = o + count * _LINK.size
+                links = [Link(aid, r, None, rssi, fp, q) for aid, (r, rssi, fp, q)
+                         in zip(aids, _LINK.iter_unpack(b[o:end]))]
+                self.items.append((peer, links, None, None, at) if self.capture else (peer, links))
+                o = end
+            elif kind == b"T":
+                self.items.append((None, (), None, None, _TICK.unpack_from(b, o)[1]))
+                o += _TICK.size
+            elif kind == b"C":
+                n = _CONFIG.unpack_from(b, o)[1]
+                o += _CONFIG.size
+                cfg = json.loads(b[o:o + n])
+                o += n
+                self.worker.set_anchors({aid: tuple(a) for aid, a in cfg["anchors"].items()})
+                self.worker.set_scales(cfg["scales"])
+            else:                     # b"Q"
+                self.closed = True
+                return
+
+
+class _Outbox:
+    """Sends a shard worker's passes (only what changed) back over its out-ring."""
+
+    def __init__(self, ring, inbox, metrics):
+        self.ring = ring
+        self.inbox = inbox
+        self.metrics = metrics
+        self.acked = 0                # inbox records covered by the last record sent
+        self.stamp = 0.0              # of the newest pass
+        self.sent = {}                # {peer: ranges as last sent}
+        self.counts = dict.fromkeys(COUNTERS, 0)
+
+    def publish(self, snap):
+        self.stamp = snap.stamp
+        msgs = []
+        for peer, rs in snap.ranges.items():
+            if peer in snap.updated:
+                msgs.append(_pack_entry(b"P", peer, snap.tags[peer], snap.smooth[peer],
+                                        snap.cov.get(peer), rs))
+            elif rs != self.sent.get(peer):
+                msgs.append(_pack_entry(b"R", peer, ranges=rs))
+            else:
+                continue
+            self.sent[peer] = rs
+        for peer in [p for p in self.sent if p not in snap.ranges]:
+            msgs.append(_pack_entry(b"G", peer))
+            del self.sent[peer]
+        self.send(msgs)
+
+    def send(self, msgs):
+        """Counters and the acknowledgement go in the last record of the pass."""
+        c = self.metrics.counters if self.metrics is not None else self.counts
+        delta = [c[k] - self.counts[k] for k in COUNTERS]
+        self.counts = {k: c[k] for k in COUNTERS}
+        recs = _records(msgs, self.ring.limit - _OUT.size)
+        stop = lambda: self.inbox.closed
+        # frames of the newest record may still wait behind a pass on the capture clock
+        done = self.inbox.records - (1 if self.inbox.items else 0)
+        for i, rec in enumerate(recs):
+            last = i == len(recs) - 1
+            head = _OUT.pack(done if last else self.acked, self.stamp,
+                             *(delta if last else [0] * len(COUNTERS)))
+            if not _put(self.ring, head + rec, stop): return
+        self.acked = done
+
+
+def _shard_main(inbox, outbox, anchors, kw, metrics, parent):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)     # Ctrl-C is the parent's; it sends b"Q"
+    frames = _Inbox(inbox, kw.get("clock") == CAPTURE)
+    w = SolverWorker(frames, anchors, metrics=Metrics() if metrics else None, **kw)
+    frames.worker = w
+    out = _Outbox(outbox, frames, w.metrics)
+    w.listeners.append(out.publish)
+    while not frames.closed and os.getppid() == parent:   # nobody to send b"Q" any more
+        w.step()
+        # input that caused no solve (yet) still has to be acknowledged for idle()
+        if frames.records != out.acked and w.idle(): out.send(())
+    inbox.close()
+    outbox.close()
+
+
+class _Shard:
+    def __init__(self, wake):
+        self.inbox = Ring()
+        self.outbox = Ring(wake=wake)
+        self.proc = None
+        self.sent = 0                 # records put into inbox
+        self.acked = 0                # ... of which the shard has solved and published
+        self.stamps = deque()         # metrics only: (record number, [t_recv, ...])
+
+
+class ShardPool:
+    """
+    Drop-in for SolverWorker (the Engine uses either) that solves on `shards`
+    processes. frames, anchors, metrics and scales as for SolverWorker; every
+    other SolverWorker option is passed on to the shards' workers (a custom
+    `solve` or tracker factory has to be picklable under the spawn start method).
+    Snapshot.ranges, tags and smooth are merged from all shards.
+    """
+
+    def __init__(self, frames, anchors, shards=SHARDS, metrics=None, scales=None, **kw):
+        self.frames = frames
+        self.anchors = dict(anchors)
+        self.scales = dict(scales or {})
+        self.metrics = metrics
+        self.tag_height = kw.get("tag_height")
+        self.auto_add = kw.get("auto_add", False)
+        self.kw = kw
+        self.capture = kw.get("clock") == CAPTURE
+        self.snapshot = EMPTY
+        self.listeners = []
+        self.last_peer = None
+        self.ranges = {}              # merged from the shards; inner dicts are never mutated
+        self.tags = {}
+        self.smooth = {}
+        self.cov = {}
+
+        self._wake = multiprocessing.Semaphore(0)
+        self._shards = [_Shard(self._wake) for _ in range(max(1, int(shards)))]
+        self._route = {}              # {peer: shard}
+        self._busy = False            # dispatcher holds frames not yet in a ring
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()   # the in-rings have one producer at a time
+        self._stop = threading.Event()
+        self._threads = []
+
+    # ----- called from other threads (as SolverWorker) -----
+    def set_anchors(self, anchors):
+        with self._lock:
+            self.anchors = dict(anchors)
+        self._configure()
+
+    def update_anchors(self, changes, removed=()):
+        with self._lock:
+            self.anchors.update(changes)
+            for aid in removed:
+                self.anchors.pop(aid, None)
+        self._configure()
+
+    def set_scales(self, scales):
+        with self._lock:
+            self.scales = dict(scales)
+        self._configure()
+
+    def anchor_table(self):
+        with self._lock:
+            return dict(self.anchors)
+
+    def idle(self):
+        return (self.frames.unfinished_tasks == 0 and not self._busy
+                and all(s.acked == s.sent for s in self._shards))
+
+    def start(self):
+        for s in self._shards:        # processes first, before this process has more threads
+            s.proc = multiprocessing.Process(
+                target=_shard_main, name="uwb-shard", daemon=True,
+                args=(s.inbox, s.outbox, self.anchor_table(), dict(self.kw, scales=self.scales),
+                      self.metrics is not None, os.getpid()))
+            s.proc.start()
+        for name, fn in (("uwb-dispatch", self._dispatch), ("uwb-collect", self._collect)):
+            t = threading.Thread(target=fn, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        """Stop the shards and free the rings (waits up to ~2 s for the processes)."""
+        if self._stop.is_set(): return
+        self._stop.set()
+        for t in self._threads:
+            t.join(1.0)
+        try:
+            with self._send_lock:
+                for s in self._shards:
+                    if s.proc is not None: s.inbox.put(b"Q")
+            for s in self._shards:
+                if s.proc is None: continue
+                s.proc.join(2.0)
+                if s.proc.is_alive(): s.proc.terminate()
+        finally:
+            for s in self._shards:
+                s.inbox.close()
+                s.outbox.close()
+
+    # ----- dispatcher thread: frames -> in-rings -----
+    def _configure(self):
+        with self._lock:
+            msg = pack_config(self.anchors, self.scales)
+        self._broadcast(msg)
+
+    def _broadcast(self, msg):
+        with self._send_lock:
+            for s in self._shards:
+                if _put(s.inbox, msg, self._stop.is_set): s.sent += 1
+
+    def _shard_of(self, peer):
+        s = self._route.get(peer)
+        if s is None:
+            s = self._route[peer] = self._shards[zlib.crc32(peer.encode()) % len(self._shards)]
+        return s
+
+    def _dispatch(self):
+        m = self.metrics
+        n = len(self._shards)
+        while not self._stop.is_set():
+            try:
+                item = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._busy = True
+            batches = {s: [] for s in self._shards}
+            recv = {s: [] for s in self._shards} if m is not None else None
+            taken = 0
+            new = {}
+            try:
+                while True:
+                    peer, links, *stamps = item
+                    at = 0.0
+                    if self.capture:
+                        t, tq, at = stamps
+                        stamps = (t, tq) if tq is not None else ()
+                    if peer is None:  # capture clock tick, in order behind every shard's frames
+                        for msgs in batches.values(): msgs.append(_TICK.pack(b"T", at))
+                        taken += 1
+                        item = self.frames.get_nowait()
+                        continue
+                    s = self._shard_of(peer) if n > 1 else self._shards[0]
+                    batches[s].append(pack_frame(peer, links, at))
+                    if self.auto_add:
+                        for l in links:
+                            if l.aid not in self.anchors: new[l.aid] = (0.0, 0.0, 0.0)
+                    if stamps:
+                        now = time.monotonic()
+                        m.lat["queue"].record((now - stamps[1]) * 1e6)
+                        m.counters["frames"] += 1
+                        recv[s].append(stamps[0])
+                    self.last_peer = peer
+                    taken += 1
+                    item = self.frames.get_nowait()
+            except queue.Empty:
+                pass
+            if new:
+                with self._lock:
+                    for aid, a in new.items(): self.anchors.setdefault(aid, a)
+            with self._send_lock:
+                for s, msgs in batches.items():
+                    for rec in (_records(msgs, s.inbox.limit) if msgs else ()):
+                        if not _put(s.inbox, rec, self._stop.is_set): break
+                        s.sent += 1
+                    if recv is not None and recv[s]:
+                        s.stamps.append((s.sent, recv[s]))
+            for _ in range(taken):
+                self.frames.task_done()
+            self._busy = False
+
+    # ----- collector thread: out-rings -> merged snapshot -----
+    def _collect(self):
+        while not self._stop.is_set():
+            if not self._wake.acquire(True, 0.5): continue
+            updated, acks, recv = set(), [], []
+            for s in self._shards:
+                while True:
+                    b = s.outbox.get(0)
+                    if b is None: break
+                    ack, t, *counts = _OUT.unpack_from(b)
+                    if self.metrics is not None:
+                        for k, v in zip(COUNTERS, counts): self.metrics.counters[k] += v
+                    for kind, peer, est, smooth, cov, ranges in _unpack_entries(b, _OUT.size):
+                        if kind == b"G":   # expired in the shard: gone from the snapshot
+                            for d in (self.ranges, self.tags, self.smooth, self.cov): d.pop(peer, None)
+                            continue
+                        self.ranges[peer] = ranges
+                        if kind == b"P":
+                            self.tags[peer] = est
+                            self.smooth[peer] = smooth
+                            if cov: self.cov[peer] = cov
+                            updated.add(peer)
+                    acks.append((s, ack))
+                    while s.stamps and s.stamps[0][0] <= ack:
+                        recv.extend(s.stamps.popleft()[1])
+                    if self.capture:  # a snapshot per shard pass: no fix of a tag is merged away
+                        self._publish(t, updated, acks, recv)
+                        updated, acks, recv = set(), [], []
+            if acks: self._publish(time.monotonic(), updated, acks, recv)
+
+    def _publish(self, stamp, updated, acks, recv):
+        self.snapshot = Snapshot(self.snapshot.seq + 1, stamp, self.anchor_table(),
+                                 dict(self.ranges), dict(self.tags), dict(self.smooth),
+                                 self.last_peer, frozenset(updated), dict(self.cov))
+        if self.metrics is not None: self.metrics.published(recv, time.monotonic())
+        for fn in self.listeners:
+            try:
+                fn(self.snapshot)
+            except Exception:         # as in SolverWorker: the collector must keep going
+                traceback.print_exc()
+        for s, ack in acks:
+            s.acked = max(s.acked, ack)
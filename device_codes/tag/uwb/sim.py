@@ -0,0 +1,313 @@
+# uwb/sim.py
+# Synthetic tags, a localhost stand-in for ESP32 hardware when load-testing the
+# host side. Every virtual tag opens its own TCP connection and streams range
+# reports the way tag.ino does (JSON lines, or binary frames with --binary)
+# while moving along a trajectory over the anchor layout. Ranges get Gaussian
+# noise, occasional positive NLOS bias and per-link dropouts; a link that was
+# not refreshed keeps being reported with its last value until it is 2 s old,
+# as on the tag.
+#   python -m uwb.sim --tags 0 --grid 4 3 10 --dump-anchors a.json
+#   python -m uwb --anchors a.json            # in another shell
+#   python -m uwb.sim --tags 2000 --rate 10 --anchors a.json --procs 4
+#   python -m uwb.sim --tags 20 --anchors a.json --trajectory walk --truth truth.jsonl
+#   python -m uwb.sim --tags 0 --anchor-height 2.8 --dump-anchors a3d.json   # 3-D layout
+#   python -m uwb.sim --tags 20 --anchors a3d.json --tag-height 1.0   # tags at waist level
+# --truth writes the true positions as {"t", "tag", "x", "y"} lines, with the
+# same monotonic clock and the same "ip:port" tag ids as the tracker's output.
+
+import argparse, asyncio, json, math, multiprocessing, random, signal, time
+from collections import namedtuple
+
+from .binframe import encode_frame
+from .decode import Link
+from .engine import load_anchors
+from .ingest import PORT, raise_fd_limit
+
+RATE_HZ   = 2.0           # tag.ino sends a report every 500 ms
+STALE_S   = 2.0           # ... with every link refreshed in the last 2 s
+FIRST_AID = 0x1781
+SPEED     = 2.0           # m/s along the trajectory
+
+# sigma: range noise (m) | nlos: chance a measurement is NLOS | nlos_bias: mean extra
+# path (m, exponential) | dropout: chance a link is not refreshed | max_range (m)
+Noise = namedtuple("Noise", "sigma nlos nlos_bias dropout max_range")
+NOISE = Noise(0.05, 0.02, 0.6, 0.05, 45.0)
+
+STATS = ("connected", "failed", "errors", "frames", "bytes", "late")
+
+
+# ----- layout -----
+def grid_layout(nx, ny, spacing, z=None):
+    """nx * ny anchors on a square grid, ids counting up from 0x1781; z: mounting height."""
+    h = () if z is None else (z,)
+    return {"0x%04X" % (FIRST_AID + j*nx + i): (i*spacing, j*spacing, 0.0) + h
+            for j in range(ny) for i in range(nx)}
+
+
+def bounds(anchors, min_size=2.0):
+    """Anchor bounding box (x0, y0, x1, y1), grown to at least min_size per side."""
+    xs = [a[0] for a in anchors.values()]; ys = [a[1] for a in anchors.values()]
+    x0, x1, y0, y1 = min(xs), max(xs), min(ys), max(ys)
+    gx = max(0.0, min_size - (x1 - x0)) / 2; gy = max(0.0, min_size - (y1 - y0)) / 2
+    return (x0 - gx, y0 - gy, x1 + gx, y1 + gy)
+
+
+# ----- trajectories: pos(t) -> (x, y), t in seconds -----
+def _fold(v, lo, hi):
+    """Reflect v into [lo, hi] (a ball bouncing between two walls)."""
+    span = hi - lo
+    v = (v - lo) % (2*span)
+    return lo + (v if v <= span else 2*span - v)
+
+
+def trajectory(kind, area, speed=SPEED, rng=random):
+    x0, y0, x1, y1 = area
+    px, py = rng.uniform(x0, x1), rng.uniform(y0, y1)
+    if kind == "static":
+        return lambda t: (px, py)
+    if kind == "circle":
+        r = rng.uniform(0.2, 0.5) * min(x1 - x0, y1 - y0)
+        cx, cy = rng.uniform(x0 + r, x1 - r), rng.uniform(y0 + r, y1 - r)
+        w, ph = rng.choice((-1, 1)) * speed / r, rng.uniform(0, 2*math.pi)
+        return lambda t: (cx + r*math.cos(ph + w*t), cy + r*math.sin(ph + w*t))
+    if kind == "bounce":
+        a = rng.uniform(0, 2*math.pi)
+        vx, vy = speed*math.cos(a), speed*math.sin(a)
+        return lambda t: (_fold(px + vx*t, x0, x1), _fold(py + vy*t, y0, y1))
+    if kind == "walk":
+        # random waypoint: head for a random point, pick a new one on arrival
+        st = [None, px, py, px, py]           # t, x, y, target x, target y
+
+        def pos(t):
+            t0, x, y, tx, ty = st
+            step = 0.0 if t0 is None else speed * max(t - t0, 0.0)
+            d = math.hypot(tx - x, ty - y)
+            while step >= d:
+                step -= d
+                x, y = tx, ty
+                tx, ty = rng.uniform(x0, x1), rng.uniform(y0, y1)
+                d = math.hypot(tx - x, ty - y) or 1e-9
+            x += (tx - x) * step/d; y += (ty - y) * step/d
+            st[:] = t, x, y, tx, ty
+            return x, y
+        return pos
+    raise ValueError(f"unknown trajectory {kind!r}")
+
+TRAJECTORIES = ("static", "circle", "bounce", "walk")
+
+
+# ----- one tag -----
+class VirtualTag:
+    """Range model + the tag's link table; frame(t) is what tag.ino would send at t."""
+
+    def __init__(self, anchors, pos, noise=NOISE, binary=False, rng=random, height=0.0):
+        self.anchors = anchors          # {aid: (x, y, bias, z)}
+        self.pos = pos
+        self.height = height
+        self.noise = noise
+        self.binary = binary
+        self.rng = rng
+        self.links = {}                 # aid -> (Link, t of last refresh)
+        self.seq = 0
+
+    def measure(self, t):
+        x, y = self.pos(t)
+        n, rng = self.noise, self.rng
+        for aid, (ax, ay, bias, az) in self.anchors.items():
+            d = math.hypot(x - ax, y - ay, self.height - az)
+            if d > n.max_range or rng.random() < n.dropout: continue
+            r = d + rng.gauss(0.0, n.sigma)
+            nlos = rng.random() < n.nlos
+            if nlos: r += rng.expovariate(1.0 / n.nlos_bias)
+            # the host adds the anchor's bias back, so report the uncorrected range
+            r = max(r - bias, 0.0)
+            rssi = -58.0 - 20.0*math.log10(max(d, 0.3)) + rng.gauss(0.0, 1.0)
+            # NLOS: first path much weaker than the total received power
+            fp = rssi - (rng.uniform(8.0, 14.0) if nlos else abs(rng.gauss(1.5, 0.8)))
+            q = rng.randint(30, 80) if nlos else rng.randint(100, 140)
+            self.links[aid] = (Link(aid, r, r, round(rssi), round(fp), q), t)
+        return x, y
+
+    def frame(self, t):
+        """Measure at t and encode one report; returns (bytes, true (x, y))."""
+        xy = self.measure(t)
+        links = [l for l, ts in self.links.values() if t - ts <= STALE_S]
+        self.seq += 1
+        if self.binary:
+            return encode_frame(links, self.seq), xy
+        body = ",".join('{"aid":"%s","range":%.3f,"raw":%.3f,"rssi":%d,"fpPower":%d,"quality":%d}'
+                        % l for l in links)
+        return ('{"links":[' + body + ']}\n').encode(), xy
+
+
+async def run_tag(tag, host, port, rate, jitter, stats, truth=None):
+    """Connect (retrying every second like tag.ino) and stream until cancelled."""
+    period = 1.0 / rate
+    await asyncio.sleep(tag.rng.random() * period)     # tags power up out of phase
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            stats["failed"] += 1
+            await asyncio.sleep(1.0)
+            continue
+        stats["connected"] += 1
+        peer = "%s:%d" % writer.get_extra_info("sockname")[:2]
+        next_t = time.monotonic()
+        try:
+            while True:
+                next_t += period
+                now = time.monotonic()
+                if now - next_t > period:               # sim can't keep up: skip, count it
+                    stats["late"] += 1
+                    next_t = now
+                delay = next_t - now + jitter * (2*tag.rng.random() - 1)
+                if delay > 0: await asyncio.sleep(delay)
+                t = time.monotonic()
+                data, (x, y) = tag.frame(t)
+                writer.write(data)
+                stats["frames"] += 1
+                stats["bytes"] += len(data)
+                if truth is not None:
+                    truth.write('{"t": %.4f, "tag": "%s", "x": %.4f, "y": %.4f}\n' % (t, peer, x, y))
+                if writer.transport.get_write_buffer_size() > 65536:
+                    await writer.drain()
+        except OSError:
+            stats["errors"] += 1
+            await asyncio.sleep(1.0)
+        finally:
+            writer.close()
+
+
+# ----- shards (one event loop per process) -----
+async def _shard(tags, cfg, stop):
+    stats = dict.fromkeys(STATS, 0)
+    # line buffered: every line is one O_APPEND write, so shards don't interleave
+    truth = open(cfg["truth"], "a", buffering=1) if cfg["truth"] else None
+    tasks = [asyncio.create_task(run_tag(tag, cfg["host"], cfg["port"], cfg["rate"],
+                                         cfg["jitter"], stats, truth))
+             for tag in tags]
+    end = time.monotonic() + cfg["duration"] if cfg["duration"] else math.inf
+    try:
+        while time.monotonic() < end and not stop.is_set():
+            await asyncio.sleep(0.2)
+    finally:
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if truth is not None: truth.close()
+    return stats
+
+
+_stop = None
+
+
+def _init_shard(stop):
+    global _stop
+    _stop = stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)        # the parent decides when to stop
+
+
+def _run_shard(first, count, cfg):
+    tags = []
+    for i in range(first, first + count):
+        rng = random.Random(cfg["seed"] * 1000003 + i)
+        pos = trajectory(cfg["trajectory"], cfg["area"], cfg["speed"], rng)
+        tags.append(VirtualTag(cfg["anchors"], pos, cfg["noise"], cfg["binary"], rng, cfg["height"]))
+    return asyncio.run(_shard(tags, cfg, _stop))
+
+
+def simulate(anchors, n_tags, host="127.0.0.1", port=PORT, rate=RATE_HZ, jitter=0.0,
+             trajectory="bounce", speed=SPEED, noise=NOISE, binary=False, duration=0.0,
+             procs=1, seed=0, truth=None, stop=None, height=0.0):
+    """
+    Run n_tags virtual tags split over `procs` processes until `duration` seconds
+    passed (0 = until stop is set). Returns the summed counters (see STATS);
+    with no tags nothing is started and they are all 0.
+    Anchors are (x, y[, bias[, z]]); the tags move at z = height.
+    """
+    if n_tags <= 0:
+        return dict.fromkeys(STATS, 0)
+    area = bounds(anchors)
+    anchors = {aid: (a[0], a[1], a[2] if len(a) > 2 else 0.0, a[3] if len(a) > 3 else 0.0)
+               for aid, a in anchors.items()}
+    cfg = dict(host=host, port=port, rate=rate, jitter=jitter, trajectory=trajectory,
+               speed=speed, noise=noise, binary=binary, duration=duration, seed=seed,
+               truth=truth, anchors=anchors, area=area, height=height)
+    if truth: open(truth, "w").close()
+    raise_fd_limit()
+    procs = max(1, min(procs, n_tags))
+    stop = stop or multiprocessing.Event()
+    jobs = []
+    for k in range(procs):
+        first, count = k * n_tags // procs, (k+1) * n_tags // procs - k * n_tags // procs
+        jobs.append((first, count, cfg))
+    with multiprocessing.Pool(procs, _init_shard, (stop,)) as pool:
+        parts = pool.starmap_async(_run_shard, jobs)
+        try:
+            while not parts.ready():
+                parts.wait(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+        parts = parts.get()
+    return {k: sum(p[k] for p in parts) for k in STATS}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m uwb.sim", description="Synthetic UWB tags.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--tags", type=int, default=10)
+    ap.add_argument("--rate", type=float, default=RATE_HZ, help="reports per second per tag")
+    ap.add_argument("--jitter", type=float, default=0.0, help="send time jitter, +- ms")
+    ap.add_argument("--anchors", help="JSON file {aid: [x, y], [x, y, bias] or [x, y, bias, z]}")
+    ap.add_argument("--anchor", nargs="+", action="append", default=[], metavar="AID X Y [BIAS [Z]]")
+    ap.add_argument("--grid", nargs=3, type=float, default=(3, 2, 10), metavar=("NX", "NY", "SPACING"),
+                    help="anchor grid used when no anchors are given")
+    ap.add_argument("--anchor-height", type=float, metavar="Z", help="mounting height of the grid")
+    ap.add_argument("--tag-height", type=float, default=0.0, metavar="Z", help="height of the tags")
+    ap.add_argument("--dump-anchors", metavar="FILE", help="write the anchor layout for python -m uwb")
+    ap.add_argument("--trajectory", choices=TRAJECTORIES, default="bounce")
+    ap.add_argument("--speed", type=float, default=SPEED, help="m/s")
+    ap.add_argument("--sigma", type=float, default=NOISE.sigma, help="range noise (m)")
+    ap.add_argument("--nlos", type=float, default=NOISE.nlos, help="NLOS probability per range")
+    ap.add_argument("--nlos-bias", type=float, default=NOISE.nlos_bias, help="mean NLOS excess (m)")
+    ap.add_argument("--dropout", type=float, default=NOISE.dropout, help="link dropout probability")
+    ap.add_argument("--max-range", type=float, default=NOISE.max_range)
+    ap.add_argument("--binary", action="store_true", help="send binary frames instead of JSON")
+    ap.add_argument("--duration", type=float, default=0.0, help="seconds, 0 = until Ctrl-C")
+    ap.add_argument("--procs", type=int, default=1, help="sender processes")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--truth", metavar="FILE", help="write true positions as JSON lines")
+    args = ap.parse_args(argv)
+
+    anchors = load_anchors(args.anchors) if args.anchors else {}
+    for a in args.anchor:
+        if len(a) not in (3, 4, 5):
+            ap.error("--anchor takes AID X Y [BIAS [Z]]")
+        anchors[a[0]] = tuple(float(v) for v in a[1:])
+    if not anchors:
+        anchors = grid_layout(int(args.grid[0]), int(args.grid[1]), args.grid[2], args.anchor_height)
+    anchors = {aid: (a[0], a[1], a[2] if len(a) > 2 else 0.0) + tuple(a[3:4])
+               for aid, a in anchors.items()}
+    if args.dump_anchors:
+        with open(args.dump_anchors, "w", encoding="utf-8") as f:
+            json.dump({aid: list(a) for aid, a in anchors.items()}, f, indent=1)
+        if not args.tags: return
+    if args.tags <= 0:
+        ap.error("--tags must be at least 1 (0 only makes sense with --dump-anchors)")
+
+    noise = Noise(args.sigma, args.nlos, args.nlos_bias, args.dropout, args.max_range)
+    print(f"{args.tags} tags x {args.rate:g} Hz over {len(anchors)} anchors -> "
+          f"{args.host}:{args.port} ({'binary' if args.binary else 'JSON'}, {args.procs} procs)")
+    t0 = time.monotonic()
+    st = simulate(anchors, args.tags, args.host, args.port, args.rate, args.jitter/1000.0,
+                  args.trajectory, args.speed, noise, args.binary, args.duration,
+                  args.procs, args.seed, args.truth, height=args.tag_height)
+    dt = time.monotonic() - t0
+    print(f"{st['frames']} frames ({st['bytes']/1e6:.1f} MB) in {dt:.1f} s = {st['frames']/dt:,.0f} "
+          f"frames/s (target {args.tags*args.rate:,.0f}); connects {st['connected']}, "
+          f"failed {st['failed']}, errors {st['errors']}, late {st['late']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# uwb/solver.py
+# Robust trilateration (pure Python, one tag per call); 2-D, and 3-D with trilaterate3d().
+# 2 anchors: exact circle intersection; 3+ anchors: Levenberg–Marquardt with Huber weights,
+# started from the closed-form linear least-squares fix (or the previous position if that fits better).
+# weights: optional per-range confidence in (0, 1] (uwb/quality.py), multiplying the Huber weights.
+
+import math
+
+# Robust trilateration knobs
+EPS_DI       = 1e-6
+LM_LAMBDA    = 1e-2
+LM_DECAY     = 0.7
+LM_GROW      = 2.0
+MAX_STEP     = 1.2
+HUBER_DELTA  = 0.25
+MAX_ITERS    = 25
+COPLANAR     = 0.01         # 3-D: anchor height spread (variance ratio) below which z is ambiguous
+
+def _ones(n):
+    return (1.0,)*n
+
+def _huber_weight(r, d=HUBER_DELTA):
+    ar = abs(r)
+    return 1.0 if ar <= d else d/ar
+
+def _huber_cost(points, ranges, x, y, d=HUBER_DELTA, weights=None):
+    cost = 0.0
+    for (xi, yi), ri, wi in zip(points, ranges, weights or _ones(len(ranges))):
+        a = abs(math.hypot(x-xi, y-yi) - ri)
+        cost += wi*(a*a if a <= d else d*d + 2*d*(a-d))
+    return cost
+
+def linear_fix(points, ranges, weights=None):
+    """
+    Closed-form least-squares position from 3+ ranges, or None for (near-)collinear anchors.
+    Linearizes |x - p_i|^2 = r_i^2 by subtracting the (weighted) mean equation, which leaves
+    the 2x2 normal equations  sum w_i a_i a_i^T x = sum w_i a_i b_i  with a_i = p_i - mean(p),
+    b_i = (mean(c) - c_i)/2, c_i = r_i^2 - |p_i|^2; the sums are built from raw moments in one pass.
+    """
+    sw=sx=sy=sc=sxx=sxy=syy=sxc=syc=0.0
+    for (xi, yi), r, w in zip(points, ranges, weights or _ones(len(points))):
+        c = r*r - xi*xi - yi*yi
+        wx, wy = w*xi, w*yi
+        sw += w; sx += wx; sy += wy; sc += w*c
+        sxx += wx*xi; sxy += wx*yi; syy += wy*yi; sxc += wx*c; syc += wy*c
+    mx, my = sx/sw, sy/sw
+    s11, s12, s22 = sxx - mx*sx, sxy - mx*sy, syy - my*sy
+    t1, t2 = (mx*sc - sxc)/2, (my*sc - syc)/2
+    det = s11*s22 - s12*s12
+    if det <= 1e-9 * (s11 + s22)**2: return None
+    return ((s22*t1 - s12*t2)/det, (s11*t2 - s12*t1)/det)
+
+def trilaterate(points, ranges, x0=None, y0=None,
+                iters=MAX_ITERS, lam=LM_LAMBDA, stats=None, init="linear", weights=None):
+    """
+    Robust trilateration using corrected ranges.
+    - 2 anchors: exact circle intersection (two solutions); pick the one closest to (x0,y0).
+                 If no real intersection, *preserve previous perpendicular offset* from baseline.
+    - >=3 anchors: Levenberg–Marquardt + Huber weights, step clamp, adaptive damping.
+                 init="linear" starts from linear_fix() unless (x0,y0) has a lower
+                 Huber cost; init="centroid" from (x0,y0), else the anchor centroid.
+    stats: optional list; the number of LM iterations used is appended to it.
+    weights: optional per-range weights (3+ anchors only).
+    """
+    n = len(points)
+    if n == 0: return None
+    if n == 1:
+        x, y = points[0]; r = max(ranges[0], 0.0)
+        return (x + r, y)
+
+    # ---- exactly 2 anchors: allow either side of the baseline and keep offset when disjoint ----
+    if n == 2:
+        (x1, y1), (x2, y2) = points
+        r1, r2 = float(ranges[0]), float(ranges[1])
+        dx, dy = x2 - x1, y2 - y1
+        d = math.hypot(dx, dy) + 1e-12
+        ex, ey = dx / d, dy / d
+
+        # along-baseline solution
+        a = (r1*r1 - r2*r2 + d*d) / (2*d)
+        px, py = x1 + a*ex, y1 + a*ey  # closest point on the baseline to the intersections
+
+        # perpendicular unit normal (left-hand)
+        nx, ny = -ey, ex
+
+        # perpendicular height squared
+        h2 = r1*r1 - a*a
+        if h2 > 0:
+            h = math.sqrt(h2)
+            cand1 = (px + h*nx, py + h*ny)
+            cand2 = (px - h*nx, py - h*ny)
+            if (x0 is not None) and (y0 is not None):
+                d1 = (cand1[0]-x0)**2 + (cand1[1]-y0)**2
+                d2 = (cand2[0]-x0)**2 + (cand2[1]-y0)**2
+                return cand1 if d1 <= d2 else cand2
+            return cand1
+        else:
+            # Circles don't intersect; keep the previous signed perpendicular offset from the baseline point (px,py)
+            if (x0 is not None) and (y0 is not None):
+                prev_off = (x0 - px)*nx + (y0 - py)*ny
+                # Optional cap to avoid absurd carry-over when geometry degenerates:
+                # prev_off = max(min(prev_off, d), -d)
+                return (px + prev_off*nx, py + prev_off*ny)
+            # No previous estimate → fall back to baseline point
+            return (px, py)
+
+    # ---- 3+ anchors: LM + Huber ----
+    ws = weights or _ones(n)
+    lin = linear_fix(points, ranges, weights) if init == "linear" else None
+    if x0 is None or y0 is None:
+        x0, y0 = lin or (sum(p[0] for p in points)/n, sum(p[1] for p in points)/n)
+    elif lin is not None and (_huber_cost(points, ranges, *lin, weights=weights) <
+                              _huber_cost(points, ranges, x0, y0, weights=weights)):
+        x0, y0 = lin              # the tag jumped (or the previous fix was poor)
+
+    x, y = x0, y0
+    last_cost = None
+    lam_local = lam
+
+    it = 0
+    for it in range(1, iters + 1):
+        j11=j12=j22=b1=b2=0.0
+        valid=0
+        for (xi, yi), ri, wi in zip(points, ranges, ws):
+            dx, dy = x-xi, y-yi
+            di = math.hypot(dx, dy)
+            if di < EPS_DI:
+                gx, gy = 1.0, 0.0
+                di = EPS_DI
+            else:
+                gx, gy = dx/di, dy/di
+            r = di - ri
+            w = wi*_huber_weight(r)
+            j11 += w*gx*gx; j12 += w*gx*gy; j22 += w*gy*gy
+            b1  += w*gx*r;  b2  += w*gy*r
+            valid += 1
+        if valid < 2: break
+
+        j11d, j22d = j11+lam_local, j22+lam_local
+        det = j11d*j22d - j12*j12
+        if abs(det) < 1e-12:
+            lam_local *= LM_GROW
+            continue
+
+        dx = - ( j22d*b1 - j12*b2)/det
+        dy = - (-j12 *b1 + j11d*b2)/det
+
+        step = math.hypot(dx, dy)
+        if step > MAX_STEP:
+            s = MAX_STEP/step; dx*=s; dy*=s
+
+        xn, yn = x+dx, y+dy
+
+        # Huber loss for accept/reject
+        new_cost = 0.0
+        for (xi, yi), ri, wi in zip(points, ranges, ws):
+            rr = math.hypot(xn-xi, yn-yi) - ri
+            a = abs(rr)
+            new_cost += wi*(rr*rr if a <= HUBER_DELTA else HUBER_DELTA*HUBER_DELTA + 2*HUBER_DELTA*(a-HUBER_DELTA))
+
+        if (last_cost is None) or (new_cost <= last_cost):
+            x, y = xn, yn
+            last_cost = new_cost
+            lam_local = max(lam_local*LM_DECAY, 1e-6)
+            if dx*dx + dy*dy < 1e-6: break
+        else:
+            lam_local = min(lam_local*LM_GROW, 1e6)
+
+    if stats is not None: stats.append(it)
+    return (x, y)
+
+
+# ---- 3-D (x, y, z) anchors ----
+def _solve3(a11, a12, a13, a22, a23, a33, b1, b2, b3):
+    """Symmetric 3x3 system by cofactors; None when singular."""
+    c11 = a22*a33 - a23*a23; c12 = a13*a23 - a12*a33; c13 = a12*a23 - a13*a22
+    det = a11*c11 + a12*c12 + a13*c13
+    if abs(det) < 1e-12: return None
+    c22 = a11*a33 - a13*a13; c23 = a12*a13 - a11*a23; c33 = a11*a22 - a12*a12
+    return ((c11*b1 + c12*b2 + c13*b3)/det,
+            (c12*b1 + c22*b2 + c23*b3)/det,
+            (c13*b1 + c23*b2 + c33*b3)/det)
+
+def linear_fix3d(points, ranges, z0=None, weights=None):
+    """
+    Closed-form (x, y, z) from 3+ ranges to (x, y, z) anchors, or None.
+    Anchors at (nearly) one height don't fix z linearly: then x, y come from the
+    horizontal part and z from the remaining range, on z0's side of the anchor
+    plane (below it without z0: anchors hang from the ceiling).
+    """
+    ws = weights or _ones(len(points))
+    sw=sx=sy=sz=sc=sxx=sxy=sxz=syy=syz=szz=sxc=syc=szc=0.0
+    for (xi, yi, zi), r, w in zip(points, ranges, ws):     # raw moments, as in linear_fix()
+        c = r*r - xi*xi - yi*yi - zi*zi
+        wx, wy, wz = w*xi, w*yi, w*zi
+        sw += w; sx += wx; sy += wy; sz += wz; sc += w*c
+        sxx += wx*xi; sxy += wx*yi; sxz += wx*zi; syy += wy*yi; syz += wy*zi; szz += wz*zi
+        sxc += wx*c; syc += wy*c; szc += wz*c
+    mx, my, mz = sx/sw, sy/sw, sz/sw
+    s11, s12, s13 = sxx - mx*sx, sxy - mx*sy, sxz - mx*sz
+    s22, s23, s33 = syy - my*sy, syz - my*sz, szz - mz*sz
+    t1, t2, t3 = (mx*sc - sxc)/2, (my*sc - syc)/2, (mz*sc - szc)/2
+    det3 = s11*(s22*s33 - s23*s23) + s12*(s13*s23 - s12*s33) + s13*(s12*s23 - s13*s22)
+    if s33 > COPLANAR * (s11 + s22) and det3 > 1e-6 * (s11 + s22 + s33)**3:
+        return _solve3(s11, s12, s13, s22, s23, s33, t1, t2, t3)
+    det = s11*s22 - s12*s12
+    if det <= 1e-9 * (s11 + s22)**2: return None
+    x, y = (s22*t1 - s12*t2)/det, (s11*t2 - s12*t1)/det
+    h2 = sum(w*(r*r - (x-p[0])**2 - (y-p[1])**2) for p, r, w in zip(points, ranges, ws))/sw
+    dz = math.sqrt(max(h2, 0.0))
+    return (x, y, mz + dz if z0 is not None and z0 > mz else mz - dz)
+
+def _huber_cost3(points, ranges, x, y, z, d=HUBER_DELTA, weights=None):
+    cost = 0.0
+    for (xi, yi, zi), ri, wi in zip(points, ranges, weights or _ones(len(ranges))):
+        a = abs(math.sqrt((x-xi)**2 + (y-yi)**2 + (z-zi)**2) - ri)
+        cost += wi*(a*a if a <= d else d*d + 2*d*(a-d))
+    return cost
+
+def trilaterate3d(points, ranges, x0=None, y0=None, z0=None,
+                  iters=MAX_ITERS, lam=LM_LAMBDA, stats=None, weights=None):
+    """
+    (x, y, z) from 3+ ranges to (x, y, z) anchors: LM + Huber with 3x3 normal
+    equations, started like trilaterate() from linear_fix3d() or (x0, y0, z0).
+    Fewer than 3 anchors: None.
+    """
+    n = len(points)
+    if n < 3: return None
+    ws = weights or _ones(n)
+    lin = linear_fix3d(points, ranges, z0, weights)
+    if x0 is None or y0 is None or z0 is None:
+        if lin is None:
+            lin = (sum(p[0] for p in points)/n, sum(p[1] for p in points)/n,
+                   sum(p[2] for p in points)/n)
+        x, y, z = lin
+    elif lin is not None and (_huber_cost3(points, ranges, *lin, weights=weights) <
+                              _huber_cost3(points, ranges, x0, y0, z0, weights=weights)):
+        x, y, z = lin
+    else:
+        x, y, z = x0, y0, z0
+
+    last_cost = None
+    lam_local = lam
+    it = 0
+    for it in range(1, iters + 1):
+        j11=j12=j13=j22=j23=j33=b1=b2=b3=0.0
+        for (xi, yi, zi), ri, wi in zip(points, ranges, ws):
+            dx, dy, dz = x-xi, y-yi, z-zi
+            di = math.sqrt(dx*dx + dy*dy + dz*dz)
+            if di < EPS_DI:
+                gx, gy, gz = 1.0, 0.0, 0.0
+                di = EPS_DI
+            else:
+                gx, gy, gz = dx/di, dy/di, dz/di
+            r = di - ri
+            w = wi*_huber_weight(r)
+            j11 += w*gx*gx; j12 += w*gx*gy; j13 += w*gx*gz
+            j22 += w*gy*gy; j23 += w*gy*gz; j33 += w*gz*gz
+            b1  += w*gx*r;  b2  += w*gy*r;  b3  += w*gz*r
+
+        step = _solve3(j11+lam_local, j12, j13, j22+lam_local, j23, j33+lam_local, -b1, -b2, -b3)
+        if step is None:
+            lam_local *= LM_GROW
+            continue
+        dx, dy, dz = step
+        s = math.sqrt(dx*dx + dy*dy + dz*dz)
+        if s > MAX_STEP:
+            s = MAX_STEP/s; dx*=s; dy*=s; dz*=s
+
+        xn, yn, zn = x+dx, y+dy, z+dz
+        new_cost = _huber_cost3(points, ranges, xn, yn, zn, weights=weights)
+        if (last_cost is None) or (new_cost <= last_cost):
+            x, y, z = xn, yn, zn
+            last_cost = new_cost
+            lam_local = max(lam_local*LM_DECAY, 1e-6)
+            if dx*dx + dy*dy + dz*dz < 1e-6: break
+        else:
+            lam_local = min(lam_local*LM_GROW, 1e6)
+
+    if stats is not None: stats.append(it)
+    return (x, y, z)
+
+def horizontal_ranges(points, ranges, z):
+    """Ranges to (x, y, z) anchors reduced to the plane at height z (known tag height)."""
+    return [math.sqrt(max(r*r - (p[2] - z)**2, 0.0)) for p, r in zip(points, ranges)]
@@ -0,0 +1,87 @@
+# uwb/spatial.py
+# Anchor subset selection for large deployments. A tag only hears the anchors
+# around it, but its range table keeps every anchor it has ever heard, so in a
+# building with hundreds of anchors a moving tag would otherwise hand the solver
+# a growing list of mostly stale, far-away ranges. Per solve we keep at most K:
+#   1. anchors within `radius` of the previous estimate (uniform grid lookup),
+#   2. the freshest 2K of those,
+#   3. greedily, the K with the best geometry (lowest GDOP) seen from the estimate.
+# Solve cost then stays bounded however many anchors the site has.
+
+import math
+
+MAX_ANCHORS   = 8             # ranges handed to the solver per tag (0/None = all)
+SELECT_RADIUS = 30.0          # m; beyond this an anchor cannot plausibly be heard
+GRID_CELL     = 10.0          # m; grid cell size of the anchor index
+
+
+class GridIndex:
+    """Uniform grid over anchor positions {aid: (x, y, ...)}; rebuilt when the table changes."""
+
+    def __init__(self, anchors, cell=GRID_CELL):
+        self.cell = float(cell)
+        self.cells = {}
+        for aid, a in anchors.items():
+            self.cells.setdefault(self._key(a[0], a[1]), []).append((aid, a[0], a[1]))
+
+    def _key(self, x, y):
+        return (math.floor(x / self.cell), math.floor(y / self.cell))
+
+    def near(self, x, y, radius):
+        """Anchor ids within radius of (x, y)."""
+        (x0, y0), (x1, y1) = self._key(x - radius, y - radius), self._key(x + radius, y + radius)
+        r2, cells, out = radius * radius, self.cells, []
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                for aid, ax, ay in cells.get((i, j), ()):
+                    if (ax - x)**2 + (ay - y)**2 <= r2: out.append(aid)
+        return out
+
+
+def _unit(a, x, y):
+    dx, dy = a[0] - x, a[1] - y
+    d = math.hypot(dx, dy)
+    return (dx / d, dy / d) if d > 1e-6 else (1.0, 0.0)
+
+
+def gdop(points, x, y):
+    """Geometric dilution of precision of range measurements to points, seen from (x, y)."""
+    sxx = sxy = syy = 0.0
+    for p in points:
+        ux, uy = _unit(p, x, y)
+        sxx += ux*ux; sxy += ux*uy; syy += uy*uy
+    det = sxx*syy - sxy*sxy
+    return math.sqrt((sxx + syy) / det) if det > 1e-9 else float("inf")
+
+
+def select_anchors(anchors, index, heard, x0=None, y0=None, k=MAX_ANCHORS,
+                   radius=SELECT_RADIUS):
+    """
+    anchors: {aid: (x, y, ...)}, index: GridIndex over them.
+    heard: {aid: last receive time} of the tag's ranges (known anchors only).
+    Returns at most k anchor ids, ordered as selected.
+    """
+    if x0 is None or x0 != x0:            # no (or NaN) previous fix: no geometry to go by
+        return sorted(heard, key=heard.get, reverse=True)[:k]
+    cand = [aid for aid in index.near(x0, y0, radius) if aid in heard]
+    if len(cand) < 3: cand = list(heard)  # lost track (or a bad fix): don't lock anchors out
+    if len(cand) <= k: return cand
+    cand.sort(key=heard.get, reverse=True)
+    pool = [(aid, _unit(anchors[aid], x0, y0)) for aid in cand[:2*k]]
+
+    # greedy: start from the freshest, then add whichever anchor lowers GDOP most;
+    # while the set is still degenerate (1 anchor, or collinear) maximize det instead
+    (aid, (ux, uy)), rest = pool[0], pool[1:]
+    chosen = [aid]
+    sxx, sxy, syy = ux*ux, ux*uy, uy*uy
+    while len(chosen) < k and rest:
+        best, best_key = 0, None
+        for i, (_, (ux, uy)) in enumerate(rest):
+            a, b, c = sxx + ux*ux, sxy + ux*uy, syy + uy*uy
+            det = a*c - b*b
+            key = ((a + c) / det if det > 1e-9 else float("inf"), -det)
+            if best_key is None or key < best_key: best, best_key = i, key
+        aid, (ux, uy) = rest.pop(best)
+        chosen.append(aid)
+        sxx += ux*ux; sxy += ux*uy; syy += uy*uy
+    return chosen
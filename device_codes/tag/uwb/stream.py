@@ -0,0 +1,469 @@
+# uwb/stream.py
+# Position streaming server: fans the solved positions out over TCP and
+# WebSocket to any number of subscribers (dashboards, loggers, other services),
+# from its own asyncio event loop.
+#   python -m uwb --anchors a.json --stream            # port 8090
+#   nc localhost 8090                                   # JSON lines
+#   new WebSocket("ws://host:8090/?hz=5&format=bin")    # a browser
+#
+# The solver never waits for a subscriber: publish() (an Engine listener, on the
+# solver thread) only merges the pass's positions into a {tag: newest} dict and
+# wakes the loop. On the loop, every subscriber has its own {tag: newest} pending
+# dict, so one that falls behind gets fewer, newer positions instead of a
+# growing queue. Per subscriber:
+#   hz      decimation: at most hz positions per tag per second (0 = every fix)
+#   rate    rate limit: at most rate positions per second in all (0 = no limit)
+#   tags    only these tags (default: all)
+#   format  "json" (JSON lines, as python -m uwb prints them) or "bin" (below)
+# Writes to a subscriber stop while more than HIGH_WATER bytes wait in its
+# socket buffer; one that stays above it for EVICT_AFTER seconds is dropped.
+# A new subscriber first gets the newest position of every tag. A tag whose
+# ranges have all expired is announced once as gone: {"t": ..., "tag": ...,
+# "gone": true} in JSON, a position with NaN x and y in binary.
+#
+# A connection that opens with an HTTP upgrade request is a WebSocket, with the
+# options as query parameters (/?hz=5&rate=200&tags=a,b&format=bin); every
+# batch is then one text or binary message. Any other connection is plain TCP
+# and may send JSON lines {"hz": 5, "format": "bin", ...} at any time to change
+# its options. Nothing is sent until the client's first bytes arrive or
+# HELLO_WAIT has passed. JSON subscribers also get {"anchors": {aid: [x, y,
+# bias(, z)]}} on connect and whenever the anchor table changes.
+#
+# Binary batch (version 1, little-endian):
+#   header  10 B   magic u8 = 0xB6 | version u8 = 1 | length u32 (bytes after the header)
+#                  | names u16 | positions u16
+#   name           slot u16 | length u8 | tag id (utf-8); once per tag and connection,
+#                  before its first position
+#   position 34 B  slot u16 | t f64 | x y z f32 | cov xx xy yy f32
+# z is NaN for 2-D fixes, cov NaN without a filter covariance; t is the engine's
+# time.monotonic() of the solve pass (the capture's clock in a replay).
+
+import asyncio, base64, hashlib, json, math, struct, threading, time
+from collections import namedtuple
+from urllib.parse import urlsplit, parse_qs
+
+from .framing import LineFramer
+from .ingest import HOST, peer_id, raise_fd_limit
+
+STREAM_PORT = 8090
+HIGH_WATER  = 256 * 1024      # bytes queued for a subscriber's socket before it is skipped
+EVICT_AFTER = 5.0             # s above HIGH_WATER before a subscriber is disconnected
+HELLO_WAIT  = 0.25            # s a new connection gets to show it is a WebSocket
+TICK        = 0.02            # s between flushes of decimated / rate-limited positions
+MAX_BATCH   = 4096            # positions per write
+MAX_REQUEST = 8192            # longest options line, WebSocket message or HTTP request
+FORMATS = ("json", "bin")
+
+MAGIC   = 0xB6
+VERSION = 1
+HEADER  = struct.Struct("<BBIHH")
+NAME    = struct.Struct("<HB")
+POS     = struct.Struct("<Hd6f")
+_POS    = struct.Struct("<d6f")                 # POS without the slot, encoded once per fix
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_NAN  = float("nan")
+_NANS = (_NAN, _NAN, _NAN)
+
+# one fix, encoded once for every subscriber: line = JSON line, blob = _POS bytes
+Item = namedtuple("Item", "tag line blob")
+
+
+def _item(tag, t, p, cov):
+    if p is None:             # expired
+        return Item(tag, (json.dumps({"t": round(t, 4), "tag": tag, "gone": True}) + "\n").encode(),
+                    _POS.pack(t, _NAN, _NAN, _NAN, *_NANS))
+    out = {"t": round(t, 4), "tag": tag, "x": round(p[0], 4), "y": round(p[1], 4)}
+    if len(p) > 2: out["z"] = round(p[2], 4)
+    if cov: out["cov"] = [round(c, 6) for c in cov]
+    return Item(tag, (json.dumps(out) + "\n").encode(),
+                _POS.pack(t, p[0], p[1], p[2] if len(p) > 2 else _NAN, *(cov or _NANS)))
+
+
+def ws_frame(op, payload):
+    """One unmasked (server -> client) WebSocket frame."""
+    n = len(payload)
+    if n < 126: head = bytes((0x80 | op, n))
+    elif n < 65536: head = struct.pack("!BBH", 0x80 | op, 126, n)
+    else: head = struct.pack("!BBQ", 0x80 | op, 127, n)
+    return head + payload
+
+
+def decode_batch(data):
+    """
+    Parse one binary batch -> ({slot: tag} announced in it, [(slot, t, x, y, z, cov)]),
+    cov None where NaN. For clients and tests; raises ValueError on a bad header.
+    """
+    magic, version, length, n_names, n_pos = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or len(data) != HEADER.size + length:
+        raise ValueError("not a version 1 position batch")
+    names, o = {}, HEADER.size
+    for _ in range(n_names):
+        slot, n = NAME.unpack_from(data, o)
+        names[slot] = bytes(data[o + NAME.size:o + NAME.size + n]).decode(errors="replace")
+        o += NAME.size + n
+    out = []
+    for slot, t, x, y, z, xx, xy, yy in POS.iter_unpack(data[o:o + n_pos * POS.size]):
+        out.append((slot, t, x, y, z, None if math.isnan(xx) else (xx, xy, yy)))
+    return names, out
+
+
+class Subscriber(asyncio.Protocol):
+    """One subscriber connection: plain TCP or WebSocket, with its own options and backlog."""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.peer = None
+        self.ws = None            # None until the first bytes (or HELLO_WAIT) tell
+        self.buf = bytearray()    # request / WebSocket frames not parsed yet
+        self.framer = None        # plain TCP: options lines
+        self.hz = server.hz
+        self.rate = server.rate
+        self.tags = None          # set of tag ids, None = all
+        self.format = "json"
+        self.pending = {}         # {tag: Item} not sent yet (newest only)
+        self.last = {}            # {tag: time last sent}, with hz
+        self.slots = {}           # bin: {tag: slot} announced on this connection
+        self.tokens = max(float(self.rate), 1.0)
+        self.refill = time.monotonic()
+        self.blocked = None       # since when the socket buffer is above HIGH_WATER
+        self.anchors = None       # anchor table last sent (json)
+        self.sent = 0
+
+    # ----- connection -----
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = peer_id(transport)
+        self.server._opened(self)
+        self.server.loop.call_later(HELLO_WAIT, self._hello_timeout)
+
+    def _hello_timeout(self):
+        if self.ws is None and not self.transport.is_closing(): self._start(False)
+
+    def _start(self, ws):
+        self.ws = ws
+        if not ws and self.framer is None: self.framer = LineFramer(MAX_REQUEST)
+        self.pending = self._wanted()
+        self.flush(time.monotonic())
+
+    def connection_lost(self, exc):
+        self.server._closed(self)
+
+    def data_received(self, data):
+        if self.ws is None:
+            self.buf += data
+            head = bytes(self.buf[:4])
+            if b"GET "[:len(head)] == head:
+                if len(head) < 4 or self._handshake(): return
+                return self._ws_frames()
+            data, self.buf = bytes(self.buf), bytearray()
+            self.framer = LineFramer(MAX_REQUEST)
+            self._options(data)                 # options sent with the first bytes apply at once
+            return self._start(False)
+        if self.ws:
+            self.buf += data
+            return self._ws_frames()
+        self._options(data)
+
+    # ----- options -----
+    def _options(self, data):
+        for line in self.framer.feed(data):
+            try:
+                opts = json.loads(str(line, "utf-8", "ignore"))
+            except ValueError:
+                opts = None
+            self._configure(opts)
+
+    def _configure(self, opts):
+        """Apply a dict of options; anything invalid in it rejects the whole dict."""
+        try:
+            hz = float(opts.get("hz", self.hz))
+            rate = float(opts.get("rate", self.rate))
+            fmt = opts.get("format", self.format)
+            tags = opts.get("tags", self.tags)
+            if tags is not None: tags = {str(t) for t in tags}
+            if not (hz >= 0 and rate >= 0 and math.isfinite(hz + rate) and fmt in FORMATS):
+                raise ValueError
+        except (AttributeError, TypeError, ValueError):
+            self.server.bad += 1
+            return
+        if fmt != self.format: self.slots, self.anchors = {}, None
+        if rate != self.rate: self.tokens, self.refill = max(rate, 1.0), time.monotonic()
+        self.hz, self.rate, self.format = hz, rate, fmt
+        if tags != self.tags:
+            self.tags = tags
+            self.pending = self._wanted()
+
+    def _wanted(self):
+        """{tag: Item} of the newest fix of every tag this subscriber wants."""
+        latest = self.server.latest
+        tags = latest if self.tags is None else [t for t in self.tags if t in latest]
+        return {t: _item(t, *latest[t]) for t in tags}
+
+    def offer(self, items):
+        """Newest fixes {tag: Item} of a publish; replaces any not sent yet."""
+        if self.tags is None:
+            self.pending.update(items)
+        else:
+            for t in self.tags & items.keys():
+                self.pending[t] = items[t]
+
+    # ----- WebSocket -----
+    def _handshake(self):
+        """Parse the upgrade request once complete; True while more bytes are needed."""
+        end = self.buf.find(b"\r\n\r\n")
+        if end < 0:
+            if len(self.buf) > MAX_REQUEST: self.transport.close()
+            return True
+        head, self.buf = bytes(self.buf[:end]), self.buf[end + 4:]
+        lines = head.decode("latin-1").split("\r\n")
+        request = lines[0].split(" ")
+        headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:])}
+        key = headers.get("sec-websocket-key")
+        if len(request) != 3 or "websocket" not in headers.get("upgrade", "").lower() or not key:
+            self.transport.write(b"HTTP/1.1 426 Upgrade Required\r\nSec-WebSocket-Version: 13\r\n"
+                                 b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+            self.transport.close()
+            return True
+        accept = base64.b64encode(hashlib.sha1(key.encode() + _WS_GUID).digest())
+        self.transport.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                             b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        query = parse_qs(urlsplit(request[1]).query)
+        opts = {k: v[-1] for k, v in query.items()}
+        if "tags" in query: opts["tags"] = [t for v in query["tags"] for t in v.split(",") if t]
+        self._configure(opts)
+        self._start(True)
+        return False
+
+    def _ws_frames(self):
+        buf = self.buf
+        while len(buf) >= 2:
+            op, masked, n, i = buf[0] & 0x0F, buf[1] & 0x80, buf[1] & 0x7F, 2
+            if n == 126:
+                if len(buf) < 4: return
+                n, i = struct.unpack_from("!H", buf, 2)[0], 4
+            elif n == 127:
+                if len(buf) < 10: return
+                n, i = struct.unpack_from("!Q", buf, 2)[0], 10
+            if not masked or n > MAX_REQUEST:           # protocol error / too big
+                self.transport.write(ws_frame(8, struct.pack("!H", 1002 if not masked else 1009)))
+                self.transport.close()
+                return
+            if len(buf) < i + 4 + n: return
+            mask = bytes(buf[i:i + 4]) * (n // 4 + 1)
+            payload = (int.from_bytes(buf[i + 4:i + 4 + n], "little") ^
+                       int.from_bytes(mask[:n], "little")).to_bytes(n, "little")
+            del buf[:i + 4 + n]
+            if op == 8:                                   # close: echo it
+                self.transport.write(ws_frame(8, payload[:2]))
+                self.transport.close()
+                return
+            if op == 9: self.transport.write(ws_frame(10, payload))
+            elif op == 1:
+                try:
+                    self._configure(json.loads(payload))
+                except ValueError:
+                    self.server.bad += 1
+
+    # ----- output -----
+    def flush(self, now):
+        tr = self.transport
+        if self.ws is None or tr.is_closing(): return
+        if tr.get_write_buffer_size() > HIGH_WATER:
+            if self.blocked is None: self.blocked = now
+            elif now - self.blocked > EVICT_AFTER:
+                self.server.evicted += 1
+                if self.server.verbose: print("Subscriber too slow, dropped:", self.peer)
+                tr.abort()
+            return
+        self.blocked = None
+        srv = self.server
+        if self.format == "json" and srv.anchor_line is not None and self.anchors is not srv.anchor_line:
+            self.anchors = srv.anchor_line
+            tr.write(ws_frame(1, self.anchors) if self.ws else self.anchors)
+        if not self.pending: return
+        budget = MAX_BATCH
+        if self.rate:
+            # room for one position at least: a rate below 1/s still sends one every 1/rate s
+            self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.refill) * self.rate)
+            self.refill = now
+            budget = min(budget, int(self.tokens))
+            if budget <= 0: return
+        gap = 1.0 / self.hz if self.hz else 0.0
+        last = self.last
+        slots = self.slots if self.format == "bin" else None
+        free = 0x10000 - len(self.slots)          # bin: slot numbers left on this connection
+        out, lost = [], []
+        for tag, item in self.pending.items():
+            if gap and now - last.get(tag, -gap) < gap: continue
+            if slots is not None and tag not in slots:
+                if free <= 0:
+                    lost.append(tag)
+                    continue
+                free -= 1
+            out.append(item)
+            if len(out) >= budget: break
+        if lost:
+            for tag in lost: del self.pending[tag]
+            srv.dropped += len(lost)
+        if not out: return
+        for item in out:
+            del self.pending[item.tag]
+            if gap: last[item.tag] = now
+        if self.rate: self.tokens -= len(out)
+        self.sent += len(out)
+        if self.format == "json":
+            data = b"".join(item.line for item in out)
+            tr.write(ws_frame(1, data) if self.ws else data)
+            return
+        names, body = [], []
+        for item in out:
+            slot = self.slots.get(item.tag)
+            if slot is None:
+                slot = self.slots[item.tag] = len(self.slots)
+                name = item.tag.encode()[:255]
+                names.append(NAME.pack(slot, len(name)) + name)
+            body.append(slot.to_bytes(2, "little") + item.blob)
+        payload = b"".join(names) + b"".join(body)
+        data = HEADER.pack(MAGIC, VERSION, len(payload), len(names), len(body)) + payload
+        tr.write(ws_frame(2, data) if self.ws else data)
+
+
+class StreamServer:
+    """
+    Serves positions to subscribers on (host, port), from an event loop on a daemon
+    thread. publish(snapshot) is meant to be an Engine listener; it never blocks.
+    hz / rate: options of a subscriber that sets none (see the module comment).
+    """
+
+    def __init__(self, host=HOST, port=STREAM_PORT, hz=0.0, rate=0.0, verbose=True):
+        self.host, self.port = host, port
+        self.hz, self.rate = hz, rate
+        self.verbose = verbose
+        self.subs = set()
+        self.latest = {}          # {tag: (t, pos, cov)}, newest of every tag (for new subscribers)
+        self.anchor_line = None   # {"anchors": ...} JSON line of the current table
+        self.evicted = 0          # subscribers dropped for being too slow
+        self.bad = 0              # option requests rejected
+        self.dropped = 0          # bin positions of tags beyond a connection's 65536 slots
+        self.sent = 0             # positions sent to subscribers that have closed
+        self.loop = None
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._new = {}            # {tag: (t, pos, cov)} published since the loop last looked
+        self._live = set()        # solver thread: tags published and not expired since
+        self._table = None
+        self._table_sent = None
+        self._woken = False
+
+    # ----- input (solver thread) -----
+    def publish(self, snap):
+        if self.loop is None: return
+        smooth, cov, t = snap.smooth, snap.cov, snap.stamp
+        live = self._live
+        live.update(snap.updated)
+        gone = [p for p in live if p not in smooth] if len(live) != len(smooth) else ()
+        with self._lock:
+            new = self._new
+            for peer in snap.updated:
+                new[peer] = (t, smooth[peer], cov.get(peer))
+            for peer in gone:
+                live.discard(peer)
+                new[peer] = (t, None, None)
+            self._table = snap.anchors
+            if self._woken: return
+            self._woken = True
+        try:
+            self.loop.call_soon_threadsafe(self._flush)
+        except RuntimeError:      # loop closed: stopping
+            pass
+
+    # ----- fan-out (loop thread) -----
+    def _flush(self):
+        with self._lock:
+            new, self._new = self._new, {}
+            table, self._woken = self._table, False
+        if table is not None and table != self._table_sent:
+            self._table_sent = table
+            self.anchor_line = (json.dumps({"anchors": {aid: list(a) for aid, a in table.items()}})
+                                + "\n").encode()
+        self.latest.update(new)
+        for tag, (_, p, _) in new.items():
+            if p is None: del self.latest[tag]
+        if not self.subs: return
+        items = {tag: _item(tag, *v) for tag, v in new.items()}
+        now = time.monotonic()
+        for sub in list(self.subs):
+            if items: sub.offer(items)
+            sub.flush(now)
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(TICK)
+            self._flush()
+
+    # ----- connection bookkeeping -----
+    def _opened(self, sub):
+        self.subs.add(sub)
+        if self.verbose: print("Subscriber connected:", sub.peer)
+
+    def _closed(self, sub):
+        self.subs.discard(sub)
+        self.sent += sub.sent
+        if self.verbose: print("Subscriber closed:", sub.peer)
+
+    def counts(self):
+        """{subscribers, evicted, streamed} (positions sent), stream_dropped so far."""
+        live = list(self.subs)
+        return {"subscribers": len(live), "evicted": self.evicted, "stream_dropped": self.dropped,
+                "streamed": self.sent + sum(s.sent for s in live)}
+
+    # ----- asyncio API -----
+    async def start_serving(self):
+        self.loop = asyncio.get_running_loop()
+        raise_fd_limit()
+        self._server = await self.loop.create_server(lambda: Subscriber(self), self.host, self.port,
+                                                     reuse_address=True)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ticker = self.loop.create_task(self._tick())
+        if self.verbose: print(f"Streaming positions on {self.host}:{self.port}")
+        return self._server
+
+    # ----- thread API -----
+    def start(self):
+        """Run the server on its own event loop in a daemon thread."""
+        ready = threading.Event()
+
+        async def main():
+            await self.start_serving()
+            ready.set()
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+        def run():
+            try:
+                asyncio.run(main())
+            finally:
+                ready.set()
+
+        self._thread = threading.Thread(target=run, name="uwb-stream", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self.loop is None or self._server is None: return
+        try:
+            self.loop.call_soon_threadsafe(self._close)
+        except RuntimeError:      # loop already gone
+            return
+        if self._thread is not None: self._thread.join(1.0)
+
+    def _close(self):
+        for sub in list(self.subs):
+            sub.transport.close()
+        self._server.close()
@@ -0,0 +1,229 @@
+# uwb/track.py
+# Per-tag tracking filters between the solver and the published position.
+# The worker keeps one filter per tag and, on every solve of that tag, calls
+#   predict(t)                          -> (x, y) expected now, or None; the
+#                                          solver warm-starts from it
+#   update(t, est, points, ranges, times) -> (x, y) published as the smoothed fix
+#   cov()                               -> (xx, xy, yy) position covariance (m^2) of
+#                                          that fix, or None (optional)
+# est is the solver's fix, points/ranges the (bias-corrected) anchor ranges it
+# used and times their receive times, so range-based filters fuse only what is
+# new since their last update.
+#   ema       fixed-alpha exponential average of the solver output (the old smoothing)
+#   ekf       constant-velocity extended Kalman filter on the raw ranges, with an
+#             innovation gate that drops outliers (NLOS, multipath)
+#   particle  constant-velocity particle filter with a heavy-tailed (NLOS) range
+#             likelihood; pure Python, meant for a handful of tags
+
+import math, random
+
+TRACKERS = ("ema", "ekf", "particle")
+TRACKER  = "ekf"
+
+# ekf / particle knobs
+ACCEL_SIGMA = 3.0             # m/s^2, white-noise acceleration of the motion model
+RANGE_SIGMA = 0.10            # m, range noise
+GATE        = 4.0             # innovations beyond GATE sigma are rejected
+RESET_AFTER = 3               # updates in a row with every range rejected: re-init on the fix
+INIT_POS    = 0.5             # m, initial position sigma around the first fix
+INIT_VEL    = 1.0             # m/s, initial velocity sigma
+MAX_DT      = 2.0             # s; a longer gap is treated as a new track
+PARTICLES   = 400
+PF_ACCEL    = 6.0             # m/s^2; particles need more diffusion than the EKF's model
+PF_SIGMA    = 0.3             # m; likelihood width of the particle filter (wider than the
+                              # range noise, or a few hundred particles collapse onto one)
+PF_JITTER   = 0.05            # m, position noise added to resampled particles
+PF_RESET    = 2.0             # m; re-init on the solver fix if the estimate drifts this far
+NLOS_P      = 0.1             # particle filter: share of ranges that may be NLOS-biased
+
+
+class EMA:
+    def __init__(self, alpha=0.35):
+        self.alpha = alpha
+        self.pos = None
+
+    def predict(self, t):
+        return None               # warm start from the last raw fix, as before
+
+    def update(self, t, est, points, ranges, times):
+        a, p = self.alpha, self.pos
+        self.pos = est if p is None else (p[0] + a*(est[0]-p[0]), p[1] + a*(est[1]-p[1]))
+        return self.pos
+
+    def cov(self):
+        return None
+
+
+class RangeEKF:
+    """State (x, y, vx, vy); one scalar update per new range."""
+
+    def __init__(self, accel=ACCEL_SIGMA, sigma=RANGE_SIGMA, gate=GATE):
+        self.q = accel * accel
+        self.r = sigma * sigma
+        self.gate = gate
+        self.x = None
+        self.P = None
+        self.t = None
+        self.rejected = 0         # consecutive updates that rejected every range
+
+    def _init(self, t, est):
+        p, v = INIT_POS**2, INIT_VEL**2
+        self.x = [est[0], est[1], 0.0, 0.0]
+        self.P = [[p, 0, 0, 0], [0, p, 0, 0], [0, 0, v, 0], [0, 0, 0, v]]
+        self.t = t
+        self.rejected = 0
+
+    def predict(self, t):
+        if self.x is None: return None
+        dt = min(max(t - self.t, 0.0), MAX_DT)
+        return (self.x[0] + self.x[2]*dt, self.x[1] + self.x[3]*dt)
+
+    def cov(self):
+        P = self.P
+        return None if P is None else (P[0][0], P[0][1], P[1][1])
+
+    def _propagate(self, dt):
+        x, P, q = self.x, self.P, self.q
+        x[0] += x[2]*dt; x[1] += x[3]*dt
+        # P = F P F^T + Q, F = [[I, dt I], [0, I]]
+        for i in range(4):                       # P F^T: column j (< 2) += dt * column j+2
+            P[i][0] += dt*P[i][2]; P[i][1] += dt*P[i][3]
+        for j in range(4):                       # F (P F^T): row i (< 2) += dt * row i+2
+            P[0][j] += dt*P[2][j]; P[1][j] += dt*P[3][j]
+        d2, d3, d4 = q*dt*dt, q*dt**3/2, q*dt**4/4
+        P[0][0] += d4; P[1][1] += d4; P[2][2] += d2; P[3][3] += d2
+        P[0][2] += d3; P[2][0] += d3; P[1][3] += d3; P[3][1] += d3
+
+    def update(self, t, est, points, ranges, times):
+        if self.x is None or t - self.t > MAX_DT:
+            self._init(t, est)
+            return (est[0], est[1])
+        self._propagate(max(t - self.t, 0.0))
+        since, self.t = self.t, t
+        x, P, R, g2 = self.x, self.P, self.r, self.gate**2
+        used = tried = 0
+        for (ax, ay), r, tr in zip(points, ranges, times):
+            if tr <= since: continue              # already fused in an earlier update
+            tried += 1
+            dx, dy = x[0] - ax, x[1] - ay
+            h = math.hypot(dx, dy)
+            if h < 1e-6: continue
+            hx, hy = dx/h, dy/h
+            PH = [P[i][0]*hx + P[i][1]*hy for i in range(4)]
+            S = hx*PH[0] + hy*PH[1] + R
+            nu = r - h
+            if nu*nu > g2*S: continue
+            used += 1
+            for i in range(4):
+                k = PH[i] / S
+                x[i] += k*nu
+                Pi = P[i]
+                for j in range(4):
+                    Pi[j] -= k*PH[j]
+        if tried and not used:
+            self.rejected += 1
+            if self.rejected >= RESET_AFTER:      # lost lock (or the tag jumped): restart
+                self._init(t, est)
+        elif used:
+            self.rejected = 0
+        return (x[0], x[1])
+
+
+class ParticleFilter:
+    def __init__(self, n=PARTICLES, accel=PF_ACCEL, sigma=PF_SIGMA, nlos=NLOS_P, rng=None):
+        self.n = n
+        self.accel = accel
+        self.sigma = sigma
+        self.nlos = nlos
+        self.rng = rng or random.Random()
+        self.p = None             # [[x, y, vx, vy], ...]
+        self.w = None
+        self.mean = None          # (x, y, vx, vy)
+        self.t = None
+
+    def _init(self, t, est):
+        g = self.rng.gauss
+        self.p = [[est[0] + g(0, INIT_POS), est[1] + g(0, INIT_POS),
+                   g(0, INIT_VEL), g(0, INIT_VEL)] for _ in range(self.n)]
+        self.w = [1.0 / self.n] * self.n
+        self.mean = (est[0], est[1], 0.0, 0.0)
+        self.t = t
+
+    def predict(self, t):
+        if self.mean is None: return None
+        x, y, vx, vy = self.mean
+        dt = min(max(t - self.t, 0.0), MAX_DT)
+        return (x + vx*dt, y + vy*dt)
+
+    def update(self, t, est, points, ranges, times):
+        if self.p is None or t - self.t > MAX_DT:
+            self._init(t, est)
+            return (est[0], est[1])
+        dt = max(t - self.t, 0.0)
+        since, self.t = self.t, t
+        g, s = self.rng.gauss, self.accel * dt
+        for q in self.p:
+            ax, ay = g(0, s), g(0, s)
+            q[0] += (q[2] + ax/2)*dt; q[1] += (q[3] + ay/2)*dt
+            q[2] += ax; q[3] += ay
+
+        new = [(a, r) for a, r, tr in zip(points, ranges, times) if tr > since]
+        if new:
+            # Gaussian around the true distance, plus a flat tail for ranges that
+            # came in long (NLOS); computed in log space, normalised by the max
+            k, tail = -0.5 / self.sigma**2, math.log(self.nlos) - math.log(1 - self.nlos) - 3.0
+            logw = []
+            for q, w in zip(self.p, self.w):
+                lw = math.log(w) if w > 0 else -1e300
+                for (ax, ay), r in new:
+                    e = r - math.hypot(q[0] - ax, q[1] - ay)
+                    lg = k*e*e
+                    lw += lg if lg > tail or e < 0 else tail
+                logw.append(lw)
+            top = max(logw)
+            w = [math.exp(v - top) for v in logw]
+            tot = sum(w)
+            self.w = [v / tot for v in w]
+            if 1.0 / sum(v*v for v in self.w) < self.n / 2:
+                self._resample()
+
+        mx = my = mvx = mvy = 0.0
+        for q, w in zip(self.p, self.w):
+            mx += w*q[0]; my += w*q[1]; mvx += w*q[2]; mvy += w*q[3]
+        if math.hypot(mx - est[0], my - est[1]) > PF_RESET:     # lost the tag
+            self._init(t, est)
+            return (est[0], est[1])
+        self.mean = (mx, my, mvx, mvy)
+        return (mx, my)
+
+    def cov(self):
+        if self.p is None: return None
+        mx, my = self.mean[0], self.mean[1]
+        xx = xy = yy = 0.0
+        for q, w in zip(self.p, self.w):
+            dx, dy = q[0] - mx, q[1] - my
+            xx += w*dx*dx; xy += w*dx*dy; yy += w*dy*dy
+        return (xx, xy, yy)
+
+    def _resample(self):
+        """Systematic resampling."""
+        n, w, p = self.n, self.w, self.p
+        g, j = self.rng.gauss, PF_JITTER
+        u, c, i, out = self.rng.random() / n, w[0], 0, []
+        for _ in range(n):
+            while u > c and i < n - 1:
+                i += 1; c += w[i]
+            q = p[i]
+            out.append([q[0] + g(0, j), q[1] + g(0, j), q[2], q[3]])
+            u += 1.0 / n
+        self.p = out
+        self.w = [1.0 / n] * n
+
+
+def make_tracker(kind=TRACKER, smooth_alpha=0.35):
+    """Factory () -> new per-tag filter, for a name in TRACKERS (or a factory, returned as is)."""
+    if callable(kind): return kind
+    if kind == "ema": return lambda: EMA(smooth_alpha)
+    if kind == "ekf": return RangeEKF
+    if kind == "particle": return ParticleFilter
+    raise ValueError(f"unknown tracker {kind!r}")
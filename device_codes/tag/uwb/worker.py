@@ -0,0 +1,422 @@
+# uwb/worker.py
+# Solver stage that runs off the Tk thread.
+# Consumes (peer, [Link, ...]) frames, keeps the latest range per (tag, anchor),
+# solves every tag that received new ranges at most once per solve period and
+# publishes an immutable Snapshot. A range older than range_ttl (no report of
+# that anchor from that tag since) is expired: a dead anchor, or one the tag
+# walked away from, stops feeding its last range into the fix. Tags without a
+# fresh range are never re-solved; once a tag's last range has expired it leaves
+# the snapshot altogether (ranges, tags, smooth, cov) until it reports again.
+# Ranges are weighted by their link quality (uwb/quality.py); likely-NLOS ones
+# are left out, and with ransac=True ranges that no consensus of the others
+# agrees with (uwb/ransac.py). Each tag's fix then goes through its own tracking
+# filter (uwb/track.py), whose prediction also warm-starts the next solve.
+# Readers (the GUI) only ever look at the newest snapshot, so the solve rate and
+# the render rate are tuned independently. With clock="capture" (replays) time
+# only moves with the frames' recorded stamps, so a capture gives the same passes
+# and fixes on every run. A pass that raises (a listener, a solver) is reported
+# on stderr and dropped; the loop keeps running.
+
+import queue, threading, time, traceback
+from collections import namedtuple
+
+from .solver import trilaterate, trilaterate3d, horizontal_ranges
+from .track import make_tracker, TRACKER
+from .spatial import GridIndex, select_anchors, MAX_ANCHORS, SELECT_RADIUS
+from .quality import link_weight, MIN_WEIGHT, MIN_KEEP
+
+try:
+    from .batch import trilaterate_batch, trilaterate3d_batch, pad_batch
+    from .ransac import consensus_mask, RANSAC_MIN
+except ImportError:          # NumPy not installed: solve tags one by one, no consensus stage
+    trilaterate_batch = trilaterate3d_batch = consensus_mask = None
+
+SOLVE_MS     = 20            # minimum time between two solve passes
+SMOOTH_ALPHA = 0.35
+RANGE_TTL    = 2.0           # s; a range not refreshed for this long is dropped
+
+LIVE, CAPTURE = "live", "capture"
+CLOCKS = (LIVE, CAPTURE)
+
+# anchors: {aid: (x, y, bias[, z])} ranges: {peer: {aid: raw range}}
+# tags:    {peer: (x, y) solver}    smooth: {peer: (x, y) after the tracking filter}
+#          (x, y, z) in both with dims=3
+# updated: peers whose position was solved in this pass
+# A tag whose ranges have all expired is in none of these maps.
+# cov:     {peer: (xx, xy, yy)} covariance of smooth's x, y from the tracking filter (m^2),
+#          for filters that have one
+Snapshot = namedtuple("Snapshot", "seq stamp anchors ranges tags smooth last_peer updated cov")
+
+EMPTY = Snapshot(0, 0.0, {}, {}, {}, {}, None, frozenset(), {})
+
+
+class SolverWorker:
+    """
+    frames: uwb.mailbox.Mailbox (or any queue.Queue) of (peer, [uwb.decode.Link, ...]).
+    anchors: {aid: (x, y, bias)} or (x, y, bias, z); unknown anchor ids are ignored unless auto_add.
+    solve: per-tag solver with trilaterate()'s signature (points, ranges, x0, y0).
+    metrics: optional uwb.metrics.Metrics; frames then carry (t_recv, t_put) stamps.
+    max_anchors: solve each tag with at most this many of its anchors, picked by
+    uwb.spatial.select_anchors (None/0 = all of them).
+    range_ttl: seconds a range stays usable without a newer report (None/0 = forever).
+    tracker: per-tag filter, a name in uwb.track.TRACKERS or a factory (); "ema" uses smooth_alpha.
+    dims=3: use the anchors' z (0 when missing) and solve (x, y, z) with
+    trilaterate3d (3+ anchors; `solve` is not used); with tag_height the tag is
+    known to be at that height, so ranges are reduced to that plane and solved in 2-D.
+    The tracking filter always runs on x, y.
+    scales: {aid: s} range scale from a calibration (uwb/calibrate.py); the
+    corrected range is s * raw + bias.
+    link_weights: weight ranges by the links' rssi/fpPower/quality and reject
+    likely-NLOS ones (uwb/quality.py); only used with the built-in solvers.
+    ransac: drop each tag's outlier ranges with a consensus stage before solving
+    (uwb/ransac.py; needs NumPy, otherwise ignored).
+    clock: "live" (time.monotonic) or "capture": frames are (peer, links, t, tq, at)
+    with `at` the recorded time, which then drives range ages, the tracking filters
+    and the solve slots; peer None only moves the clock to `at`. Every frame must
+    be delivered (no merging mailbox) for the result to be reproducible.
+    """
+
+    def __init__(self, frames, anchors, solve=trilaterate, solve_ms=SOLVE_MS,
+                 smooth_alpha=SMOOTH_ALPHA, auto_add=False, metrics=None,
+                 max_anchors=MAX_ANCHORS, select_radius=SELECT_RADIUS, range_ttl=RANGE_TTL,
+                 tracker=TRACKER, dims=2, tag_height=None, scales=None, link_weights=True,
+                 ransac=False, clock=LIVE):
+        if clock not in CLOCKS:
+            raise ValueError(f"unknown clock {clock!r}")
+        self.frames = frames
+        self.anchors = dict(anchors)
+        self.solve = solve
+        self.solve_ms = solve_ms
+        self.smooth_alpha = smooth_alpha
+        self.tracker = make_tracker(tracker, smooth_alpha)
+        self.auto_add = auto_add
+        self.metrics = metrics
+        self.max_anchors = max_anchors
+        self.select_radius = select_radius
+        self.range_ttl = range_ttl
+        self.dims = dims
+        self.tag_height = tag_height
+        self.scales = dict(scales or {})
+        self.link_weights = link_weights
+        self.ransac = ransac and consensus_mask is not None
+        self.clock = clock
+
+        self.ranges = {}
+        self.weights = {}            # {peer: {aid: link weight}}; only with link_weights
+        self.heard = {}              # {peer: {aid: monotonic time of the newest range}}
+        self.tags = {}
+        self.smooth = {}
+        self.cov = {}
+        self.trackers = {}           # {peer: filter}; worker thread only
+        self.last_peer = None
+        self.snapshot = EMPTY
+        self.listeners = []          # callables(snapshot), run on the worker thread
+
+        self._dirty = set()
+        self._expired = False        # ranges were dropped: publish even with nothing to solve
+        self._stamps = []            # metrics only: (t_recv, t_dequeued) since the last pass
+        self._solving = False
+        self._at = 0.0               # capture clock: time of the newest frame
+        self._now = time.monotonic if clock == LIVE else lambda: self._at
+        self._next_solve = self._next_expire = 0.0
+        self._index = None           # GridIndex over the anchors; None = rebuild on next pass
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ----- called from other threads -----
+    def set_anchors(self, anchors):
+        """Replace the anchor table {aid: (x, y, bias)}; every tag is re-solved."""
+        with self._lock:
+            self.anchors = dict(anchors)
+            self._index = None
+            self._dirty.update(self.ranges)
+
+    def update_anchors(self, changes, removed=()):
+        """Add/replace some anchors and drop others, keeping the rest of the table."""
+        with self._lock:
+            self.anchors.update(changes)
+            for aid in removed:
+                self.anchors.pop(aid, None)
+            self._index = None
+            self._dirty.update(self.ranges)
+
+    def set_scales(self, scales):
+        """Replace the per-anchor range scales {aid: s}; every tag is re-solved."""
+        with self._lock:
+            self.scales = dict(scales)
+            self._dirty.update(self.ranges)
+
+    def anchor_table(self):
+        with self._lock:
+            return dict(self.anchors)
+
+    def idle(self):
+        """True when every queued frame has been ingested and solved (and published)."""
+        return self.frames.unfinished_tasks == 0 and not self._dirty and not self._solving
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="uwb-solver", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    # ----- worker thread -----
+    def _run(self):
+        while not self._stop.is_set():
+            self.step()
+
+    def step(self, wait=0.5):
+        """
+        One round of the worker loop: ingest the queued frames (waiting up to `wait` s
+        for one), expire stale ranges and solve if the solve slot has come. The
+        thread of start() runs this; uwb.shards drives its workers with it directly.
+        An exception is printed and the round abandoned; the next one starts clean.
+        """
+        try:
+            self._step(wait)
+        except Exception:
+            traceback.print_exc()
+
+    def _step(self, wait):
+        if self.clock == CAPTURE: return self._step_capture(wait)
+        # Wait for data, or only until the next solve slot if something is pending.
+        timeout = (max(self._next_solve - time.monotonic(), 0.0) if self._dirty or self._expired
+                   else wait)
+        try:
+            item = self.frames.get(timeout=timeout) if timeout > 0 else self.frames.get_nowait()
+            while True:
+                try:
+                    self._ingest(*item)
+                finally:              # idle() waits on the count, even for a frame that failed
+                    self.frames.task_done()
+                item = self.frames.get_nowait()
+        except queue.Empty:
+            pass
+        self._tick(time.monotonic())
+
+    def _step_capture(self, wait):
+        # The slots are checked before each frame at that frame's time, never on an
+        # empty queue, so they fall between the same two frames however fast the
+        # frames arrive.
+        try:
+            item = self.frames.get(timeout=wait)
+            while True:
+                peer, links, t, tq, at = item
+                try:
+                    if at > self._at: self._at = at
+                    self._tick(self._at)
+                    if peer is not None: self._ingest(peer, links, t, tq)
+                finally:
+                    self.frames.task_done()
+                item = self.frames.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _tick(self, now):
+        """Expire stale ranges and solve if their slots have come at time now."""
+        if self.range_ttl and now >= self._next_expire:
+            self._expire(now - self.range_ttl)
+            self._next_expire = now + self.range_ttl/4
+        if (self._dirty or self._expired) and now >= self._next_solve:
+            self._solve_dirty()
+            self._next_solve = now + self.solve_ms/1000.0
+
+    def _ingest(self, peer, links, t=None, tq=None):
+        now = self._now()
+        with self._lock:
+            rs = self.ranges.setdefault(peer, {})
+            seen = self.heard.setdefault(peer, {})
+            ws = self.weights.setdefault(peer, {}) if self.link_weights else None
+            fresh = False
+            for l in links:           # validated by the decoder (link_weight copes with any metrics)
+                aid = l.aid
+                if aid not in self.anchors:
+                    if not self.auto_add: continue
+                    self.anchors[aid] = (0.0, 0.0, 0.0)
+                    self._index = None
+                rs[aid] = l.range
+                seen[aid] = now
+                if ws is not None: ws[aid] = link_weight(l)
+                fresh = True
+            if fresh: self._dirty.add(peer)
+        self.last_peer = peer
+        if tq is not None:
+            self.metrics.lat["queue"].record((now - tq) * 1e6)
+            self.metrics.counters["frames"] += 1
+            self._stamps.append((t, now))
+
+    def _expire(self, cutoff):
+        """Drop every range last reported before cutoff; tags left without any are forgotten
+        (the next snapshot no longer has them)."""
+        n = 0
+        with self._lock:
+            for peer, seen in list(self.heard.items()):
+                stale = [aid for aid, t in seen.items() if t < cutoff]
+                if not stale: continue
+                rs, ws = self.ranges[peer], self.weights.get(peer, {})
+                for aid in stale:
+                    del seen[aid], rs[aid]
+                    ws.pop(aid, None)
+                n += len(stale)
+                if not seen:
+                    del self.heard[peer], self.ranges[peer]
+                    self.weights.pop(peer, None)
+                    self.trackers.pop(peer, None)
+                    self.tags.pop(peer, None)
+                    self.smooth.pop(peer, None)
+                    self.cov.pop(peer, None)
+            if n: self._expired = True
+        if n and self.metrics is not None:
+            self.metrics.counters["expired"] += n
+
+    def _solve_dirty(self):
+        try:
+            self._solve_pass()
+        finally:                      # a failed pass must not leave idle() False for good
+            self._solving = False
+
+    def _solve_pass(self):
+        m = self.metrics
+        its = None
+        if m is not None:
+            t0 = time.monotonic()
+            stamps, self._stamps = self._stamps, []
+            its = []
+            m.depth.record(self.frames.qsize())
+        with self._lock:
+            self._solving = True
+            anchors = dict(self.anchors)
+            scales = self.scales
+            dirty, self._dirty = self._dirty, set()
+            self._expired = False
+            if self._index is None and self.max_anchors:
+                self._index = GridIndex(anchors)
+            index = self._index
+
+        k = self.max_anchors
+        now = self._now()
+        cutoff = now - self.range_ttl if self.range_ttl else None
+        d3, h = self.dims == 3, self.tag_height
+        lw = self.link_weights
+        jobs, jobs3 = [], []
+        nlos = 0
+        for peer in dirty:
+            tr = self.trackers.get(peer)
+            if tr is None: tr = self.trackers[peer] = self.tracker()
+            last = self.tags.get(peer)
+            x0y0 = tr.predict(now) or (last[:2] if last else (None, None))
+            pts, rs, ts, ws = [], [], [], []
+            ranges = self.ranges.get(peer, {})
+            seen = self.heard.get(peer, {})
+            if cutoff is not None:    # the periodic _expire() may not have caught up yet
+                ranges = {aid: r for aid, r in ranges.items() if seen[aid] >= cutoff}
+            if lw:
+                wts = self.weights.get(peer, {})
+                bad = [aid for aid in ranges if wts.get(aid) == 0.0]
+                if bad and len(ranges) - len(bad) >= MIN_KEEP:   # else keep them, down-weighted
+                    nlos += len(bad)
+                    ranges = {aid: r for aid, r in ranges.items() if wts.get(aid) != 0.0}
+            if k and len(ranges) > k:
+                heard = {aid: seen[aid] for aid in ranges if aid in anchors}
+                if len(heard) > k:
+                    ranges = {aid: ranges[aid] for aid in
+                              select_anchors(anchors, index, heard, *x0y0, k, self.select_radius)}
+            for aid, r in ranges.items():
+                a = anchors.get(aid)
+                if a is None: continue
+                pts.append((a[0], a[1], a[3] if len(a) > 3 else 0.0) if d3 else (a[0], a[1]))
+                rs.append(max((r * scales[aid] if aid in scales else r) + a[2], 0.0))
+                ts.append(seen[aid])
+                if lw: ws.append(wts.get(aid, 1.0) or MIN_WEIGHT)
+            ws = ws or None
+            if d3 and h is None:
+                if len(pts) >= 3:
+                    z0 = last[2] if last and len(last) > 2 else None
+                    jobs3.append((peer, pts, rs, ts, (*x0y0, z0), ws))
+                continue
+            if d3:                    # known tag height: a 2-D problem in that plane
+                rs = horizontal_ranges(pts, rs, h)
+                pts = [p[:2] for p in pts]
+            if len(pts) >= 2:
+                jobs.append((peer, pts, rs, ts, x0y0, ws))
+
+        outliers = self._consensus(jobs) + self._consensus(jobs3) if self.ransac else 0
+        if trilaterate_batch is not None and self.solve is trilaterate and len(jobs) > 1:
+            P, R = pad_batch([j[1] for j in jobs], [j[2] for j in jobs])
+            Wt = pad_batch([j[1] for j in jobs], [j[5] for j in jobs])[1] if lw else None
+            nan = float("nan")
+            X0 = [(nan, nan) if j[4][0] is None else j[4] for j in jobs]
+            ests = [tuple(map(float, e)) for e in trilaterate_batch(P, R, X0, stats=its, weights=Wt)]
+        else:
+            own = self.solve is trilaterate
+            kw = {"stats": its} if its is not None and own else {}
+            ests = []
+            for _, pts, rs, _, (x0, y0), ws in jobs:
+                if own: kw["weights"] = ws
+                ests.append(self.solve(pts, rs, x0, y0, **kw))
+        if d3 and h is not None:
+            ests = [est and (est[0], est[1], h) for est in ests]
+        if trilaterate3d_batch is not None and len(jobs3) > 1:
+            P, R = pad_batch([j[1] for j in jobs3], [j[2] for j in jobs3])
+            Wt = pad_batch([j[1] for j in jobs3], [j[5] for j in jobs3])[1] if lw else None
+            X0 = [tuple(float("nan") if v is None else v for v in j[4]) for j in jobs3]
+            ests += [tuple(map(float, e)) for e in trilaterate3d_batch(P, R, X0, stats=its, weights=Wt)]
+        else:
+            for _, pts, rs, _, x0, ws in jobs3:
+                ests.append(trilaterate3d(pts, rs, *x0, stats=its, weights=ws))
+
+        updated = set()
+        for (peer, pts, rs, ts, _, _), est in zip(jobs + jobs3, ests):
+            if not est: continue
+            updated.add(peer)
+            self.tags[peer] = est
+            if len(pts[0]) == 3:      # the filter tracks x, y in the plane of the solved z
+                rs = horizontal_ranges(pts, rs, est[2])
+                pts = [p[:2] for p in pts]
+            tr = self.trackers[peer]
+            xy = tr.update(now, est, pts, rs, ts)
+            self.smooth[peer] = (xy[0], xy[1], est[2]) if d3 else xy
+            c = tr.cov() if hasattr(tr, "cov") else None
+            if c is not None: self.cov[peer] = c
+
+        self.snapshot = Snapshot(self.snapshot.seq + 1, self._now(), anchors,
+                                 {p: dict(r) for p, r in self.ranges.items()},
+                                 dict(self.tags), dict(self.smooth), self.last_peer,
+                                 frozenset(updated), dict(self.cov))
+        if m is not None:
+            t1 = time.monotonic()
+            m.lat["solve"].record((t1 - t0) * 1e6)
+            wait = m.lat["wait"]
+            for _, tq in stamps:
+                wait.record((t0 - tq) * 1e6)
+            for n in its:
+                m.iterations.record(n)
+            m.counters["passes"] += 1
+            m.counters["solves"] += len(updated)
+            m.counters["nlos"] += nlos
+            m.counters["outliers"] += outliers
+            m.published([t for t, _ in stamps], t1)
+        for fn in self.listeners:
+            try:
+                fn(self.snapshot)
+            except Exception:         # one broken consumer must not starve the others
+                traceback.print_exc()
+
+    @staticmethod
+    def _consensus(jobs):
+        """RANSAC front end: drop the ranges of each job that disagree with the consensus fix."""
+        big = [i for i, j in enumerate(jobs) if len(j[1]) >= RANSAC_MIN]
+        if not big: return 0
+        P, R = pad_batch([jobs[i][1] for i in big], [jobs[i][2] for i in big])
+        n = 0
+        for i, keep in zip(big, consensus_mask(P, R).tolist()):
+            peer, pts, rs, ts, x0, ws = jobs[i]
+            keep = keep[:len(pts)]
+            if all(keep): continue
+            n += len(pts) - sum(keep)
+            jobs[i] = (peer, *([v for v, k in zip(col, keep) if k] for col in (pts, rs, ts)), x0,
+                       ws and [w for w, k in zip(ws, keep) if k])
+        return n
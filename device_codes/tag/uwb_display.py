@@ -5,13 +5,21 @@
 # - Labels adapt: draw to the right of the anchor unless that would clip, then draw to the left.
 # - FIX: Draws anchor distance labels on separate lines below each anchor to prevent overlap.
 
-import socket, json, threading, queue, tkinter as tk
+import time, tkinter as tk
 from tkinter import ttk, messagebox
 import tkinter.font as tkfont
 
+from uwb.engine import Engine
+from uwb.render import RetainedCanvas, TreeRows, ListRows
+from uwb.metrics import format_stats
+
 HOST, PORT = "0.0.0.0", 8080
-UPDATE_MS = 60
-SMOOTH = 0.35
+UPDATE_MS = 60   # GUI refresh period
+SIDEBAR_MS = 250 # table/distance list refresh period
+SOLVE_MS = 20    # solver worker period
+TRACKER = "ekf"  # per-tag filter (uwb/track.py); "ema" = fixed-alpha smoothing
+METRICS = False      # per-stage latency stats panel (uwb/metrics.py)
+METRICS_PORT = None  # e.g. 9108: also serve them on http://127.0.0.1:9108/metrics
 
 DEFAULT_ANCHORS = {
     "0x0001": (0.0, 0.0),
@@ -19,37 +27,6 @@ DEFAULT_ANCHORS = {
     "0x0003": (0.0, 3.0),
 }
 
-q_links = queue.Queue()
-
-# ---------- TCP server ----------
-def server_thread():
-    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    srv.bind((HOST, PORT))
-    srv.listen(1)
-    while True:
-        conn, _ = srv.accept()
-        buf = b""
-        try:
-            while True:
-                data = conn.recv(4096)
-                if not data:
-                    break
-                buf += data
-                while b"\n" in buf:
-                    line, buf = buf.split(b"\n", 1)
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        obj = json.loads(line.decode("utf-8", "ignore"))
-                        if isinstance(obj, dict) and "links" in obj:
-                            q_links.put(obj["links"])
-                    except json.JSONDecodeError:
-                        pass
-        finally:
-            conn.close()
-
 # ---------- trilateration ----------
 def trilat(points, ranges, x0=None, y0=None, iters=12):
     if len(points) == 0:
@@ -93,6 +70,8 @@ class App(tk.Tk):
         self.anchors = {aid: {"x": x, "y": y, "r": None} for aid, (x, y) in DEFAULT_ANCHORS.items()}
         self.tag = None
         self.tag_s = None
+        self.peer = None
+        self.seq = 0
 
         # Layout
         self.columnconfigure(1, weight=1)
@@ -100,6 +79,7 @@ class App(tk.Tk):
 
         left = ttk.Frame(self, padding=10); left.grid(row=0, column=0, sticky="ns")
         self.canvas = tk.Canvas(self, bg="#0f0f0f"); self.canvas.grid(row=0, column=1, sticky="nsew")
+        self.rd = RetainedCanvas(self.canvas, layers=("tag", "anchors", "labels"))
 
         # Sidebar: table
         ttk.Label(left, text="Anchors", font=("Segoe UI", 14, "bold")).grid(sticky="w", pady=(0,6))
@@ -108,6 +88,7 @@ class App(tk.Tk):
             self.table.heading(col, text=col); self.table.column(col, width=w, anchor=a)
         self.table.grid(sticky="ew")
         self.table.bind("<<TreeviewSelect>>", self._on_select)
+        self.table_rows = TreeRows(self.table)
 
         # Sidebar: editor
         frm = ttk.Frame(left); frm.grid(sticky="w", pady=6)
@@ -124,14 +105,26 @@ class App(tk.Tk):
         ttk.Label(left, text="Distances", font=("Segoe UI", 12, "bold")).grid(sticky="w", pady=(8,2))
         self.dist_list = tk.Listbox(left, height=6)
         self.dist_list.grid(sticky="ew")
+        self.dist_rows = ListRows(self.dist_list)
+        self.sidebar_at = 0.0
+        self.sidebar_dirty = False
 
         self.note = tk.StringVar(value="Waiting for data…")
         ttk.Label(left, textvariable=self.note, wraplength=260).grid(sticky="w", pady=8)
 
+        self.stats = None
+        if METRICS or METRICS_PORT:
+            self.stats = tk.StringVar(value="")
+            ttk.Label(left, text="Pipeline stats", font=("Segoe UI", 12, "bold")).grid(sticky="w")
+            ttk.Label(left, textvariable=self.stats, font=("Consolas", 9), justify="left").grid(sticky="w")
+
         self._refresh_table()
         self._refresh_dist_list()
 
-        threading.Thread(target=server_thread, daemon=True).start()
+        # Headless engine does ingest + solving; unknown anchors are added at (0, 0).
+        self.engine = Engine(DEFAULT_ANCHORS, HOST, PORT, solve=trilat, solve_ms=SOLVE_MS,
+                             tracker=TRACKER, auto_add=True, metrics=METRICS,
+                             metrics_port=METRICS_PORT, verbose=False).start()
         self.canvas.bind("<Configure>", lambda e: self.draw())
         self.after(UPDATE_MS, self.tick)
 
@@ -140,19 +133,22 @@ class App(tk.Tk):
 
     # Sidebar helpers
     def _refresh_table(self):
-        for i in self.table.get_children():
-            self.table.delete(i)
+        rows = []
         for aid in sorted(self.anchors.keys()):
             a = self.anchors[aid]
             r = f"{a['r']:.2f}" if isinstance(a["r"], (int, float)) else "—"
-            self.table.insert("", "end", iid=aid, values=(aid, f"{a['x']:.2f}", f"{a['y']:.2f}", r))
+            rows.append((aid, (aid, f"{a['x']:.2f}", f"{a['y']:.2f}", r)))
+        self.table_rows.update(rows)   # only changed rows/cells are touched
 
     def _refresh_dist_list(self):
-        self.dist_list.delete(0, tk.END)
+        lines = []
         for aid in sorted(self.anchors.keys()):
             a = self.anchors[aid]
             rtxt = f"{aid}: {a['r']:.2f} m" if isinstance(a["r"], (int,float)) else f"{aid}: —"
-            self.dist_list.insert(tk.END, rtxt)
+            lines.append(rtxt)
+        self.dist_rows.update(lines)
+        self.sidebar_at = time.monotonic()
+        self.sidebar_dirty = False
 
     def _on_select(self, *_):
         sel = self.table.selection()
@@ -169,51 +165,57 @@ class App(tk.Tk):
         except Exception:
             return messagebox.showwarning("Invalid", "x and y must be numbers.")
         self.anchors[aid] = {"x": x, "y": y, "r": self.anchors.get(aid, {}).get("r")}
+        self._push_anchors()
         self._refresh_table(); self.draw()
 
     def delete_anchor(self):
         aid = self.e_aid.get().strip()
         if aid in self.anchors:
             del self.anchors[aid]
+            self._push_anchors()
             self._refresh_table(); self._refresh_dist_list(); self.draw()
 
     # Networking -> state
+    def _push_anchors(self):
+        self.engine.set_anchors({aid: (a["x"], a["y"], 0.0) for aid, a in self.anchors.items()})
+
     def tick(self):
-        changed = False
-        while True:
-            try:
-                links = q_links.get_nowait()
-            except queue.Empty:
-                break
-            changed = True
-            for L in links:
-                aid = L.get("aid"); r = L.get("range")
-                if not isinstance(aid, str) or not isinstance(r, (int,float)): continue
-                self.anchors.setdefault(aid, {"x":0.0,"y":0.0,"r":None})
-                self.anchors[aid]["r"] = float(r)
-
-        if changed:
-            pts, rs = [], []
-            for a in self.anchors.values():
-                if isinstance(a["r"], (int,float)):
-                    pts.append((a["x"], a["y"])); rs.append(a["r"])
-            if len(pts) >= 2:
-                x0,y0 = (self.tag if self.tag else (None,None))
-                est = trilat(pts, rs, x0, y0)
-                if est:
-                    self.tag = est
-                    if self.tag_s is None: self.tag_s = est
-                    else:
-                        ex,ey = self.tag_s
-                        self.tag_s = (ex + SMOOTH*(est[0]-ex), ey + SMOOTH*(est[1]-ey))
-                    self.note.set(f"Tag ≈ ({self.tag_s[0]:.2f}, {self.tag_s[1]:.2f}) m")
-            self._refresh_table(); self._refresh_dist_list(); self.draw()
+        # Newest engine snapshot only; frames are consumed off the Tk thread.
+        snap = self.engine.snapshot
+        if snap.seq != self.seq:
+            self.seq = snap.seq
+            self.peer = peer = snap.last_peer
+            for aid, (x, y, _) in snap.anchors.items():
+                self.anchors.setdefault(aid, {"x": x, "y": y, "r": None})
+            rs = snap.ranges.get(peer, {})
+            for aid, a in self.anchors.items():
+                a["r"] = rs.get(aid)
+            if peer in snap.tags:
+                self.tag = snap.tags[peer]
+                self.tag_s = snap.smooth[peer]
+                self.note.set(f"Tag ≈ ({self.tag_s[0]:.2f}, {self.tag_s[1]:.2f}) m  [{self.peer}]")
+            elif peer not in snap.ranges:     # its ranges expired: stop drawing it
+                self.tag = self.tag_s = None
+                self.note.set("Waiting for data…")
+            self.sidebar_dirty = True
+            self.draw()
+            if self.engine.metrics is not None:
+                # idle callbacks run in order: this one fires after the canvas redraw
+                self.after_idle(self.engine.displayed, snap)
+
+        # Sidebar refresh is throttled separately from the canvas.
+        if self.sidebar_dirty and time.monotonic() - self.sidebar_at >= SIDEBAR_MS/1000.0:
+            self._refresh_table(); self._refresh_dist_list()
+            if self.stats is not None:
+                self.stats.set(format_stats(self.engine.stats()))
 
         self.after(UPDATE_MS, self.tick)
 
     # Drawing
     def draw(self):
-        c = self.canvas; c.delete("all")
+        # Retained mode: canvas items are reused and only moved/restyled.
+        c = self.canvas; rd = self.rd
+        rd.begin()
 
         # ---- Auto zoom: use ANCHORS ONLY so both are always in view ----
         xs, ys = [], []
@@ -240,9 +242,9 @@ class App(tk.Tk):
         if self.tag_s:
             tx, ty = self.tag_s
             txc, tyc = to_xy(tx, ty)
-            c.create_line(0, tyc, W, tyc, fill="#222")
-            c.create_line(txc, 0, txc, H, fill="#222")
-            c.create_oval(txc-10, tyc-10, txc+10, tyc+10, outline="#FFD34D", width=4)
+            rd.draw("hline", "line", (0, tyc, W, tyc), "tag", fill="#222")
+            rd.draw("vline", "line", (txc, 0, txc, H), "tag", fill="#222")
+            rd.draw("tag", "oval", (txc-10, tyc-10, txc+10, tyc+10), "tag", outline="#FFD34D", width=4)
 
         # ---- Anchors + distance labels ----
         label_line_height = 22  # or adjust for your font size
@@ -251,11 +253,12 @@ class App(tk.Tk):
             a = self.anchors[aid]
             axc, ayc = to_xy(a["x"], a["y"])
             # anchor square
-            c.create_rectangle(axc-7, ayc-7, axc+7, ayc+7, outline="#45E0FF", width=3)
+            rd.draw(("anchor", aid), "rectangle", (axc-7, ayc-7, axc+7, ayc+7), "anchors",
+                    outline="#45E0FF", width=3)
 
             # optional line to tag (keep or remove)
             if txc is not None:
-                c.create_line(axc, ayc, txc, tyc, fill="#5c5c5c")
+                rd.draw(("link", aid), "line", (axc, ayc, txc, tyc), "anchors", fill="#5c5c5c")
 
             if not isinstance(a["r"], (int,float)):
                 continue
@@ -272,11 +275,13 @@ class App(tk.Tk):
 
             # If it would clip off the right edge, draw to the LEFT instead
             if x_right > W - 6:
-                c.create_text(axc - offset, ayc + total_offset, text=label,
-                              fill="#FFFFFF", anchor="e", font=self.label_font)
+                rd.draw(("label", aid), "text", (axc - offset, ayc + total_offset), "labels",
+                        text=label, fill="#FFFFFF", anchor="e", font=self.label_font)
             else:
-                c.create_text(axc + offset, ayc + total_offset, text=label,
-                              fill="#FFFFFF", anchor="w", font=self.label_font)
+                rd.draw(("label", aid), "text", (axc + offset, ayc + total_offset), "labels",
+                        text=label, fill="#FFFFFF", anchor="w", font=self.label_font)
+
+        rd.end()
 
 if __name__ == "__main__":
     App().mainloop()